@@ -0,0 +1,6 @@
+# код/benchmarks/__init__.py
+"""
+Бенчмарки бота. Запускаются из корня репозитория как модули, например:
+    python -m benchmarks.card_flow --users 50 --telegram-latency-ms 30 --llm-latency-ms 300
+Внешние сервисы (Bot API, YandexGPT) подменяются локальными заглушками из этого пакета.
+"""
@@ -0,0 +1,210 @@
+# код/benchmarks/card_flow.py
+"""
+Бенчмарк сценария «Карта дня» целиком: N синтетических пользователей параллельно проходят
+/start → «✨ Карта дня» → ресурс → запрос → три вопроса ИИ → финальный ресурс → отзыв
+через настоящий Dispatcher из main.setup_dispatcher (SQLite-бэкенд db.py), фейковый Bot API
+и заглушку YandexGPT. С --storage memory база — database/memory_db.py: задержки показывают
+стоимость обработчиков без диска.
+
+Запуск:
+    python -m benchmarks.card_flow --users 50 --telegram-latency-ms 30 --llm-latency-ms 300
+
+Отчет: p50/p95/p99 задержки обработки апдейта (в целом и по шагам), апдейтов в секунду,
+SQL-запросов на апдейт, память на одну одновременную сессию (tracemalloc; при --no-memory
+не измеряется и не искажает задержки).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+from benchmarks.fake_llm import FakeYandexGPT
+from benchmarks.fake_telegram import FakeTelegram
+from benchmarks.harness import QueryCounter, UpdateFactory, prepare_environment, summarize, timestamp
+
+FIRST_USER_ID = 10_000_000
+
+
+class FlowError(Exception):
+    """Бот не прислал ожидаемую кнопку — сценарий пошел не так."""
+
+
+class CardFlowBenchmark:
+    def __init__(self, dp, bot, telegram, updates):
+        self.dp = dp
+        self.bot = bot
+        self.telegram = telegram
+        self.updates = updates
+        self.latencies = []
+        self.step_latencies = defaultdict(list)
+        self.failures = []
+
+    async def _feed(self, step, payload):
+        from aiogram.types import Update
+        update = Update.model_validate(payload, context={"bot": self.bot})
+        started = time.perf_counter()
+        await self.dp.feed_update(self.bot, update)
+        elapsed = time.perf_counter() - started
+        self.latencies.append(elapsed)
+        self.step_latencies[step].append(elapsed)
+
+    async def _message(self, step, user_id, text):
+        await self._feed(step, self.updates.message(user_id, text))
+
+    async def _callback(self, step, user_id, prefix):
+        data = self.telegram.pick_callback(user_id, prefix)
+        if data is None:
+            raise FlowError(f"no '{prefix}*' button before step '{step}'")
+        await self._feed(step, self.updates.callback(user_id, data))
+
+    async def run_session(self, user_id):
+        """Полный сценарий одного пользователя; апдейты идут последовательно, как от живого человека."""
+        try:
+            await self._message("start", user_id, "/start")
+            await self._message("card_request", user_id, "✨ Карта дня")
+            await self._callback("initial_resource", user_id, "resource_good")
+            await self._callback("request_type", user_id, "request_type_typed")
+            await self._message("request_text", user_id, "Как мне найти больше энергии для важных дел?")
+            await self._message("initial_response", user_id, "Вижу дорогу через лес и свет впереди, хочется идти дальше")
+            await self._callback("exploration_choice", user_id, "explore_yes")
+            await self._message("grok_response_1", user_id, "Чувствую спокойствие и немного тревоги перед дорогой")
+            await self._message("grok_response_2", user_id, "Тревога про то, что не хватит сил дойти до конца")
+            await self._message("grok_response_3", user_id, "Поддержка близких и отдых помогают мне восстанавливаться")
+            await self._callback("final_resource", user_id, "resource_good")
+            await self._callback("feedback", user_id, "feedback_v2_helped")
+        except FlowError as e:
+            self.failures.append((user_id, str(e)))
+
+
+async def run(users, telegram_latency, llm_latency, measure_memory, log_level="WARNING", storage="sqlite"):
+    telegram = FakeTelegram(latency=telegram_latency)
+    llm = FakeYandexGPT(latency=llm_latency)
+    telegram_url = await telegram.start()
+    llm_url = await llm.start()
+    db_path = prepare_environment(llm_url=llm_url)
+
+    # Импорты проекта — только после настройки окружения
+    from aiogram import Bot
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.enums import ParseMode
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    from config import TIMEZONE
+    from database.async_db import AsyncDatabase
+    from database.memory_db import MemoryDatabase
+    from db import Database as SQLiteDatabase
+    import main as bot_main
+
+    # main.py настраивает логирование при импорте — понижаем шум уже после него
+    logging.getLogger().setLevel(log_level)
+    if storage == "memory":
+        sync_db, queries = MemoryDatabase(), None
+    else:
+        sync_db = SQLiteDatabase(path=db_path)
+        queries = QueryCounter().attach(sync_db)
+    db = AsyncDatabase(sync_db)
+    bot = Bot(
+        token="42:BENCHMARK",
+        session=AiohttpSession(api=TelegramAPIServer.from_base(telegram_url)),
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    )
+    db.bot = bot
+    dp = bot_main.setup_dispatcher(db, bot, AsyncIOScheduler(timezone=TIMEZONE))
+    benchmark = CardFlowBenchmark(dp, bot, telegram, UpdateFactory())
+
+    if measure_memory:
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    if queries is not None:
+        queries.count = 0
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(benchmark.run_session(FIRST_USER_ID + i) for i in range(users)))
+    finally:
+        wall = time.perf_counter() - started
+        peak = None
+        if measure_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        await bot.session.close()
+        await db.close()
+        await telegram.stop()
+        await llm.stop()
+
+    total_updates = len(benchmark.latencies)
+    return {
+        "benchmark": "card_flow",
+        "timestamp": timestamp(),
+        "storage": storage,
+        "users": users,
+        "telegram_latency_ms": telegram_latency * 1000,
+        "llm_latency_ms": llm_latency * 1000,
+        "updates": total_updates,
+        "failed_sessions": len(benchmark.failures),
+        "failures": benchmark.failures[:10],
+        "wall_s": round(wall, 3),
+        "updates_per_s": round(total_updates / wall, 2) if wall else 0.0,
+        "latency": summarize(benchmark.latencies),
+        "latency_by_step": {step: summarize(values) for step, values in benchmark.step_latencies.items()},
+        "db_queries": queries.count if queries is not None else None,
+        "db_queries_per_update": round(queries.count / total_updates, 2) if queries is not None and total_updates else None,
+        "memory_per_session_kb": round((peak - baseline) / users / 1024, 1) if peak is not None and users else None,
+        "telegram_calls": dict(telegram.calls),
+        "llm_calls": llm.calls,
+    }
+
+
+def print_report(report):
+    latency = report["latency"]
+    print(f"card_flow ({report['storage']}): {report['users']} users, {report['updates']} updates in {report['wall_s']} s "
+          f"({report['updates_per_s']} updates/s), failed sessions: {report['failed_sessions']}")
+    print(f"  latency  p50 {latency['p50_ms']} ms  p95 {latency['p95_ms']} ms  p99 {latency['p99_ms']} ms  max {latency['max_ms']} ms")
+    if report["db_queries"] is not None:
+        print(f"  db queries per update: {report['db_queries_per_update']} ({report['db_queries']} total)")
+    if report["memory_per_session_kb"] is not None:
+        print(f"  memory per concurrent session: {report['memory_per_session_kb']} KiB")
+    print("  by step:")
+    for step, stats in report["latency_by_step"].items():
+        print(f"    {step:<20} p50 {stats['p50_ms']:>9} ms  p95 {stats['p95_ms']:>9} ms  p99 {stats['p99_ms']:>9} ms")
+    for user_id, reason in report["failures"]:
+        print(f"  failed user {user_id}: {reason}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Card-of-the-day flow benchmark")
+    parser.add_argument("--users", type=int, default=20, help="число одновременных пользователей")
+    parser.add_argument("--telegram-latency-ms", type=float, default=0.0, help="задержка фейкового Bot API")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="задержка заглушки YandexGPT")
+    parser.add_argument("--no-memory", action="store_true", help="не включать tracemalloc")
+    parser.add_argument("--storage", choices=("sqlite", "memory"), default="sqlite",
+                        help="хранилище: SQLite-файл или in-memory (без стоимости диска)")
+    parser.add_argument("--json", help="записать отчет в JSON-файл")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args(argv)
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run(
+        users=args.users,
+        telegram_latency=args.telegram_latency_ms / 1000,
+        llm_latency=args.llm_latency_ms / 1000,
+        measure_memory=not args.no_memory,
+        log_level=args.log_level.upper(),
+        storage=args.storage,
+    ))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if report["failed_sessions"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
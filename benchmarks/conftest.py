@@ -0,0 +1,172 @@
+# код/benchmarks/conftest.py
+"""
+Фикстуры микробенчмарков БД: по одной заполненной базе на пару (бэкенд, размер).
+Размеры и бэкенды задаются переменными BENCH_DB_SIZES="1000,10000,100000" и
+BENCH_DB_BACKENDS="sqlite,postgres" (еще есть "memory" — database/memory_db.py, база
+без диска для сравнения). PostgreSQL берется из BENCH_PG_DSN, иначе поднимается временный
+локальный сервер (benchmarks/local_postgres.py); если его нет — тесты PostgreSQL пропускаются.
+"""
+import os
+import random
+import subprocess
+from datetime import datetime, timedelta
+
+import pytest
+
+from benchmarks.local_postgres import LocalPostgres, find_pg_bin
+
+SIZES = [int(size) for size in os.getenv("BENCH_DB_SIZES", "1000,10000,100000").split(",")]
+BACKENDS = os.getenv("BENCH_DB_BACKENDS", "sqlite,postgres").split(",")
+ACTIONS_PER_USER = 5
+CARDS_PER_USER = 3
+CHUNK = 10_000
+
+
+def _seed_rows(size, seed=1):
+    """Одинаковые данные для обоих бэкендов: пользователи, действия за последние 30 дней и карты."""
+    rng = random.Random(seed)
+    now = datetime.now()
+    users, actions, cards = [], [], []
+    for user_id in range(1, size + 1):
+        morning = f"{rng.randint(6, 11):02d}:{rng.randint(0, 59):02d}" if rng.random() < 0.7 else None
+        evening = f"{rng.randint(19, 23):02d}:{rng.randint(0, 59):02d}" if rng.random() < 0.5 else None
+        users.append((user_id, f"Имя{user_id}", f"user{user_id}", morning, evening, rng.random() < 0.1))
+        for _ in range(ACTIONS_PER_USER):
+            ts = now - timedelta(seconds=rng.randint(0, 30 * 86400))
+            card = rng.randint(1, 40)
+            actions.append((user_id, "card_drawn", f'{{"card_number":{card}}}', ts, card))
+        for _ in range(CARDS_PER_USER):
+            cards.append((user_id, rng.randint(1, 40)))
+    return users, actions, cards
+
+
+def _chunks(rows):
+    for start in range(0, len(rows), CHUNK):
+        yield rows[start:start + CHUNK]
+
+
+def _insert_seed_rows(conn, users, actions, cards):
+    from db import utc_timestamp
+
+    for chunk in _chunks(users):
+        conn.executemany(
+            "INSERT INTO users (user_id, name, username, reminder_time, reminder_time_evening, bonus_available) "
+            "VALUES (?, ?, ?, ?, ?, ?)", chunk)
+    for chunk in _chunks(actions):
+        conn.executemany(
+            "INSERT INTO actions (user_id, action, details, timestamp, card_number) VALUES (?, ?, ?, ?, ?)",
+            [(user_id, action, details, utc_timestamp(ts), card) for user_id, action, details, ts, card in chunk])
+    for chunk in _chunks(cards):
+        conn.executemany("INSERT INTO user_cards (user_id, card_number) VALUES (?, ?)", chunk)
+    conn.executemany("INSERT INTO user_profiles (user_id) VALUES (?)", [(row[0],) for row in users])
+
+
+def seed_sqlite(db, size):
+    # Все записи идут через поток-писатель Database, как и в боте
+    db.writer.run(_insert_seed_rows, *_seed_rows(size))
+
+
+def seed_memory(db, size):
+    """Те же данные через методы MemoryDatabase (транзакций и диска нет, вставка и так дешевая)."""
+    users, actions, cards = _seed_rows(size)
+    for user_id, name, username, morning, evening, bonus in users:
+        db.update_user(user_id, {"name": name, "username": username, "reminder_time": morning,
+                                 "reminder_time_evening": evening, "bonus_available": bonus})
+    for user_id, action, details, ts, card in actions:
+        db.save_action(user_id, None, None, action, {"card_number": card}, ts)
+    for user_id, card_number in cards:
+        db.add_user_card(user_id, card_number)
+    for user in users:
+        db.update_user_profile(user[0], {})
+
+
+def _pg_columns(db, schema, table):
+    rows = db.execute_query(
+        "SELECT column_name FROM information_schema.columns WHERE table_schema = %s AND table_name = %s;",
+        (schema, table), fetch="all") or []
+    return {row["column_name"] for row in rows}
+
+
+def seed_postgres(db, size):
+    """Заполняет те колонки и таблицы, которые есть в текущей схеме database/db.py."""
+    from psycopg2.extras import execute_values
+
+    users, actions, cards = _seed_rows(size)
+    user_columns = _pg_columns(db, "core", "users")
+    wanted = [("user_id", 0), ("full_name", 1), ("username", 2), ("reminder_time", 3),
+              ("reminder_time_evening", 4), ("bonus_available", 5)]
+    present = [(column, index) for column, index in wanted if column in user_columns]
+    conn = db.conn
+    with conn.cursor() as cur:
+        for chunk in _chunks(users):
+            execute_values(cur, f"INSERT INTO core.users ({', '.join(c for c, _ in present)}) VALUES %s",
+                           [tuple(row[i] for _, i in present) for row in chunk])
+        for chunk in _chunks(actions):
+            execute_values(cur, "INSERT INTO core.actions (user_id, action_type, details, created_at) VALUES %s",
+                           [(user_id, action, details, ts) for user_id, action, details, ts, _ in chunk])
+        if _pg_columns(db, "programs", "used_cards"):
+            for chunk in _chunks(cards):
+                execute_values(cur, "INSERT INTO programs.used_cards (user_id, card_number) VALUES %s "
+                               "ON CONFLICT DO NOTHING", chunk)
+        cur.execute("ANALYZE;")
+    conn.commit()
+
+
+@pytest.fixture(scope="session")
+def pg_dsn():
+    """DSN тестового PostgreSQL: BENCH_PG_DSN или временный локальный сервер."""
+    pytest.importorskip("psycopg2")
+    dsn = os.getenv("BENCH_PG_DSN")
+    if dsn:
+        yield dsn
+        return
+    if not find_pg_bin():
+        pytest.skip("PostgreSQL is not installed and BENCH_PG_DSN is not set")
+    server = LocalPostgres()
+    try:
+        dsn = server.start()
+    except (RuntimeError, OSError, subprocess.CalledProcessError) as e:
+        server.stop()
+        pytest.skip(f"could not start local PostgreSQL: {e}")
+    yield dsn
+    server.stop()
+
+
+def _reset_postgres(dsn):
+    """Каждый размер начинается с пустых схем: Database создает таблицы заново."""
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute("DROP SCHEMA IF EXISTS core, programs, marketplace CASCADE;")
+            # Иначе миграции сочтут схему актуальной и не создадут таблицы
+            cur.execute("DROP TABLE IF EXISTS public.schema_version;")
+    finally:
+        conn.close()
+
+
+@pytest.fixture(scope="module", params=[(b, n) for b in BACKENDS for n in SIZES], ids=lambda p: f"{p[0]}-{p[1]}")
+def bench_db(request, tmp_path_factory):
+    """Заполненная база; .bench_backend и .bench_size попадают в extra_info результатов."""
+    backend, size = request.param
+    if backend == "sqlite":
+        from db import Database as SQLiteDatabase
+
+        db = SQLiteDatabase(path=str(tmp_path_factory.mktemp("sqlite") / "bench.db"))
+        seed_sqlite(db, size)
+    elif backend == "memory":
+        from database.memory_db import MemoryDatabase
+
+        db = MemoryDatabase()
+        seed_memory(db, size)
+    else:
+        dsn = request.getfixturevalue("pg_dsn")
+        from database.db import Database as PostgresDatabase
+
+        _reset_postgres(dsn)
+        db = PostgresDatabase(dsn=dsn)
+        seed_postgres(db, size)
+    db.bench_backend, db.bench_size = backend, size
+    yield db
+    db.close()
@@ -0,0 +1,50 @@
+# код/benchmarks/fake_llm.py
+"""
+Заглушка YandexGPT completion API для бенчмарков: отвечает с заданной задержкой
+валидной структурой result.alternatives[0].message.text. Тексты не повторяются,
+чтобы ai_service не отбраковывал «повторный вопрос».
+"""
+import asyncio
+import itertools
+
+from aiohttp import web
+
+
+class FakeYandexGPT:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self._counter = itertools.count(1)
+        self._runner = None
+        self.url = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Запускает сервер и возвращает адрес для YANDEX_GPT_URL."""
+        app = web.Application()
+        app.router.add_post("/{tail:.*}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://{host}:{port}/foundationModels/v1/completion"
+        return self.url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def _handle(self, request):
+        await request.read()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.calls += 1
+        n = next(self._counter)
+        text = f"Что ты чувствуешь, когда смотришь на эту часть карты? (вариант {n})"
+        return web.json_response({
+            "result": {
+                "alternatives": [{"message": {"role": "assistant", "text": text}, "status": "ALTERNATIVE_STATUS_FINAL"}],
+                "usage": {"inputTextTokens": "100", "completionTokens": "20", "totalTokens": "120"},
+                "modelVersion": "bench",
+            }
+        })
@@ -0,0 +1,168 @@
+# код/benchmarks/fake_telegram.py
+"""
+Локальный фейковый Bot API для бенчмарков: принимает запросы aiogram
+(POST /bot<token>/<method>), отвечает правдоподобными объектами с заданной задержкой
+и запоминает, что бот отправил каждому чату.
+"""
+import asyncio
+import itertools
+import json
+import math
+import time
+from collections import Counter, defaultdict, deque
+
+from aiohttp import web
+
+# Методы, которые возвращают отправленное/измененное сообщение
+MESSAGE_METHODS = {
+    "sendMessage", "sendPhoto", "sendPoll", "sendDocument", "sendAnimation",
+    "editMessageText", "editMessageReplyMarkup", "editMessageCaption",
+}
+
+
+class FakeTelegram:
+    """
+    latency — задержка ответа на каждый запрос (секунды).
+    global_rate / chat_interval — лимиты Telegram на отправку: не больше global_rate сообщений
+    в секунду на бота и не чаще одного сообщения в chat_interval секунд в один чат;
+    сверх лимита — 429 с retry_after, как у настоящего Bot API. None — без лимита.
+    В .calls считается число вызовов каждого метода, в .rate_limited — отказы 429,
+    в .inline_keyboards хранится последняя inline-клавиатура, отправленная в чат
+    (для выбора следующего callback_data).
+    """
+
+    def __init__(self, latency=0.0, global_rate=None, chat_interval=None):
+        self.latency = latency
+        self.global_rate = global_rate
+        self.chat_interval = chat_interval
+        self.calls = Counter()
+        self.rate_limited = 0
+        self._recent_sends = deque()
+        self._last_chat_send = {}
+        self.sent = defaultdict(list)  # chat_id -> [(method, text)]
+        self.inline_keyboards = {}  # chat_id -> [[callback_data, ...], ...]
+        self._message_ids = itertools.count(1000)
+        self._runner = None
+        self.base_url = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Запускает сервер и возвращает базовый адрес для TelegramAPIServer.from_base."""
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def reset_limits(self):
+        """Сбрасывает окна лимитов — например, между тиками, которые в реальности разделены минутой."""
+        self._recent_sends.clear()
+        self._last_chat_send.clear()
+
+    def pick_callback(self, chat_id, prefix):
+        """Возвращает callback_data первой кнопки с данным префиксом из последней inline-клавиатуры чата."""
+        for row in self.inline_keyboards.get(chat_id, []):
+            for data in row:
+                if data and data.startswith(prefix):
+                    return data
+        return None
+
+    async def _handle(self, request):
+        method = request.match_info["method"]
+        params = await self._read_params(request)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.calls[method] += 1
+        if method in MESSAGE_METHODS and method.startswith("send"):
+            retry_after = self._check_rate_limit(_to_int(params.get("chat_id")))
+            if retry_after:
+                self.rate_limited += 1
+                return web.json_response({
+                    "ok": False, "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                }, status=429)
+        result = self._result(method, params)
+        return web.json_response({"ok": True, "result": result})
+
+    def _check_rate_limit(self, chat_id):
+        """Возвращает retry_after в секундах, если отправка превышает лимит, иначе 0 (и учитывает отправку)."""
+        now = time.monotonic()
+        if self.chat_interval and chat_id is not None:
+            last = self._last_chat_send.get(chat_id)
+            if last is not None and now - last < self.chat_interval:
+                return max(1, math.ceil(self.chat_interval - (now - last)))
+        if self.global_rate:
+            while self._recent_sends and now - self._recent_sends[0] >= 1.0:
+                self._recent_sends.popleft()
+            if len(self._recent_sends) >= self.global_rate:
+                return 1
+            self._recent_sends.append(now)
+        if chat_id is not None:
+            self._last_chat_send[chat_id] = now
+        return 0
+
+    @staticmethod
+    async def _read_params(request):
+        """aiogram шлет multipart/form-data, где сложные поля — JSON-строки; файлы пропускаем."""
+        if request.content_type == "application/json":
+            return await request.json()
+        form = await request.post()
+        params = {}
+        for key, value in form.items():
+            if isinstance(value, str):
+                params[key] = value
+        return params
+
+    def _result(self, method, params):
+        chat_id = _to_int(params.get("chat_id"))
+        if method in MESSAGE_METHODS:
+            if chat_id is not None:
+                self.sent[chat_id].append((method, params.get("text") or params.get("caption") or params.get("question")))
+                self._remember_keyboard(chat_id, params.get("reply_markup"))
+            return self._message(chat_id, params, method)
+        if method == "getMe":
+            return {"id": 42, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if method == "getChat":
+            return {"id": chat_id, "type": "private", "accent_color_id": 0, "max_reaction_count": 11}
+        # sendChatAction, answerCallbackQuery, setMyCommands, deleteWebhook, ...
+        return True
+
+    def _remember_keyboard(self, chat_id, raw_markup):
+        if not raw_markup:
+            return
+        try:
+            markup = json.loads(raw_markup) if isinstance(raw_markup, str) else raw_markup
+        except ValueError:
+            return
+        if "inline_keyboard" in markup:
+            self.inline_keyboards[chat_id] = [
+                [button.get("callback_data") for button in row] for row in markup["inline_keyboard"]
+            ]
+
+    def _message(self, chat_id, params, method):
+        message = {
+            "message_id": _to_int(params.get("message_id")) or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id or 0, "type": "private"},
+            "from": {"id": 42, "is_bot": True, "first_name": "Bench"},
+        }
+        if method == "sendPhoto":
+            message["photo"] = [{"file_id": "photo", "file_unique_id": "photo", "width": 1, "height": 1}]
+        elif params.get("text"):
+            message["text"] = params["text"]
+        return message
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
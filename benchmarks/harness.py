@@ -0,0 +1,130 @@
+# код/benchmarks/harness.py
+"""
+Общие части бенчмарков: подготовка окружения, счетчик SQL-запросов,
+построение синтетических апдейтов и сводная статистика.
+Модули проекта импортируются только после prepare_environment(), потому что
+config.py читает переменные окружения при импорте.
+"""
+import itertools
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+# Заглушка JPEG (маркеры начала и конца): фейковый Telegram содержимое не разбирает
+TINY_JPEG = b"\xff\xd8\xff\xd9"
+
+
+def prepare_environment(llm_url=None, cards=40):
+    """
+    Создает рабочий каталог с картами и SQLite-базой, переходит в него и выставляет
+    переменные окружения для config.py. Возвращает путь к файлу базы.
+    """
+    workdir = tempfile.mkdtemp(prefix="cardbot-bench-")
+    cards_dir = os.path.join(workdir, "cards")
+    os.makedirs(cards_dir)
+    for number in range(1, cards + 1):
+        with open(os.path.join(cards_dir, f"card_{number}.jpg"), "wb") as f:
+            f.write(TINY_JPEG)
+    # card_of_the_day ищет карты в относительной папке "cards"
+    os.chdir(workdir)
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "42:BENCHMARK")
+    os.environ.setdefault("YANDEX_API_KEY", "bench")
+    os.environ.setdefault("YANDEX_FOLDER_ID", "bench")
+    if llm_url:
+        os.environ["YANDEX_GPT_URL"] = llm_url
+    return os.path.join(workdir, "bench.db")
+
+
+class QueryCounter:
+    """Считает SQL-операторы всех соединений SQLite-базы (пишущего и read-only соединений потоков)."""
+
+    COUNTED = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _trace(self, statement):
+        if statement.lstrip()[:7].upper().startswith(self.COUNTED):
+            with self._lock:
+                self.count += 1
+
+    def attach(self, sqlite_db):
+        """Подключается к db.Database: к основному соединению и ко всем будущим read-only соединениям."""
+        sqlite_db.conn.set_trace_callback(self._trace)
+        open_read_connection = sqlite_db._open_read_connection
+
+        def traced_open(path):
+            conn = open_read_connection(path)
+            conn.set_trace_callback(self._trace)
+            return conn
+
+        sqlite_db._open_read_connection = traced_open
+        return self
+
+
+class UpdateFactory:
+    """Строит JSON апдейтов Telegram для feed_update."""
+
+    def __init__(self):
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    @staticmethod
+    def _user(user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+    def message(self, user_id, text):
+        return {
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": self._user(user_id),
+                "text": text,
+            },
+        }
+
+    def callback(self, user_id, data):
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._message_ids)),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": {"id": 42, "is_bot": True, "first_name": "Bench"},
+                    "text": "...",
+                },
+            },
+        }
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def summarize(latencies):
+    """p50/p95/p99/max в миллисекундах по списку длительностей в секундах."""
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+    }
+
+
+def timestamp():
+    return datetime.now().isoformat(timespec="seconds")
@@ -0,0 +1,67 @@
+# код/benchmarks/local_postgres.py
+"""
+Временный локальный экземпляр PostgreSQL для бенчмарков: initdb во временный каталог,
+pg_ctl start на свободном порту с сокетом там же, остановка и удаление при выходе.
+Нужны бинарники PostgreSQL (initdb, pg_ctl) в PATH или в /usr/lib/postgresql/<версия>/bin.
+"""
+import glob
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+
+
+def find_pg_bin():
+    """Каталог с initdb/pg_ctl или None, если PostgreSQL не установлен."""
+    initdb = shutil.which("initdb")
+    if initdb:
+        return os.path.dirname(initdb)
+    candidates = sorted(glob.glob("/usr/lib/postgresql/*/bin/initdb"))
+    return os.path.dirname(candidates[-1]) if candidates else None
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalPostgres:
+    """Контекстный менеджер: with LocalPostgres() as dsn: ..."""
+
+    def __init__(self, bin_dir=None):
+        self.bin_dir = bin_dir or find_pg_bin()
+        self.workdir = None
+        self.dsn = None
+
+    def _run(self, tool, *args):
+        subprocess.run([os.path.join(self.bin_dir, tool), *args], check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def start(self):
+        if not self.bin_dir:
+            raise RuntimeError("PostgreSQL binaries (initdb, pg_ctl) not found")
+        self.workdir = tempfile.mkdtemp(prefix="cardbot-pg-")
+        data_dir = os.path.join(self.workdir, "data")
+        port = _free_port()
+        self._run("initdb", "-D", data_dir, "-A", "trust", "-U", "bench", "--no-sync")
+        # fsync выключен: меряем запросы бота, а не диск; сервер одноразовый
+        options = f"-p {port} -k {self.workdir} -c listen_addresses='' -c fsync=off"
+        self._run("pg_ctl", "-D", data_dir, "-o", options, "-w", "-l", os.path.join(self.workdir, "pg.log"), "start")
+        self.dsn = f"host={self.workdir} port={port} user=bench dbname=postgres"
+        return self.dsn
+
+    def stop(self):
+        if self.workdir:
+            try:
+                self._run("pg_ctl", "-D", os.path.join(self.workdir, "data"), "-m", "fast", "-w", "stop")
+            finally:
+                shutil.rmtree(self.workdir, ignore_errors=True)
+                self.workdir = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
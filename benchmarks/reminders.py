@@ -0,0 +1,240 @@
+# код/benchmarks/reminders.py
+"""
+Нагрузочный бенчмарк напоминаний и рассылки.
+Засевает SQLite-базу синтетическими пользователями (10k–1M) с reminder_time /
+reminder_time_evening, распределенными по дню с пиками на круглых минутах, и гоняет
+NotificationService.send_due_reminders (один тик check_reminders) и deliver_broadcast
+против фейкового Bot API с лимитами Telegram (30 сообщений/с на бота, 1 сообщение/с в чат).
+
+Запуск:
+    python -m benchmarks.reminders --users 100000 --start 08:00 --minutes 30 --telegram-latency-ms 30
+
+Тики идут по виртуальным часам так же, как в check_reminders: следующий тик начинается
+через длительность тика + 60 с. Если тик дольше минуты, часть минут (HH:MM) не проверяется
+ни разу, и у их пользователей напоминание теряется — это и есть «пропущенные минуты».
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import resource
+import sys
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.fake_telegram import FakeTelegram
+from benchmarks.harness import QueryCounter, prepare_environment, summarize, timestamp
+
+FIRST_USER_ID = 20_000_000
+SEED_CHUNK = 50_000
+
+
+def _reminder_time(rng, first_hour, last_hour):
+    """Время HH:MM в диапазоне часов; треть пользователей выбирает круглые :00/:30, как живые люди."""
+    hour = rng.randint(first_hour, last_hour)
+    minute = rng.choice((0, 30)) if rng.random() < 0.3 else rng.randint(0, 59)
+    return f"{hour:02d}:{minute:02d}"
+
+
+def _insert_users(conn, rows):
+    conn.executemany(
+        "INSERT OR REPLACE INTO users (user_id, name, username, last_request, reminder_time, "
+        "reminder_time_evening, bonus_available) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+
+
+def seed_users(sqlite_db, count, today, seed=1):
+    """
+    Вставляет count пользователей пачками через поток-писатель, одной записью на пачку.
+    ~70% с утренним напоминанием (06–11 ч), ~50% с вечерним (19–23 ч), ~20% уже тянули карту сегодня.
+    """
+    rng = random.Random(seed)
+    today_request = datetime.combine(today, datetime.min.time()).replace(hour=7).isoformat()
+    for chunk_start in range(0, count, SEED_CHUNK):
+        rows = []
+        for i in range(chunk_start, min(count, chunk_start + SEED_CHUNK)):
+            rows.append((
+                FIRST_USER_ID + i,
+                f"Имя{i}" if rng.random() < 0.8 else "",
+                f"user{i}",
+                today_request if rng.random() < 0.2 else None,
+                _reminder_time(rng, 6, 11) if rng.random() < 0.7 else None,
+                _reminder_time(rng, 19, 23) if rng.random() < 0.5 else None,
+                rng.random() < 0.1,
+            ))
+        sqlite_db.writer.run(_insert_users, rows)
+
+
+def _timed(func, durations):
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            durations.append(time.perf_counter() - started)
+    return wrapper
+
+
+async def run_reminder_ticks(service, telegram, queries, start, minutes):
+    """Прогоняет тики по виртуальным часам в окне [start, start + minutes)."""
+    ticks = []
+    checked = set()
+    elapsed = 0.0
+    while elapsed < minutes * 60:
+        minute = int(elapsed // 60)
+        checked.add(minute)
+        # Между тиками в check_reminders проходит минута — окна лимитов Telegram успевают сброситься
+        telegram.reset_limits()
+        queries_before = queries.count
+        started = time.perf_counter()
+        stats = await service.send_due_reminders(start + timedelta(minutes=minute))
+        duration = time.perf_counter() - started
+        ticks.append({
+            "minute": (start + timedelta(minutes=minute)).strftime("%H:%M"),
+            "duration_s": round(duration, 4),
+            "db_queries": queries.count - queries_before,
+            **stats,
+        })
+        elapsed += duration + 60
+    return ticks, minutes - len(checked)
+
+
+async def run(users, start_time, minutes, telegram_latency, global_rate, chat_interval,
+              broadcast_recipients, log_level="CRITICAL"):
+    telegram = FakeTelegram(latency=telegram_latency, global_rate=global_rate, chat_interval=chat_interval)
+    telegram_url = await telegram.start()
+    db_path = prepare_environment()
+
+    # Импорты проекта — только после настройки окружения
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from config import TIMEZONE
+    from database.async_db import AsyncDatabase
+    from db import Database as SQLiteDatabase
+    from modules.notification_service import NotificationService
+
+    # Неудачные отправки логируются на каждого пользователя — при лимитах это тысячи строк
+    logging.getLogger().setLevel(log_level)
+    hour, minute = map(int, start_time.split(":"))
+    start = datetime.now(TIMEZONE).replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+    sqlite_db = SQLiteDatabase(path=db_path)
+    seed_started = time.perf_counter()
+    seed_users(sqlite_db, users, start.date())
+    seed_duration = time.perf_counter() - seed_started
+
+    reminder_query_durations = []
+    sqlite_db.get_reminder_times = _timed(sqlite_db.get_reminder_times, reminder_query_durations)
+    queries = QueryCounter().attach(sqlite_db)
+    db = AsyncDatabase(sqlite_db)
+    bot = Bot(token="42:BENCHMARK", session=AiohttpSession(api=TelegramAPIServer.from_base(telegram_url)))
+    service = NotificationService(bot, db)
+
+    try:
+        ticks, skipped = await run_reminder_ticks(service, telegram, queries, start, minutes)
+        reminder_rate_limited = telegram.rate_limited
+
+        broadcast = None
+        if broadcast_recipients:
+            telegram.reset_limits()
+            recipients = "all" if broadcast_recipients >= users else [FIRST_USER_ID + i for i in range(broadcast_recipients)]
+            queries_before = queries.count
+            started = time.perf_counter()
+            stats = await service.deliver_broadcast({"text": "бенчмарк рассылки", "recipients": recipients}, start)
+            duration = time.perf_counter() - started
+            broadcast = {
+                "recipients": broadcast_recipients if recipients != "all" else users,
+                "duration_s": round(duration, 3),
+                "delivered_per_s": round(stats["sent"] / duration, 2) if duration else 0.0,
+                "db_queries": queries.count - queries_before,
+                "rate_limited": telegram.rate_limited - reminder_rate_limited,
+                **stats,
+            }
+    finally:
+        await bot.session.close()
+        await db.close()
+        await telegram.stop()
+
+    send_time = sum(t["duration_s"] for t in ticks)
+    sent = sum(t["sent"] for t in ticks)
+    return {
+        "benchmark": "reminders",
+        "timestamp": timestamp(),
+        "users": users,
+        "seed_s": round(seed_duration, 2),
+        "window": f"{start_time} +{minutes} min",
+        "telegram_latency_ms": telegram_latency * 1000,
+        "global_rate": global_rate,
+        "chat_interval": chat_interval,
+        "ticks": len(ticks),
+        "minutes_skipped": skipped,
+        "tick_latency": summarize([t["duration_s"] for t in ticks]),
+        "reminder_query": summarize(reminder_query_durations),
+        "due": sum(t["due"] for t in ticks),
+        "sent": sent,
+        "failed": sum(t["failed"] for t in ticks),
+        "rate_limited": reminder_rate_limited,
+        "delivered_per_s": round(sent / send_time, 2) if send_time else 0.0,
+        "db_queries_per_tick": round(sum(t["db_queries"] for t in ticks) / len(ticks), 2) if ticks else 0.0,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "broadcast": broadcast,
+        "tick_details": ticks,
+    }
+
+
+def print_report(report):
+    tick = report["tick_latency"]
+    query = report["reminder_query"]
+    print(f"reminders: {report['users']} users (seeded in {report['seed_s']} s), window {report['window']}, "
+          f"{report['ticks']} ticks, minutes skipped: {report['minutes_skipped']}")
+    print(f"  tick      p50 {tick['p50_ms']} ms  p95 {tick['p95_ms']} ms  max {tick['max_ms']} ms")
+    print(f"  get_reminder_times  p50 {query['p50_ms']} ms  max {query['max_ms']} ms, "
+          f"db queries per tick: {report['db_queries_per_tick']}")
+    print(f"  due {report['due']}, sent {report['sent']}, failed {report['failed']} "
+          f"(429: {report['rate_limited']}), {report['delivered_per_s']} delivered/s")
+    print(f"  max RSS: {report['max_rss_mb']} MiB")
+    broadcast = report["broadcast"]
+    if broadcast:
+        print(f"  broadcast: {broadcast['recipients']} recipients in {broadcast['duration_s']} s, "
+              f"sent {broadcast['sent']}, failed {broadcast['failed']} (429: {broadcast['rate_limited']}), "
+              f"{broadcast['delivered_per_s']} delivered/s, {broadcast['db_queries']} db queries")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Reminder and broadcast benchmark")
+    parser.add_argument("--users", type=int, default=10_000, help="число синтетических пользователей")
+    parser.add_argument("--start", default="08:00", help="начало окна тиков HH:MM")
+    parser.add_argument("--minutes", type=int, default=10, help="длина окна тиков в минутах")
+    parser.add_argument("--telegram-latency-ms", type=float, default=0.0, help="задержка фейкового Bot API")
+    parser.add_argument("--global-rate", type=float, default=30, help="лимит сообщений в секунду на бота (0 — без лимита)")
+    parser.add_argument("--chat-interval", type=float, default=1.0, help="мин. интервал между сообщениями в чат (0 — без лимита)")
+    parser.add_argument("--broadcast-recipients", type=int, default=1000, help="получателей рассылки (0 — пропустить)")
+    parser.add_argument("--json", help="записать отчет в JSON-файл")
+    parser.add_argument("--log-level", default="CRITICAL")
+    return parser.parse_args(argv)
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run(
+        users=args.users,
+        start_time=args.start,
+        minutes=args.minutes,
+        telegram_latency=args.telegram_latency_ms / 1000,
+        global_rate=args.global_rate or None,
+        chat_interval=args.chat_interval or None,
+        broadcast_recipients=args.broadcast_recipients,
+        log_level=args.log_level.upper(),
+    ))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
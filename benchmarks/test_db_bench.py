@@ -0,0 +1,108 @@
+# код/benchmarks/test_db_bench.py
+"""
+Микробенчмарки методов Database для SQLite (db.py) и PostgreSQL (database/db.py)
+на нескольких объемах данных (см. benchmarks/conftest.py); бэкенд memory показывает
+стоимость самих методов без хранилища.
+
+Запуск (нужен pytest-benchmark) с сохранением результатов в JSON:
+    python -m pytest benchmarks/test_db_bench.py --benchmark-json=bench-db.json
+    python -m pytest benchmarks/test_db_bench.py --benchmark-autosave   # в .benchmarks/, для --benchmark-compare
+Методы, которых нет у бэкенда, пропускаются. Методы Database глотают ошибки БД и пишут их в лог,
+поэтому ERROR в логе пробного вызова считается провалом бенчмарка, а не пропуском.
+"""
+import itertools
+import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from config import TIMEZONE  # noqa: E402
+
+
+@pytest.fixture
+def user_ids(bench_db):
+    """Бесконечная последовательность существующих user_id в случайном порядке."""
+    ids = list(range(1, bench_db.bench_size + 1))
+    random.Random(2).shuffle(ids)
+    return itertools.cycle(ids)
+
+
+@pytest.fixture
+def run(bench_db, benchmark, caplog):
+    """
+    Проверяет, что метод есть у бэкенда и пробный вызов не пишет ERROR в лог, и замеряет его.
+    Вызов: run("get_user", lambda: ...).
+    """
+    benchmark.extra_info.update(backend=bench_db.bench_backend, size=bench_db.bench_size)
+
+    def measure(method, func):
+        if not hasattr(bench_db, method):
+            pytest.skip(f"{bench_db.bench_backend} backend has no {method}")
+        with caplog.at_level(logging.ERROR):
+            func()
+        errors = [record.getMessage() for record in caplog.records if record.levelno >= logging.ERROR]
+        if errors:
+            pytest.fail(f"{method} logged errors on the {bench_db.bench_backend} backend: {errors}")
+        return benchmark(func)
+
+    return measure
+
+
+class TestUserBench:
+    """Чтение и запись строки пользователя."""
+
+    def test_get_user(self, bench_db, user_ids, run):
+        """get_user без кэша: каждый вызов идет в БД."""
+        def call():
+            user_id = next(user_ids)
+            bench_db.user_cache.invalidate(user_id)
+            return bench_db.get_user(user_id)
+        run("get_user", call)
+
+    def test_get_user_cached(self, bench_db, run):
+        """get_user из UserCache."""
+        bench_db.get_user(1)
+        run("get_user", lambda: bench_db.get_user(1))
+
+    def test_update_user(self, bench_db, user_ids, run):
+        counter = itertools.count()
+        run("update_user", lambda: bench_db.update_user(next(user_ids), {"username": f"bench{next(counter)}"}))
+
+    def test_update_user_profile(self, bench_db, user_ids, run):
+        run("update_user_profile", lambda: bench_db.update_user_profile(next(user_ids), {"mood": "calm", "response_count": 3}))
+
+
+class TestActionBench:
+    """Журнал действий."""
+
+    def test_save_action(self, bench_db, user_ids, run):
+        run("save_action", lambda: bench_db.save_action(
+            next(user_ids), "bench", "Bench", "card_drawn", {"card_number": 7}, datetime.now(TIMEZONE)))
+
+    def test_save_action_concurrent(self, bench_db, user_ids, run):
+        """400 save_action из 8 потоков, как из пула записи AsyncDatabase (SQLite группирует их в общие коммиты)."""
+        ids = [next(user_ids) for _ in range(400)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            def call():
+                list(pool.map(lambda user_id: bench_db.save_action(
+                    user_id, "bench", "Bench", "card_drawn", {"card_number": 7}, datetime.now(TIMEZONE)), ids))
+            run("save_action", call)
+
+    def test_get_actions(self, bench_db, user_ids, run):
+        """get_actions одного пользователя."""
+        run("get_actions", lambda: bench_db.get_actions(user_id=next(user_ids)))
+
+
+class TestCardsAndRemindersBench:
+    """Карты и выборка для напоминаний."""
+
+    def test_add_user_card(self, bench_db, user_ids, run):
+        run("add_user_card", lambda: bench_db.add_user_card(next(user_ids), random.randint(1, 40)))
+
+    def test_get_reminder_times(self, bench_db, run):
+        """Полная выборка пользователей с напоминаниями (растет с размером базы)."""
+        run("get_reminder_times", bench_db.get_reminder_times)
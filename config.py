@@ -7,13 +7,51 @@ BOT_LINK = "t.me/choose_a_card_bot"
 TIMEZONE = pytz.timezone("Europe/Moscow")
 ADMIN_ID = 6682555021 
 
+# --- Режим получения апдейтов ---
+BOT_RUN_MODE = os.getenv("BOT_RUN_MODE", "polling")  # "polling" или "webhook"
+# Базовый адрес Bot API; переопределяется для локального Bot API сервера или фейкового Telegram в тестах
+TELEGRAM_API_SERVER = os.getenv("TELEGRAM_API_SERVER")
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL")  # публичный адрес балансировщика, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # одинаковый у всех процессов за балансировщиком
+WEBHOOK_LISTEN_HOST = os.getenv("WEBHOOK_LISTEN_HOST", "0.0.0.0")
+WEBHOOK_LISTEN_PORT = int(os.getenv("WEBHOOK_LISTEN_PORT", "8080"))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))  # 1..100, лимит Telegram
+# setWebhook вызывает только один процесс (остальные реплики только принимают апдейты)
+WEBHOOK_SET_ON_START = os.getenv("WEBHOOK_SET_ON_START", "1") == "1"
+# Напоминания и задачи планировщика должны работать ровно в одном процессе
+RUN_BACKGROUND_JOBS = os.getenv("RUN_BACKGROUND_JOBS", "1") == "1"
+# Общее хранилище FSM для нескольких процессов (redis://...); без него — MemoryStorage
+FSM_REDIS_URL = os.getenv("FSM_REDIS_URL")
+# Параллельная обработка апдейтов: общий лимит обработчиков и глубина очереди одного пользователя
+UPDATE_MAX_CONCURRENCY = int(os.getenv("UPDATE_MAX_CONCURRENCY", "64"))
+UPDATE_USER_QUEUE_DEPTH = int(os.getenv("UPDATE_USER_QUEUE_DEPTH", "5"))
+# Метрики (modules/metrics.py): локальный /metrics (0 — выключен) и/или периодическая запись в файл
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_FILE = os.getenv("METRICS_FILE")
+METRICS_FILE_INTERVAL = int(os.getenv("METRICS_FILE_INTERVAL", "60"))  # секунды
+# Логирование (modules/logging_setup.py): формат "json" или "text", прореживание повторов INFO/DEBUG
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_SAMPLE_LIMIT = int(os.getenv("LOG_SAMPLE_LIMIT", "50"))  # записей одного шаблона за окно; 0 — без прореживания
+LOG_SAMPLE_WINDOW = float(os.getenv("LOG_SAMPLE_WINDOW", "60"))  # секунды
+# Профилировщик по команде /profile (modules/profiler.py)
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.01"))  # секунды между сэмплами
+PROFILE_DEFAULT_SECONDS = 30
+PROFILE_MAX_SECONDS = 300
+# Сторож задержки цикла событий (modules/loop_watchdog.py): период «пульса» и порог, после которого снимается стек
+LOOP_WATCHDOG_ENABLED = os.getenv("LOOP_WATCHDOG_ENABLED", "1") == "1"
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))  # секунды
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.25"))  # секунды
+
 # --- Google Sheets ---
 GOOGLE_SHEET_NAME = "MarathonContent"
 
 # --- YandexGPT ---
 YANDEX_API_KEY = os.getenv("YANDEX_API_KEY")
 YANDEX_FOLDER_ID = os.getenv("YANDEX_FOLDER_ID") 
-YANDEX_GPT_URL = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+YANDEX_GPT_URL = os.getenv("YANDEX_GPT_URL", "https://llm.api.cloud.yandex.net/foundationModels/v1/completion")
 
 GROK_API_KEY = os.getenv("GROK_API_KEY")
 GROK_API_URL = "https://api.x.ai/v1/chat/completions"
@@ -29,6 +67,32 @@ DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_NAME = os.getenv("DB_NAME")
 
+# Настройки SQLite (локальный бэкенд db.py)
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000"))  # ~20 МБ страничного кэша на соединение
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_STATEMENT_CACHE = int(os.getenv("SQLITE_STATEMENT_CACHE", "256"))
+# Групповой коммит (SQLiteWriter в db.py): сколько писатель дополнительно ждет попутные записи
+# после первой (0 — берет только накопившиеся за время прошлого коммита) и сколько записей
+# максимум уходит в одну транзакцию
+SQLITE_GROUP_COMMIT_MS = float(os.getenv("SQLITE_GROUP_COMMIT_MS", "0"))
+SQLITE_GROUP_COMMIT_MAX = int(os.getenv("SQLITE_GROUP_COMMIT_MAX", "256"))
+
+# Хранение действий: сырые строки держатся столько месяцев, старше — только дневные агрегаты
+ACTIONS_RETENTION_MONTHS = int(os.getenv("ACTIONS_RETENTION_MONTHS", "6"))
+# Профиль пользователя (build_user_profile) читает сырые действия только за столько дней;
+# счетчики за всю историю берутся из агрегатов (get_action_totals)
+PROFILE_ACTIONS_WINDOW_DAYS = int(os.getenv("PROFILE_ACTIONS_WINDOW_DAYS", "90"))
+
+# Кэш строк пользователей в процессе (0 — отключить)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))  # секунды
+
+# Пулы потоков для блокирующих вызовов БД и файлов/Google Sheets (database/async_db.py)
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "8"))
+DB_WRITE_POOL_SIZE = int(os.getenv("DB_WRITE_POOL_SIZE", "8"))  # потоки только ждут группового коммита; пишет SQLite один поток-писатель
+BLOCKING_IO_POOL_SIZE = int(os.getenv("BLOCKING_IO_POOL_SIZE", "4"))
+
 # Список советов Вселенной (без изменений)
 UNIVERSE_ADVICE = [
     "<b>💌 Ты — источник силы.</b> Всё, что тебе нужно, уже внутри. Просто доверься себе и сделай первый шаг.",
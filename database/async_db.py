@@ -0,0 +1,143 @@
+# код/database/async_db.py
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import DB_READ_POOL_SIZE, DB_WRITE_POOL_SIZE, BLOCKING_IO_POOL_SIZE
+from modules.metrics import DB_CALL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Пул для прочих блокирующих вызовов (файлы, Google Sheets); создается при первом использовании
+_io_pool = None
+_io_pool_lock = threading.Lock()
+
+
+def _get_io_pool():
+    global _io_pool
+    with _io_pool_lock:
+        if _io_pool is None:
+            _io_pool = ThreadPoolExecutor(max_workers=BLOCKING_IO_POOL_SIZE, thread_name_prefix="blocking-io")
+        return _io_pool
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Выполняет блокирующую функцию (os.listdir, gspread и т.п.) в пуле потоков, не останавливая цикл событий."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_io_pool(), functools.partial(func, *args, **kwargs))
+
+
+class AsyncDatabase:
+    """
+    Асинхронный фасад над синхронной Database (db.py или database/db.py).
+    Для каждого публичного метода отдает async-версию, выполняющую его в пуле потоков:
+    чтения — в пуле на DB_READ_POOL_SIZE потоков, записи — в отдельном пуле на DB_WRITE_POOL_SIZE,
+    чтобы медленные записи не занимали потоки, нужные чтениям, и наоборот.
+    Исходный объект доступен как .sync (для миграций, тестов и кода вне цикла событий).
+    """
+
+    READ_METHODS = frozenset({
+        "get_user", "get_user_cards", "count_user_cards", "get_actions", "get_reminder_times",
+        "get_all_users", "is_card_available", "get_referrals", "get_user_profile",
+        "get_last_reflection_date", "count_reflections", "get_all_reflection_texts",
+        "get_last_recharge_method", "check_evening_reflection_exists", "get_action_totals",
+    })
+
+    def __init__(self, db, read_workers=DB_READ_POOL_SIZE, write_workers=DB_WRITE_POOL_SIZE):
+        self.sync = db
+        self.read_pool = ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix="db-read")
+        self.write_pool = ThreadPoolExecutor(max_workers=write_workers, thread_name_prefix="db-write")
+
+    def __getattr__(self, name):
+        attr = getattr(self.sync, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+        pool = self.read_pool if name in self.READ_METHODS else self.write_pool
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            # Время с ожиданием свободного потока пула — то, что видит обработчик
+            with DB_CALL_SECONDS.time(method=name):
+                return await loop.run_in_executor(pool, functools.partial(attr, *args, **kwargs))
+
+        # Кэшируем обертку, чтобы __getattr__ вызывался для метода один раз
+        setattr(self, name, method)
+        return method
+
+    @property
+    def bot(self):
+        return self.sync.bot
+
+    @bot.setter
+    def bot(self, value):
+        self.sync.bot = value
+
+    async def iter_actions(self, *args, batch_size=500, **kwargs):
+        """
+        Асинхронный аналог Database.iter_actions. Генератор целиком выполняется в одном потоке
+        пула чтения (его курсор/соединение привязаны к потоку) и передает действия пачками
+        через ограниченную очередь, так что память не растет с объемом выборки.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=2)
+        stop = threading.Event()
+
+        def put(item):
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        def produce():
+            actions = self.sync.iter_actions(*args, batch_size=batch_size, **kwargs)
+            try:
+                batch = []
+                for action in actions:
+                    batch.append(action)
+                    if len(batch) >= batch_size:
+                        if stop.is_set():
+                            return
+                        put(batch)
+                        batch = []
+                if batch and not stop.is_set():
+                    put(batch)
+            finally:
+                # Закрываем генератор в этом же потоке: он освобождает курсор и транзакцию своего соединения
+                actions.close()
+                if not stop.is_set():
+                    put(None)
+
+        producer = loop.run_in_executor(self.read_pool, produce)
+        try:
+            while True:
+                batch = await queue.get()
+                if batch is None:
+                    break
+                for action in batch:
+                    yield action
+        finally:
+            # Потребитель мог прерваться раньше: освобождаем очередь, чтобы поток-производитель завершился
+            stop.set()
+            while not queue.empty():
+                queue.get_nowait()
+            await producer
+
+    async def warmup(self):
+        """
+        Открывает соединения потоков пула чтения до первых апдейтов, чтобы пользователи не ждали
+        подключения к БД. Задачи отправляются разом, поэтому пул создает потоки до своего предела;
+        если какой-то поток возьмет две задачи, его соседа догрузит первый запрос.
+        """
+        warmup_connection = getattr(self.sync, "warmup_connection", None)
+        if warmup_connection is None:
+            return
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(self.read_pool, warmup_connection) for _ in range(self.read_pool._max_workers)
+        ))
+
+    async def close(self):
+        """Закрывает соединения и останавливает пулы."""
+        await asyncio.get_running_loop().run_in_executor(self.write_pool, self.sync.close)
+        self.read_pool.shutdown(wait=False)
+        self.write_pool.shutdown(wait=False)
@@ -0,0 +1,105 @@
+# код/database/cache.py
+import threading
+import time
+from collections import OrderedDict
+
+
+class UserCache:
+    """
+    Ограниченный LRU-кэш строк пользователей с TTL, общий для процесса.
+    Отдает копии словарей, чтобы изменения вызывающего кода не попадали в кэш.
+    Потокобезопасен: к БД обращаются и из цикла событий, и из пула потоков планировщика.
+
+    Чтение из БД и запись идут в разных потоках, поэтому возможна гонка «прочитали строку →
+    запись закоммитила и сбросила кэш → читатель кладет в кэш старую строку». Чтобы старая строка
+    не жила весь TTL, у каждого ключа есть поколение: invalidate его увеличивает, читатель берет
+    generation(user_id) до запроса к БД и передает в set — если поколение сменилось, set ничего не кладет.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # user_id -> (expires_at, row)
+        self._lock = threading.Lock()
+        # Поколения недавно сброшенных ключей (user_id -> номер сброса), старые в начале. Забытые ключи
+        # получают поколение _forgotten — не меньше любого забытого, так что set по ним только пропускается.
+        self._epoch = 0
+        self._generations = OrderedDict()
+        self._forgotten = 0
+        self._max_generations = max(4 * maxsize, 1024)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, user_id):
+        """Возвращает копию закэшированной строки или None."""
+        if self.maxsize <= 0:
+            return None
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, row = entry
+            if expires_at < time.monotonic():
+                del self._data[user_id]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(user_id)
+            self.hits += 1
+            return dict(row)
+
+    def generation(self, user_id):
+        """Поколение ключа; берется до чтения из БД и передается в set."""
+        with self._lock:
+            return self._generations.get(user_id, self._forgotten)
+
+    def set(self, user_id, row, generation=None):
+        """
+        Кладет копию строки в кэш, вытесняя самые давно использованные записи.
+        Если передан generation и ключ с тех пор сбрасывался, строка устарела и не кладется.
+        """
+        if self.maxsize <= 0 or row is None:
+            return
+        with self._lock:
+            if generation is not None and self._generations.get(user_id, self._forgotten) != generation:
+                return
+            self._data[user_id] = (time.monotonic() + self.ttl, dict(row))
+            self._data.move_to_end(user_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id):
+        """Сбрасывает запись пользователя после записи в БД."""
+        with self._lock:
+            self._data.pop(user_id, None)
+            self._epoch += 1
+            self._generations[user_id] = self._epoch
+            self._generations.move_to_end(user_id)
+            if len(self._generations) > self._max_generations:
+                _, self._forgotten = self._generations.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            # Все поколения сменились: чтения, начатые до clear, в кэш не попадут
+            self._epoch += 1
+            self._generations.clear()
+            self._forgotten = self._epoch
+
+    def stats(self):
+        """Счетчики для мониторинга: попадания, промахи, доля попаданий, размер, вытеснения."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -1,32 +1,102 @@
 # код/database/db.py
 import logging
 import json
-from datetime import datetime
+import uuid
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, date, timezone
 import psycopg2
+import psycopg2.errors
 import psycopg2.extras
-from config import DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME
+from config import DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME, ACTIONS_RETENTION_MONTHS, USER_CACHE_SIZE, USER_CACHE_TTL, TIMEZONE
+from database.cache import UserCache
+from db import _timestamp_bound
+from database.migrations import migrate
+from database.migrations.postgres import MIGRATIONS as POSTGRES_MIGRATIONS
 
 logger = logging.getLogger(__name__)
 
+# Поля пользователя в терминах бота -> столбцы core.users
+USER_COLUMNS = {
+    "name": "full_name", "username": "username", "last_request": "last_request",
+    "reminder_time": "reminder_time", "reminder_time_evening": "reminder_time_evening",
+    "bonus_available": "bonus_available",
+}
+USER_FIELDS = "user_id, full_name AS name, username, last_request, reminder_time, reminder_time_evening, bonus_available"
+PROFILE_COLUMNS = (
+    "mood", "mood_trend", "themes", "response_count", "request_count", "avg_response_length",
+    "days_active", "interactions_per_day", "last_updated", "initial_resource", "final_resource",
+    "recharge_method", "total_cards_drawn", "last_reflection_date", "reflection_count",
+)
+
+# Ключ pg_advisory_lock, которым процессы бота упорядочивают применение миграций
+MIGRATION_LOCK_ID = 7431001
+MIGRATION_LOCK_POLL = 0.5  # секунды
+
+def _next_month(month_start):
+    """Первое число следующего месяца."""
+    return date(month_start.year + month_start.month // 12, month_start.month % 12 + 1, 1)
+
+def _utc_month_start(now=None):
+    """Первое число текущего месяца по UTC; now — aware datetime, по умолчанию сейчас в TIMEZONE."""
+    return (now or datetime.now(TIMEZONE)).astimezone(timezone.utc).date().replace(day=1)
+
+def _previous_month(month_start):
+    """Первое число предыдущего месяца."""
+    if month_start.month == 1:
+        return date(month_start.year - 1, 12, 1)
+    return date(month_start.year, month_start.month - 1, 1)
+
 class Database:
-    def __init__(self):
-        """Инициализация соединения с PostgreSQL."""
-        self.conn = None
+    def __init__(self, dsn=None):
+        """
+        Инициализация соединения с PostgreSQL.
+        dsn — строка подключения libpq; если не задана, используются DB_HOST/DB_PORT/DB_USER/DB_PASSWORD/DB_NAME.
+        """
+        self.dsn = dsn
+        self.user_cache = UserCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+        self.bot = None
+        # Соединения открываются по одному на поток (см. conn)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
         try:
-            self.conn = psycopg2.connect(
-                host=DB_HOST,
-                port=DB_PORT,
-                user=DB_USER,
-                password=DB_PASSWORD,
-                dbname=DB_NAME
-            )
+            self.conn  # соединение основного потока; заодно проверяет доступность БД
             logger.info("Database connection established successfully.")
-            self.bot = None
-            self.create_schemas_and_tables()
+            # Один запрос версии схемы; DDL — только если есть новые миграции
+            migrate(self, POSTGRES_MIGRATIONS)
         except psycopg2.OperationalError as e:
             logger.critical(f"Database connection failed: {e}", exc_info=True)
             raise
 
+    @property
+    def conn(self):
+        """
+        Соединение текущего потока. Методы вызываются из пулов потоков (database/async_db.py);
+        у каждого потока своя транзакция, поэтому commit/rollback одного запроса не задевают другие.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None or conn.closed:
+            if self.dsn:
+                conn = psycopg2.connect(self.dsn)
+            else:
+                conn = psycopg2.connect(
+                    host=DB_HOST,
+                    port=DB_PORT,
+                    user=DB_USER,
+                    password=DB_PASSWORD,
+                    dbname=DB_NAME
+                )
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def warmup_connection(self):
+        """Открывает соединение текущего потока заранее (см. AsyncDatabase.warmup)."""
+        self.conn
+
     def execute_query(self, query, params=None, fetch=None):
         """Универсальный метод для выполнения запросов."""
         with self.conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
@@ -42,65 +112,233 @@ class Database:
                 self.conn.rollback()
                 return None
 
-    def create_schemas_and_tables(self):
-        """Создает схемы и таблицы, если они не существуют."""
-        queries = [
-            "CREATE SCHEMA IF NOT EXISTS core;",
-            "CREATE SCHEMA IF NOT EXISTS programs;",
-            "CREATE SCHEMA IF NOT EXISTS marketplace;",
-            """
-            CREATE TABLE IF NOT EXISTS core.users (
-                user_id BIGINT PRIMARY KEY,
-                username TEXT,
-                full_name TEXT,
-                first_seen_at TIMESTAMPTZ DEFAULT NOW(),
-                last_seen_at TIMESTAMPTZ DEFAULT NOW(),
-                ozon_id TEXT,
-                wildberries_id TEXT,
-                bonus_available BOOLEAN DEFAULT FALSE
-            );
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS core.actions (
-                id SERIAL PRIMARY KEY,
-                user_id BIGINT NOT NULL REFERENCES core.users(user_id) ON DELETE CASCADE,
-                action_type VARCHAR(50) NOT NULL,
-                details JSONB,
-                created_at TIMESTAMPTZ DEFAULT NOW()
-            );
-            """,
-            # ... (здесь можно добавить остальные CREATE TABLE из вашего SQL скрипта)
-        ]
-        for query in queries:
-            self.execute_query(query)
-        logger.info("Schemas and tables checked/created successfully.")
+    def execute_ddl(self, query, params=None, autocommit=False):
+        """
+        Выполняет и коммитит запрос миграции; в отличие от execute_query, ошибку пробрасывает.
+        autocommit=True — для команд, которые нельзя выполнять в транзакции (CREATE INDEX CONCURRENTLY).
+        """
+        conn = self.conn
+        conn.autocommit = autocommit
+        try:
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+            if not autocommit:
+                conn.commit()
+        except psycopg2.Error:
+            if not autocommit:
+                conn.rollback()
+            raise
+        finally:
+            conn.autocommit = False
+
+    # --- Версия схемы (database/migrations) ---
+
+    def schema_version(self):
+        """Текущая версия схемы; 0 — БД создана до версионирования или пустая."""
+        with self.conn.cursor() as cur:
+            try:
+                cur.execute("SELECT MAX(version) FROM public.schema_version;")
+                version = cur.fetchone()[0]
+                self.conn.commit()
+            except psycopg2.errors.UndefinedTable:
+                self.conn.rollback()
+                return 0
+        return version or 0
+
+    @contextmanager
+    def migration_lock(self):
+        """
+        Сессионная advisory-блокировка: при одновременном старте нескольких процессов миграции
+        применяет один. Остальные опрашивают pg_try_advisory_lock вне транзакции, а не ждут внутри
+        pg_advisory_lock: снимок ждущего запроса заблокировал бы CREATE INDEX CONCURRENTLY в миграции.
+        """
+        self.execute_ddl(
+            "CREATE TABLE IF NOT EXISTS public.schema_version ("
+            "version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW());"
+        )
+        while True:
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT pg_try_advisory_lock(%s);", (MIGRATION_LOCK_ID,))
+                locked = cur.fetchone()[0]
+            self.conn.commit()
+            if locked:
+                break
+            time.sleep(MIGRATION_LOCK_POLL)
+        try:
+            yield
+        finally:
+            self.execute_ddl("SELECT pg_advisory_unlock(%s);", (MIGRATION_LOCK_ID,))
+
+    def record_migration(self, version, name):
+        self.execute_ddl("INSERT INTO public.schema_version (version, name) VALUES (%s, %s);", (version, name))
+
+    # --- Месячные партиции действий и ретеншн ---
+
+    def _actions_partitioned(self):
+        """Проверяет, создана ли core.actions как секционированная таблица."""
+        row = self.execute_query(
+            "SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE n.nspname = 'core' AND c.relname = 'actions';",
+            fetch="one"
+        )
+        return bool(row) and row[0] == "p"
+
+    def _action_partitions(self):
+        """Возвращает отсортированный список [(month_start date, table_name)] месячных партиций core.actions."""
+        rows = self.execute_query(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "JOIN pg_namespace n ON n.oid = p.relnamespace "
+            "WHERE n.nspname = 'core' AND p.relname = 'actions';",
+            fetch="all"
+        ) or []
+        partitions = []
+        for row in rows:
+            name = row[0]
+            # Формат имени: actions_yYYYYmMM
+            if len(name) == 16 and name.startswith("actions_y") and name[13] == "m":
+                partitions.append((date(int(name[9:13]), int(name[14:16]), 1), name))
+        return sorted(partitions)
+
+    def ensure_action_partitions(self, months_ahead=2, now=None):
+        """
+        Создает месячные партиции core.actions от текущего месяца на months_ahead вперед.
+        Месяцы и границы — по UTC, как в SQLite-бэкенде; now — aware datetime (по умолчанию сейчас в TIMEZONE).
+        """
+        month = _utc_month_start(now)
+        for _ in range(months_ahead + 1):
+            next_month = _next_month(month)
+            table = f"actions_y{month.year:04d}m{month.month:02d}"
+            self.execute_query(
+                f"CREATE TABLE IF NOT EXISTS core.{table} PARTITION OF core.actions "
+                f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{next_month.isoformat()} 00:00:00+00');"
+            )
+            month = next_month
+
+    def apply_action_retention(self, keep_months=ACTIONS_RETENTION_MONTHS, now=None):
+        """
+        Сворачивает действия старше keep_months месяцев в дневные агрегаты core.action_daily_rollups
+        (day — дата по UTC, как в SQLite-бэкенде) и удаляет сырые строки: для секционированной таблицы —
+        DETACH + DROP целых партиций и DELETE из core.actions_default, для обычной — DELETE.
+        Возвращает число удаленных партиций (или строк для обычной таблицы).
+        """
+        cutoff_month = _utc_month_start(now)
+        for _ in range(keep_months):
+            cutoff_month = _previous_month(cutoff_month)
+        cutoff = datetime(cutoff_month.year, cutoff_month.month, 1, tzinfo=timezone.utc)
+        rollup_sql = """
+            INSERT INTO core.action_daily_rollups (user_id, day, action_type, count, responses)
+            SELECT user_id, (created_at AT TIME ZONE 'UTC')::date, action_type, COUNT(*),
+                   COUNT(*) FILTER (WHERE jsonb_typeof(details -> 'response') = 'string') FROM {source}
+            WHERE created_at < %s
+            GROUP BY user_id, (created_at AT TIME ZONE 'UTC')::date, action_type
+            ON CONFLICT (user_id, day, action_type) DO UPDATE
+            SET count = core.action_daily_rollups.count + EXCLUDED.count,
+                responses = core.action_daily_rollups.responses + EXCLUDED.responses;
+        """
+        if not self._actions_partitioned():
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute(rollup_sql.format(source="core.actions"), (cutoff,))
+                    cur.execute("DELETE FROM core.actions WHERE created_at < %s;", (cutoff,))
+                    deleted = cur.rowcount
+                self.conn.commit()
+                logger.info(f"Rolled up and deleted {deleted} actions older than {cutoff}.")
+                return deleted
+            except psycopg2.Error as e:
+                logger.error(f"Failed to apply action retention: {e}", exc_info=True)
+                self.conn.rollback()
+                return 0
+
+        dropped = 0
+        for month_start, table in self._action_partitions():
+            if month_start >= cutoff_month:
+                break
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute(f"ALTER TABLE core.actions DETACH PARTITION core.{table};")
+                    cur.execute(rollup_sql.format(source=f"core.{table}"), (cutoff,))
+                    cur.execute(f"DROP TABLE core.{table};")
+                self.conn.commit()
+                dropped += 1
+                logger.info(f"Rolled up and dropped action partition core.{table}.")
+            except psycopg2.Error as e:
+                logger.error(f"Failed to apply retention to partition core.{table}: {e}", exc_info=True)
+                self.conn.rollback()
+                break
+
+        # В DEFAULT попадают месяцы без своей партиции: история до первого ensure_action_partitions
+        # и строки, перенесенные migrate_to_postgres.py
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(rollup_sql.format(source="core.actions_default"), (cutoff,))
+                cur.execute("DELETE FROM core.actions_default WHERE created_at < %s;", (cutoff,))
+                deleted = cur.rowcount
+            self.conn.commit()
+            if deleted:
+                logger.info(f"Rolled up and deleted {deleted} actions older than {cutoff_month} from core.actions_default.")
+        except psycopg2.Error as e:
+            logger.error(f"Failed to apply retention to core.actions_default: {e}", exc_info=True)
+            self.conn.rollback()
+        return dropped
+
+    def run_action_maintenance(self):
+        """Ежедневное обслуживание действий: партиции наперед и ретеншн (вызывается планировщиком)."""
+        partitioned = self._actions_partitioned()
+        if partitioned:
+            self.ensure_action_partitions()
+        dropped = self.apply_action_retention()
+        logger.info(f"Action maintenance finished: partitioned={partitioned}, dropped={dropped}.")
+        return {"dropped": dropped}
 
     def get_user(self, user_id):
-        """Получает данные пользователя или создает нового."""
-        query = "SELECT * FROM core.users WHERE user_id = %s;"
-        user = self.execute_query(query, (user_id,), fetch="one")
-        if user:
-            return dict(user)
-        
-        # Создаем нового пользователя
-        insert_query = "INSERT INTO core.users (user_id) VALUES (%s) RETURNING *;"
-        new_user = self.execute_query(insert_query, (user_id,), fetch="one")
-        logger.info(f"New user created with ID: {user_id}")
-        return dict(new_user) if new_user else None
+        """
+        Получает данные пользователя (сначала из кэша) или создает нового.
+        Ключи совпадают с SQLite-бэкендом: full_name отдается как name.
+        """
+        cached = self.user_cache.get(user_id)
+        if cached is not None:
+            return cached
+        generation = self.user_cache.generation(user_id)
+        user = self.execute_query(f"SELECT {USER_FIELDS} FROM core.users WHERE user_id = %s;", (user_id,), fetch="one")
+        if not user:
+            # Два первых get_user из пула чтения могут вставлять одновременно: проигравший получает
+            # пустой RETURNING и перечитывает строку, созданную победителем
+            user = self.execute_query(
+                f"INSERT INTO core.users (user_id) VALUES (%s) ON CONFLICT (user_id) DO NOTHING RETURNING {USER_FIELDS};",
+                (user_id,), fetch="one"
+            )
+            if user:
+                logger.info(f"New user created with ID: {user_id}")
+            else:
+                user = self.execute_query(f"SELECT {USER_FIELDS} FROM core.users WHERE user_id = %s;", (user_id,), fetch="one")
+            if not user:
+                return None
+        user = dict(user)
+        user["name"] = user["name"] or ""
+        user["username"] = user["username"] or ""
+        user["bonus_available"] = bool(user["bonus_available"])
+        self.user_cache.set(user_id, user, generation)
+        return user
 
     def update_user(self, user_id, data):
-        """Обновляет данные пользователя."""
-        # Убедимся, что пользователь существует
-        self.get_user(user_id)
-        
-        # Формируем запрос на обновление
-        set_clause = ", ".join([f"{key} = %s" for key in data.keys()])
-        params = list(data.values()) + [user_id]
-        query = f"UPDATE core.users SET {set_clause} WHERE user_id = %s;"
-        self.execute_query(query, tuple(params))
-        
-        # Обновляем last_seen_at
-        self.execute_query("UPDATE core.users SET last_seen_at = NOW() WHERE user_id = %s;", (user_id,))
+        """Обновляет переданные поля пользователя одним UPSERT-ом (без предварительного SELECT)."""
+        changes = {}
+        for key, value in data.items():
+            if key not in USER_COLUMNS:
+                logger.warning(f"update_user: ignoring unknown column '{key}' for user {user_id}")
+                continue
+            changes[USER_COLUMNS[key]] = value
+        columns = list(changes.keys())
+        insert_columns = ", ".join(["user_id"] + columns)
+        placeholders = ", ".join(["%s"] * (len(columns) + 1))
+        set_clause = ", ".join([f"{key} = EXCLUDED.{key}" for key in columns] + ["last_seen_at = NOW()"])
+        query = f"""
+            INSERT INTO core.users ({insert_columns}) VALUES ({placeholders})
+            ON CONFLICT (user_id) DO UPDATE SET {set_clause};
+        """
+        self.execute_query(query, (user_id, *changes.values()))
+        self.user_cache.invalidate(user_id)
 
 
     def save_action(self, user_id, username, name, action, details, timestamp):
@@ -114,12 +352,83 @@ class Database:
         query = "INSERT INTO core.actions (user_id, action_type, details) VALUES (%s, %s, %s);"
         self.execute_query(query, (user_id, action_type, details_json))
 
+    def get_actions(self, user_id=None):
+        """Получает список действий пользователя (или всех), отсортированных по времени."""
+        return list(self.iter_actions(user_id=user_id))
+
+    def iter_actions(self, user_id=None, since=None, until=None, types=None, limit=None, batch_size=500):
+        """
+        Лениво отдает действия из core.actions в порядке (created_at, id).
+        Использует серверный (именованный) курсор: строки приходят пачками по batch_size.
+        Ключи словарей и границы since/until совпадают с SQLite-бэкендом (см. db._timestamp_bound).
+        """
+        conditions, params = [], []
+        if user_id:
+            conditions.append("user_id = %s"); params.append(user_id)
+        if since is not None:
+            conditions.append("created_at >= %s"); params.append(_timestamp_bound(since))
+        if until is not None:
+            conditions.append("created_at < %s"); params.append(_timestamp_bound(until))
+        if types:
+            conditions.append("action_type = ANY(%s)"); params.append(list(types))
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"SELECT id, user_id, action_type AS action, details, created_at AS timestamp FROM core.actions{where} ORDER BY created_at, id"
+        if limit is not None:
+            query += " LIMIT %s"; params.append(limit)
+        conn = self.conn
+        try:
+            with conn.cursor(name=f"iter_actions_{uuid.uuid4().hex}", cursor_factory=psycopg2.extras.DictCursor) as cur:
+                cur.itersize = batch_size
+                cur.execute(query, params)
+                for row in cur:
+                    action = dict(row)
+                    action["details"] = action.get("details") or {}
+                    if isinstance(action.get("timestamp"), datetime):
+                        action["timestamp"] = action["timestamp"].isoformat()
+                    yield action
+        except psycopg2.Error as e:
+            logger.error(f"Failed to iterate actions (user_id: {user_id}, since: {since}, until: {until}): {e}", exc_info=True)
+        finally:
+            # Потребитель мог остановиться раньше (limit, break): транзакция курсора закрывается и тогда,
+            # иначе соединение потока остается idle in transaction до следующего запроса
+            if not conn.closed:
+                conn.rollback()
+
+
+    def get_action_totals(self, user_id, types):
+        """
+        Итоги по всей истории пользователя: count — число действий из types, responses — сколько из них
+        с текстовым ответом (details.response — строка), first_day — день первого действия (date в TIMEZONE).
+        Суммирует core.actions и дневные агрегаты ретеншна.
+        """
+        row = self.execute_query(
+            """
+            SELECT COALESCE(SUM(n), 0), COALESCE(SUM(r), 0), MIN(first_day) FROM (
+                SELECT COUNT(*) FILTER (WHERE action_type = ANY(%s)) AS n,
+                       COUNT(*) FILTER (WHERE action_type = ANY(%s) AND jsonb_typeof(details -> 'response') = 'string') AS r,
+                       MIN((created_at AT TIME ZONE %s)::date) AS first_day
+                FROM core.actions WHERE user_id = %s
+                UNION ALL
+                SELECT SUM(count) FILTER (WHERE action_type = ANY(%s)), SUM(responses) FILTER (WHERE action_type = ANY(%s)), MIN(day)
+                FROM core.action_daily_rollups WHERE user_id = %s
+            ) totals;
+            """,
+            (list(types), list(types), TIMEZONE.zone, user_id, list(types), list(types), user_id), fetch="one"
+        )
+        if not row:
+            return {"count": 0, "responses": 0, "first_day": None}
+        return {"count": int(row[0]), "responses": int(row[1]), "first_day": row[2]}
+
     def get_reminder_times(self):
-        """Возвращает словарь {user_id: {'morning': time, 'evening': time}} для пользователей с установленными напоминаниями."""
+        """
+        Возвращает словарь {user_id: {'morning', 'evening', 'name', 'bonus_available', 'last_request'}}
+        для пользователей с установленными напоминаниями — всё, что нужно для рассылки, одним запросом
+        (index-only scan по частичному индексу idx_users_reminders).
+        """
         reminders = {}
         try:
             query = """
-                SELECT user_id, reminder_time, reminder_time_evening
+                SELECT user_id, reminder_time, reminder_time_evening, full_name AS name, bonus_available, last_request
                 FROM core.users WHERE reminder_time IS NOT NULL OR reminder_time_evening IS NOT NULL
             """
             result = self.execute_query(query, fetch="all")
@@ -127,20 +436,39 @@ class Database:
                 for row in result:
                     reminders[row["user_id"]] = {
                         'morning': row["reminder_time"],
-                        'evening': row["reminder_time_evening"]
+                        'evening': row["reminder_time_evening"],
+                        'name': row["name"] or "",
+                        'bonus_available': bool(row["bonus_available"]),
+                        'last_request': row["last_request"]
                     }
             return reminders
         except Exception as e:
             logger.error(f"Failed to get reminder times: {e}", exc_info=True)
             return {}
 
-    # ... Вам нужно будет адаптировать остальные методы (get_user_cards, add_referral и т.д.)
-    # для работы с новыми таблицами и синтаксисом PostgreSQL.
-    # Например:
-    
+    def get_all_users(self):
+        """Возвращает список всех user_id."""
+        result = self.execute_query("SELECT user_id FROM core.users;", fetch="all")
+        return [row["user_id"] for row in result] if result else []
+
+    def is_card_available(self, user_id, today_date: date, user_data=None):
+        """Проверяет, доступна ли карта дня для пользователя сегодня. user_data — уже загруженная строка пользователя."""
+        if user_data is None:
+            user_data = self.get_user(user_id)
+        if not user_data:
+            return True
+        last_request = user_data.get("last_request")
+        if isinstance(last_request, datetime):
+            if last_request.tzinfo is not None:
+                last_request = last_request.astimezone(TIMEZONE)
+            return last_request.date() < today_date
+        return True
+
+    # --- Карты ---
+
     def add_user_card(self, user_id, card_number):
         """Добавляет запись об использованной карте."""
-        query = "INSERT INTO programs.used_cards (user_id, card_number) VALUES (%s, %s);"
+        query = "INSERT INTO programs.used_cards (user_id, card_number) VALUES (%s, %s) ON CONFLICT DO NOTHING;"
         self.execute_query(query, (user_id, card_number))
 
     def get_user_cards(self, user_id):
@@ -148,9 +476,130 @@ class Database:
         query = "SELECT card_number FROM programs.used_cards WHERE user_id = %s;"
         result = self.execute_query(query, (user_id,), fetch="all")
         return [row['card_number'] for row in result] if result else []
-        
+
+    def count_user_cards(self, user_id):
+        """Возвращает количество карт, вытянутых пользователем."""
+        row = self.execute_query("SELECT COUNT(*) FROM programs.used_cards WHERE user_id = %s;", (user_id,), fetch="one")
+        return row[0] if row else 0
+
+    def reset_user_cards(self, user_id):
+        """Удаляет все записи об использованных картах для пользователя."""
+        self.execute_query("DELETE FROM programs.used_cards WHERE user_id = %s;", (user_id,))
+        logger.info(f"Reset used cards for user {user_id}")
+
+    # --- Рефералы ---
+
+    def add_referral(self, referrer_id, referred_id):
+        """Добавляет запись о реферале (если такой еще не существует). True — если запись добавлена."""
+        row = self.execute_query(
+            "INSERT INTO core.referrals (referrer_id, referred_id) VALUES (%s, %s) "
+            "ON CONFLICT (referred_id) DO NOTHING RETURNING referred_id;",
+            (referrer_id, referred_id), fetch="one"
+        )
+        if row:
+            logger.info(f"Referral added: referrer {referrer_id}, referred {referred_id}")
+            return True
+        logger.info(f"Referral already exists or failed: referrer {referrer_id}, referred {referred_id}")
+        return False
+
+    def get_referrals(self, referrer_id):
+        """Возвращает список ID пользователей, приглашенных данным пользователем."""
+        result = self.execute_query("SELECT referred_id FROM core.referrals WHERE referrer_id = %s;", (referrer_id,), fetch="all")
+        return [row["referred_id"] for row in result] if result else []
+
+    # --- Профили ---
+
+    def get_user_profile(self, user_id):
+        """Получает профиль пользователя; форма словаря — как у SQLite-бэкенда (JSONB уже декодирован драйвером)."""
+        row = self.execute_query("SELECT * FROM core.user_profiles WHERE user_id = %s;", (user_id,), fetch="one")
+        if not row:
+            return None
+        profile = dict(row)
+        for field in ("mood_trend", "themes"):
+            if profile.get(field) is None:
+                profile[field] = []
+        for field in ("response_count", "request_count", "days_active", "total_cards_drawn", "reflection_count"):
+            profile[field] = profile.get(field) or 0
+        for field in ("avg_response_length", "interactions_per_day"):
+            profile[field] = profile.get(field) or 0.0
+        return profile
+
+    def update_user_profile(self, user_id, profile_update_data):
+        """Обновляет только переданные поля профиля одним UPSERT-ом (UPSERT по user_id)."""
+        changes = {}
+        for key, value in profile_update_data.items():
+            if key not in PROFILE_COLUMNS:
+                if key != "user_id":
+                    logger.debug(f"update_user_profile: ignoring unknown field '{key}' for user {user_id}")
+                continue
+            if key in ("mood_trend", "themes"):
+                value = psycopg2.extras.Json(value if value is not None else [])
+            changes[key] = value
+        # last_updated обновляется при каждой записи, как и в SQLite-бэкенде
+        if not isinstance(changes.get("last_updated"), datetime):
+            changes["last_updated"] = datetime.now(TIMEZONE)
+        columns = list(changes.keys())
+        query = f"""
+            INSERT INTO core.user_profiles (user_id, {', '.join(columns)}) VALUES ({', '.join(['%s'] * (len(columns) + 1))})
+            ON CONFLICT (user_id) DO UPDATE SET {', '.join(f"{key} = EXCLUDED.{key}" for key in columns)};
+        """
+        self.execute_query(query, (user_id, *changes.values()))
+
+    # --- Вечерняя рефлексия и способы восстановления ---
+
+    def save_evening_reflection(self, user_id, date, good_moments, gratitude, hard_moments, created_at, ai_summary=None):
+        """Сохраняет данные вечерней рефлексии, включая AI-резюме. Ошибку БД пробрасывает, как и SQLite-бэкенд."""
+        row = self.execute_query(
+            """
+            INSERT INTO core.evening_reflections (user_id, date, good_moments, gratitude, hard_moments, created_at, ai_summary)
+            VALUES (%s, %s, %s, %s, %s, COALESCE(%s, NOW()), %s) RETURNING id;
+            """,
+            (user_id, date, good_moments, gratitude, hard_moments, created_at, ai_summary), fetch="one"
+        )
+        if not row:
+            raise psycopg2.DatabaseError(f"Failed to save evening reflection for user {user_id}")
+        logger.info(f"Saved evening reflection for user {user_id} for date {date}" + (" with AI summary." if ai_summary else " without AI summary."))
+
+    def get_last_reflection_date(self, user_id) -> date | None:
+        """Возвращает дату последней рефлексии пользователя как объект date."""
+        row = self.execute_query("SELECT MAX(date) FROM core.evening_reflections WHERE user_id = %s;", (user_id,), fetch="one")
+        return row[0] if row else None
+
+    def count_reflections(self, user_id):
+        """Возвращает общее количество рефлексий пользователя."""
+        row = self.execute_query("SELECT COUNT(*) FROM core.evening_reflections WHERE user_id = %s;", (user_id,), fetch="one")
+        return row[0] if row else 0
+
+    def get_all_reflection_texts(self, user_id, limit=10) -> list[dict]:
+        """Возвращает тексты последних N рефлексий."""
+        result = self.execute_query(
+            "SELECT good_moments, gratitude, hard_moments FROM core.evening_reflections "
+            "WHERE user_id = %s ORDER BY date DESC LIMIT %s;",
+            (user_id, limit), fetch="all"
+        )
+        return [dict(row) for row in result] if result else []
+
+    def add_recharge_method(self, user_id, method, timestamp):
+        """Добавляет новый способ восстановления ресурса."""
+        self.execute_query(
+            "INSERT INTO core.user_recharge_methods (user_id, method, created_at) VALUES (%s, %s, COALESCE(%s, NOW()));",
+            (user_id, method, timestamp)
+        )
+        logger.info(f"Added recharge method for user {user_id}: {method}")
+
+    def get_last_recharge_method(self, user_id) -> str | None:
+        """Возвращает последний добавленный способ восстановления ресурса."""
+        row = self.execute_query(
+            "SELECT method FROM core.user_recharge_methods WHERE user_id = %s ORDER BY created_at DESC LIMIT 1;",
+            (user_id,), fetch="one"
+        )
+        return row["method"] if row else None
+
     def close(self):
-        """Закрывает соединение с базой данных."""
-        if self.conn:
-            self.conn.close()
-            logger.info("Database connection closed.")
+        """Закрывает соединения всех потоков."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            if not conn.closed:
+                conn.close()
+        logger.info("Database connections closed.")
@@ -0,0 +1,96 @@
+# код/database/interface.py
+"""
+Общий интерфейс хранилищ бота: методы, которые есть у SQLite (db.py), PostgreSQL
+(database/db.py) и in-memory (database/memory_db.py) бэкендов с одинаковой семантикой.
+Обработчики работают с ним через AsyncDatabase, которая отдает async-версии этих методов.
+Служебные методы конкретного бэкенда (миграции, партиции, compact_action_details) сюда не входят.
+"""
+from datetime import date
+from typing import Iterator, Protocol, runtime_checkable
+
+
+@runtime_checkable
+class Storage(Protocol):
+    """Синхронное хранилище пользователей, карт, действий, профилей и рефлексий."""
+
+    bot: object  # устанавливается в main.py
+
+    # --- Пользователи ---
+
+    def get_user(self, user_id) -> dict:
+        """Строка пользователя (name, username, last_request, reminder_time, reminder_time_evening, bonus_available); создает ее при отсутствии."""
+
+    def update_user(self, user_id, data: dict) -> None:
+        """Обновляет переданные поля пользователя; неизвестные поля игнорируются."""
+
+    def get_all_users(self) -> list:
+        """Все user_id."""
+
+    def get_reminder_times(self) -> dict:
+        """{user_id: {'morning', 'evening', 'name', 'bonus_available', 'last_request'}} для пользователей с напоминаниями."""
+
+    def is_card_available(self, user_id, today_date: date, user_data=None) -> bool:
+        """Доступна ли карта дня: last_request пользователя раньше today_date."""
+
+    # --- Карты ---
+
+    def add_user_card(self, user_id, card_number) -> None: ...
+
+    def get_user_cards(self, user_id) -> list: ...
+
+    def count_user_cards(self, user_id) -> int: ...
+
+    def reset_user_cards(self, user_id) -> None: ...
+
+    # --- Действия ---
+
+    def save_action(self, user_id, username, name, action, details, timestamp) -> None: ...
+
+    def get_actions(self, user_id=None) -> list:
+        """Действия пользователя (или всех) в порядке времени."""
+
+    def iter_actions(self, user_id=None, since=None, until=None, types=None, limit=None, batch_size=500) -> Iterator[dict]:
+        """Ленивый обход действий в порядке времени; since включительно, until — исключительно."""
+
+    def get_action_totals(self, user_id, types) -> dict:
+        """{'count', 'responses', 'first_day'} по всей истории, включая свернутые ретеншном дни (профиль пользователя)."""
+
+    def run_action_maintenance(self) -> dict:
+        """Ежедневное обслуживание журнала действий (вызывается планировщиком)."""
+
+    # --- Рефералы ---
+
+    def add_referral(self, referrer_id, referred_id) -> bool:
+        """True, если запись добавлена (у приглашенного один пригласивший)."""
+
+    def get_referrals(self, referrer_id) -> list: ...
+
+    # --- Профили ---
+
+    def get_user_profile(self, user_id) -> dict | None:
+        """Профиль с декодированными mood_trend/themes и нулями вместо пустых счетчиков; None, если профиля нет."""
+
+    def update_user_profile(self, user_id, profile_update_data: dict) -> None:
+        """Обновляет переданные поля профиля и last_updated."""
+
+    # --- Вечерняя рефлексия и способы восстановления ---
+
+    def save_evening_reflection(self, user_id, date, good_moments, gratitude, hard_moments, created_at, ai_summary=None) -> None:
+        """Сохраняет рефлексию; ошибку хранилища пробрасывает."""
+
+    def get_last_reflection_date(self, user_id) -> date | None: ...
+
+    def count_reflections(self, user_id) -> int: ...
+
+    def get_all_reflection_texts(self, user_id, limit=10) -> list[dict]: ...
+
+    def add_recharge_method(self, user_id, method, timestamp) -> None: ...
+
+    def get_last_recharge_method(self, user_id) -> str | None: ...
+
+    # --- Соединения ---
+
+    def warmup_connection(self) -> None:
+        """Готовит соединение текущего потока (см. AsyncDatabase.warmup)."""
+
+    def close(self) -> None: ...
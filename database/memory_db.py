@@ -0,0 +1,361 @@
+# код/database/memory_db.py
+"""
+In-memory хранилище с интерфейсом database/interface.py: словари и списки вместо таблиц.
+Значения хранятся в том же виде, что и в SQLite (время и даты — ISO-строками, JSON-поля — текстом),
+и декодируются теми же функциями db.py, поэтому методы возвращают то же, что и SQLite-бэкенд.
+Нужно для тестов и бенчмарков, где важно отделить стоимость обработчиков от стоимости диска.
+Данные живут только в процессе; потокобезопасно (AsyncDatabase вызывает методы из пулов потоков).
+"""
+import bisect
+import json
+import logging
+import threading
+from collections import defaultdict
+from datetime import date, datetime, timezone
+
+from config import TIMEZONE, ACTIONS_RETENTION_MONTHS, USER_CACHE_SIZE, USER_CACHE_TTL
+from database.cache import UserCache
+from db import (
+    USER_COLUMNS, USER_INSERT_DEFAULTS, PROFILE_COLUMNS, ROLLUP_UNKNOWN_USER_ID,
+    encode_details, extract_hot_fields,
+    _action_row_to_dict, _action_timestamp, _profile_row_to_dict, _timestamp_bound, _user_row_to_dict,
+)
+
+logger = logging.getLogger(__name__)
+
+USER_ROW = {"name": None, "username": None, "last_request": None, "reminder_time": None,
+            "reminder_time_evening": None, "bonus_available": 0}
+PROFILE_ROW = {
+    "mood": None, "mood_trend": None, "themes": None, "response_count": 0, "request_count": 0,
+    "avg_response_length": 0.0, "days_active": 0, "interactions_per_day": 0.0, "last_updated": None,
+    "initial_resource": None, "final_resource": None, "recharge_method": None,
+    "total_cards_drawn": 0, "last_reflection_date": None, "reflection_count": 0,
+}
+
+
+def _iso(value, default=None):
+    """datetime -> ISO-строка, строка — как есть (так значения записывает SQLite-бэкенд)."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, str):
+        return value
+    return default
+
+
+class MemoryDatabase:
+    def __init__(self):
+        self.user_cache = UserCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+        self.bot = None  # Устанавливается в main.py
+        self._lock = threading.RLock()
+        self._users = {}                       # user_id -> строка users
+        self._user_cards = defaultdict(list)   # user_id -> [card_number]
+        self._actions = []                     # строки actions, отсортированные по (timestamp, id)
+        self._action_keys = []                 # (timestamp, id) для bisect
+        self._next_action_id = 1
+        self._action_rollups = defaultdict(int)  # (user_id, day, action) -> count
+        self._action_rollup_responses = defaultdict(int)  # (user_id, day, action) -> действий с текстовым ответом
+        self._referrals = {}                   # referred_id -> referrer_id, в порядке добавления
+        self._profiles = {}                    # user_id -> строка user_profiles
+        self._reflections = defaultdict(list)  # user_id -> [строка evening_reflections]
+        self._recharge_methods = defaultdict(list)  # user_id -> [(timestamp, method)]
+
+    # --- Пользователи ---
+
+    def get_user(self, user_id):
+        """Получает данные пользователя (сначала из кэша). Если не найден, создает запись."""
+        user_dict = self.user_cache.get(user_id)
+        if user_dict is not None:
+            return user_dict
+        generation = self.user_cache.generation(user_id)
+        with self._lock:
+            row = self._users.get(user_id)
+            if row is None:
+                row = {"user_id": user_id, **USER_ROW, **USER_INSERT_DEFAULTS}
+                self._users[user_id] = row
+            user_dict = _user_row_to_dict(row, user_id)
+        self.user_cache.set(user_id, user_dict, generation)
+        return user_dict
+
+    def update_user(self, user_id, data):
+        """Обновляет только переданные поля пользователя."""
+        changes = {}
+        for key, value in data.items():
+            if key not in USER_COLUMNS:
+                logger.warning(f"update_user: ignoring unknown column '{key}' for user {user_id}")
+                continue
+            if key == "last_request":
+                value = _iso(value) if isinstance(value, (datetime, str)) else None
+            elif key == "bonus_available":
+                value = int(bool(value))
+            changes[key] = value
+        with self._lock:
+            row = self._users.get(user_id)
+            if row is None:
+                self._users[user_id] = {"user_id": user_id, **USER_ROW, **USER_INSERT_DEFAULTS, **changes}
+            else:
+                row.update(changes)
+        self.user_cache.invalidate(user_id)
+
+    def get_all_users(self):
+        """Возвращает список всех user_id."""
+        with self._lock:
+            return list(self._users)
+
+    def get_reminder_times(self):
+        """
+        Возвращает словарь {user_id: {'morning', 'evening', 'name', 'bonus_available', 'last_request'}}
+        для пользователей с установленными напоминаниями.
+        """
+        with self._lock:
+            rows = [row for row in self._users.values()
+                    if row["reminder_time"] is not None or row["reminder_time_evening"] is not None]
+            reminders = {}
+            for row in rows:
+                user = _user_row_to_dict(row, row["user_id"])
+                reminders[row["user_id"]] = {
+                    'morning': row["reminder_time"],
+                    'evening': row["reminder_time_evening"],
+                    'name': row["name"] or "",
+                    'bonus_available': user["bonus_available"],
+                    'last_request': user["last_request"],
+                }
+            return reminders
+
+    def is_card_available(self, user_id, today_date: date, user_data=None):
+        """Проверяет, доступна ли карта дня для пользователя сегодня. user_data — уже загруженная строка пользователя."""
+        if user_data is None:
+            user_data = self.get_user(user_id)
+        if not user_data:
+            return True
+        last_request = user_data.get("last_request")
+        if isinstance(last_request, datetime):
+            if last_request.tzinfo is not None:
+                last_request = last_request.astimezone(TIMEZONE)
+            return last_request.date() < today_date
+        return True
+
+    # --- Карты ---
+
+    def add_user_card(self, user_id, card_number):
+        """Добавляет запись об использованной карте."""
+        with self._lock:
+            self._user_cards[user_id].append(card_number)
+
+    def get_user_cards(self, user_id):
+        """Возвращает список номеров карт, использованных пользователем."""
+        with self._lock:
+            return list(self._user_cards.get(user_id, ()))
+
+    def count_user_cards(self, user_id):
+        """Возвращает количество карт, вытянутых пользователем."""
+        with self._lock:
+            return len(self._user_cards.get(user_id, ()))
+
+    def reset_user_cards(self, user_id):
+        """Удаляет все записи об использованных картах для пользователя."""
+        with self._lock:
+            self._user_cards.pop(user_id, None)
+        logger.info(f"Reset used cards for user {user_id}")
+
+    # --- Действия ---
+
+    def save_action(self, user_id, username, name, action, details, timestamp):
+        """Сохраняет запись о действии пользователя."""
+        timestamp_str = _action_timestamp(timestamp)
+        details_json = None
+        if details is not None:
+            try:
+                details_json = encode_details(details)
+            except TypeError as e:
+                logger.error(f"Failed to serialize details for action '{action}', user {user_id}: {e}. Details: {details}")
+                details_json = encode_details({"error": "serialization_failed", "original_details_type": str(type(details))})
+        card_number, resource, response_len = extract_hot_fields(details)
+        with self._lock:
+            row = {
+                "id": self._next_action_id, "user_id": user_id, "username": username, "name": name,
+                "action": action, "details": details_json, "timestamp": timestamp_str,
+                "card_number": card_number, "resource": resource, "response_len": response_len,
+            }
+            self._next_action_id += 1
+            # Действия почти всегда приходят по порядку, поэтому вставка обычно в конец списка
+            key = (timestamp_str, row["id"])
+            index = bisect.bisect_right(self._action_keys, key)
+            self._action_keys.insert(index, key)
+            self._actions.insert(index, row)
+
+    def get_actions(self, user_id=None, raw_details=False):
+        """Получает список действий пользователя (или всех), отсортированных по времени."""
+        return list(self.iter_actions(user_id=user_id, raw_details=raw_details))
+
+    def iter_actions(self, user_id=None, since=None, until=None, types=None, limit=None, batch_size=500, raw_details=False):
+        """
+        Отдает действия в порядке (timestamp, id) с теми же фильтрами, что и SQLite-бэкенд:
+        since включительно, until — исключительно, types — список значений action.
+        """
+        since = _timestamp_bound(since) if since is not None else None
+        until = _timestamp_bound(until) if until is not None else None
+        types = set(types) if types else None
+        with self._lock:
+            start = bisect.bisect_left(self._action_keys, (since,)) if since is not None else 0
+            rows = self._actions[start:]
+        if limit is not None and limit <= 0:
+            return
+        for row in rows:
+            if until is not None and row["timestamp"] >= until:
+                return
+            if user_id and row["user_id"] != user_id:
+                continue
+            if types is not None and row["action"] not in types:
+                continue
+            yield _action_row_to_dict(row, raw_details)
+            if limit is not None:
+                limit -= 1
+                if limit <= 0:
+                    return
+
+    def get_action_totals(self, user_id, types):
+        """Итоги по всей истории пользователя (сырые действия и дневные агрегаты), как в SQLite-бэкенде."""
+        types = set(types)
+        count, responses, first_days = 0, 0, []
+        with self._lock:
+            for row in self._actions:
+                if row["user_id"] != user_id:
+                    continue
+                count += row["action"] in types
+                responses += row["action"] in types and row["response_len"] is not None
+                first = datetime.fromisoformat(row["timestamp"].replace("Z", "+00:00"))
+                first_days.append((first.astimezone(TIMEZONE) if first.tzinfo else first).date())
+            for (rollup_user_id, day, action), rollup_count in self._action_rollups.items():
+                if rollup_user_id == user_id:
+                    if action in types:
+                        count += rollup_count
+                        responses += self._action_rollup_responses[(rollup_user_id, day, action)]
+                    first_days.append(date.fromisoformat(day))
+        return {"count": count, "responses": responses, "first_day": min(first_days) if first_days else None}
+
+    def apply_action_retention(self, keep_months=ACTIONS_RETENTION_MONTHS, now=None):
+        """Сворачивает действия старше keep_months месяцев в дневные агрегаты. Возвращает число свернутых строк."""
+        month_start = (now or datetime.now(TIMEZONE)).astimezone(timezone.utc).date().replace(day=1)
+        for _ in range(keep_months):
+            month_start = (month_start.replace(day=1) - date.resolution).replace(day=1)
+        cutoff = month_start.isoformat()
+        with self._lock:
+            index = bisect.bisect_left(self._action_keys, (cutoff,))
+            expired = self._actions[:index]
+            for row in expired:
+                user_id = ROLLUP_UNKNOWN_USER_ID if row["user_id"] is None else row["user_id"]
+                key = (user_id, row["timestamp"][:10], row["action"])
+                self._action_rollups[key] += 1
+                self._action_rollup_responses[key] += row["response_len"] is not None
+            del self._actions[:index]
+            del self._action_keys[:index]
+        return len(expired)
+
+    def run_action_maintenance(self):
+        """Ежедневное обслуживание действий: партиций нет, только ретеншн."""
+        rolled_up = self.apply_action_retention()
+        logger.info(f"Action maintenance finished: rolled up {rolled_up} actions.")
+        return {"moved": 0, "rolled_up": rolled_up}
+
+    # --- Рефералы ---
+
+    def add_referral(self, referrer_id, referred_id):
+        """Добавляет запись о реферале (если такой еще не существует)."""
+        with self._lock:
+            if referred_id in self._referrals:
+                logger.info(f"Referral already exists or failed: referrer {referrer_id}, referred {referred_id}")
+                return False
+            self._referrals[referred_id] = referrer_id
+        logger.info(f"Referral added: referrer {referrer_id}, referred {referred_id}")
+        return True
+
+    def get_referrals(self, referrer_id):
+        """Возвращает список ID пользователей, приглашенных данным пользователем."""
+        with self._lock:
+            return [referred for referred, referrer in self._referrals.items() if referrer == referrer_id]
+
+    # --- Профили ---
+
+    def get_user_profile(self, user_id):
+        """Получает профиль пользователя."""
+        with self._lock:
+            row = self._profiles.get(user_id)
+            return _profile_row_to_dict(row, user_id) if row is not None else None
+
+    def update_user_profile(self, user_id, profile_update_data):
+        """Обновляет только переданные поля профиля (UPSERT по user_id)."""
+        changes = {}
+        for key, value in profile_update_data.items():
+            if key not in PROFILE_COLUMNS:
+                if key != "user_id":
+                    logger.debug(f"update_user_profile: ignoring unknown field '{key}' for user {user_id}")
+                continue
+            if key in ("mood_trend", "themes"):
+                value = json.dumps(value if value is not None else [], ensure_ascii=False)
+            elif key == "last_reflection_date":
+                value = _iso(value)
+            changes[key] = value
+        # last_updated обновляется при каждой записи
+        last_updated_dt = profile_update_data.get("last_updated")
+        changes["last_updated"] = last_updated_dt.isoformat() if isinstance(last_updated_dt, datetime) else datetime.now(TIMEZONE).isoformat()
+        with self._lock:
+            row = self._profiles.setdefault(user_id, {"user_id": user_id, **PROFILE_ROW})
+            row.update(changes)
+
+    # --- Вечерняя рефлексия и способы восстановления ---
+
+    def save_evening_reflection(self, user_id, date, good_moments, gratitude, hard_moments, created_at, ai_summary=None):
+        """Сохраняет данные вечерней рефлексии, включая AI-резюме."""
+        created_at_str = _iso(created_at) if isinstance(created_at, (datetime, str)) else datetime.now(TIMEZONE).isoformat()
+        date_str = _iso(date, datetime.now(TIMEZONE).strftime('%Y-%m-%d'))
+        with self._lock:
+            self._reflections[user_id].append({
+                "user_id": user_id, "date": date_str, "good_moments": good_moments, "gratitude": gratitude,
+                "hard_moments": hard_moments, "created_at": created_at_str, "ai_summary": ai_summary,
+            })
+        logger.info(f"Saved evening reflection for user {user_id} for date {date_str}" + (" with AI summary." if ai_summary else " without AI summary."))
+
+    def get_last_reflection_date(self, user_id) -> date | None:
+        """Возвращает дату последней рефлексии пользователя как объект date."""
+        with self._lock:
+            dates = [row["date"] for row in self._reflections.get(user_id, ()) if row["date"]]
+        if not dates:
+            return None
+        try:
+            return date.fromisoformat(max(dates))
+        except ValueError as e:
+            logger.error(f"Could not parse date string '{max(dates)}' for user {user_id}: {e}")
+            return None
+
+    def count_reflections(self, user_id):
+        """Возвращает общее количество рефлексий пользователя."""
+        with self._lock:
+            return len(self._reflections.get(user_id, ()))
+
+    def get_all_reflection_texts(self, user_id, limit=10) -> list[dict]:
+        """Возвращает тексты последних N рефлексий."""
+        with self._lock:
+            rows = sorted(self._reflections.get(user_id, ()), key=lambda row: row["date"], reverse=True)[:limit]
+            return [{key: row[key] for key in ("good_moments", "gratitude", "hard_moments")} for row in rows]
+
+    def add_recharge_method(self, user_id, method, timestamp):
+        """Добавляет новый способ восстановления ресурса."""
+        timestamp_str = _action_timestamp(timestamp)
+        with self._lock:
+            self._recharge_methods[user_id].append((timestamp_str, method))
+        logger.info(f"Added recharge method for user {user_id}: {method}")
+
+    def get_last_recharge_method(self, user_id) -> str | None:
+        """Возвращает последний добавленный способ восстановления ресурса."""
+        with self._lock:
+            methods = self._recharge_methods.get(user_id)
+            # При равном времени — первый добавленный, как у стабильной сортировки
+            return max(methods, key=lambda entry: entry[0])[1] if methods else None
+
+    # --- Соединения ---
+
+    def warmup_connection(self):
+        """Соединений нет — прогревать нечего."""
+
+    def close(self):
+        """Соединений нет; данные освобождаются вместе с объектом."""
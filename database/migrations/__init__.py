@@ -0,0 +1,49 @@
+# код/database/migrations/__init__.py
+"""
+Версионированные миграции схемы для обоих бэкендов: sqlite.MIGRATIONS (db.py) и
+postgres.MIGRATIONS (database/db.py). Миграция — (версия, имя, функция apply(db));
+примененные версии записываются в таблицу schema_version, поэтому при старте выполняется
+один запрос MAX(version), и на актуальной схеме больше ничего не делается.
+
+Правила для новых миграций:
+- версии только растут, уже выпущенные миграции не меняются — нужна правка, добавляется новая;
+- DDL идет короткими транзакциями, а перенос и пересчет данных в больших таблицах — пачками
+  по первичному ключу (каждая пачка — своя транзакция), чтобы бот мог работать во время миграции;
+- шаги идемпотентны: миграция, прерванная до записи версии, при следующем старте повторяется целиком.
+"""
+import logging
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+Migration = namedtuple("Migration", ["version", "name", "apply"])
+
+
+def latest_version(migrations):
+    return migrations[-1].version if migrations else 0
+
+
+def migrate(db, migrations, target=None):
+    """
+    Применяет миграции с версией больше текущей (и не больше target). Бэкенд предоставляет
+    schema_version(), migration_lock() и record_migration(version, name). Возвращает итоговую версию.
+    """
+    current = db.schema_version()
+    target = latest_version(migrations) if target is None else target
+    if current >= target:
+        logger.info("Database schema is up to date (version %d).", current)
+        return current
+    with db.migration_lock():
+        # Пока ждали блокировку, миграции мог применить другой процесс
+        current = db.schema_version()
+        for migration in migrations:
+            if migration.version <= current or migration.version > target:
+                continue
+            logger.info("Applying migration %d: %s", migration.version, migration.name)
+            started = time.perf_counter()
+            migration.apply(db)
+            db.record_migration(migration.version, migration.name)
+            current = migration.version
+            logger.info("Migration %d applied in %.2f s", migration.version, time.perf_counter() - started)
+    return current
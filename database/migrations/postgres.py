@@ -0,0 +1,175 @@
+# код/database/migrations/postgres.py
+"""Миграции PostgreSQL-бэкенда (database/db.py). Порядок и правила — см. database/migrations/__init__.py."""
+import logging
+
+from database.migrations import Migration
+
+logger = logging.getLogger(__name__)
+
+BASE_SCHEMA = [
+    "CREATE SCHEMA IF NOT EXISTS core;",
+    "CREATE SCHEMA IF NOT EXISTS programs;",
+    "CREATE SCHEMA IF NOT EXISTS marketplace;",
+    """
+    CREATE TABLE IF NOT EXISTS core.users (
+        user_id BIGINT PRIMARY KEY,
+        username TEXT,
+        full_name TEXT,
+        first_seen_at TIMESTAMPTZ DEFAULT NOW(),
+        last_seen_at TIMESTAMPTZ DEFAULT NOW(),
+        ozon_id TEXT,
+        wildberries_id TEXT,
+        bonus_available BOOLEAN DEFAULT FALSE
+    );
+    """,
+    # Новая БД получает действия, секционированные по месяцам (created_at); ключ секционирования входит в PK.
+    # На существующих установках core.actions — обычная таблица (id SERIAL), и IF NOT EXISTS ее не трогает.
+    """
+    CREATE TABLE IF NOT EXISTS core.actions (
+        id BIGSERIAL,
+        user_id BIGINT NOT NULL REFERENCES core.users(user_id) ON DELETE CASCADE,
+        action_type VARCHAR(50) NOT NULL,
+        details JSONB,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at);
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS core.action_daily_rollups (
+        user_id BIGINT NOT NULL,
+        day DATE NOT NULL,
+        action_type VARCHAR(50) NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day, action_type)
+    );
+    """,
+]
+
+
+def _execute_each(db, statements):
+    """
+    Выполняет команды миграции по одной, каждую в своей транзакции: ошибка одной команды не откатывает
+    уже созданные таблицы и в логе видно, какая команда упала. Команды идемпотентны (IF NOT EXISTS),
+    поэтому прерванная миграция при следующем старте просто повторяется.
+    """
+    for statement in statements:
+        try:
+            db.execute_ddl(statement)
+        except Exception:
+            logger.error(f"Migration statement failed:\n{statement.strip()}")
+            raise
+
+
+# Только для секционированной core.actions: на обычной таблице PARTITION OF падает с "is not partitioned"
+ACTIONS_DEFAULT_PARTITION = "CREATE TABLE IF NOT EXISTS core.actions_default PARTITION OF core.actions DEFAULT;"
+
+
+def _base_schema(db):
+    _execute_each(db, BASE_SCHEMA)
+    if db._actions_partitioned():
+        db.execute_ddl(ACTIONS_DEFAULT_PARTITION)
+        db.ensure_action_partitions()
+    else:
+        logger.warning("core.actions is a plain table; retention will fall back to DELETE. Recreate it as partitioned to enable monthly partitions.")
+
+
+# Таблицы, которые методы Database использовали, но схема не создавала. Имена столбцов — как в
+# SQLite-бэкенде, кроме core.users.full_name (в get_user отдается как name) и created_at вместо timestamp.
+APP_TABLES = [
+    # Новые столбцы без значения по умолчанию добавляются мгновенно, без перезаписи таблицы
+    """
+    ALTER TABLE core.users
+        ADD COLUMN IF NOT EXISTS last_request TIMESTAMPTZ,
+        ADD COLUMN IF NOT EXISTS reminder_time TEXT,
+        ADD COLUMN IF NOT EXISTS reminder_time_evening TEXT;
+    """,
+    # Составной PK — он же индекс для get_user_cards/count_user_cards по user_id
+    """
+    CREATE TABLE IF NOT EXISTS programs.used_cards (
+        user_id BIGINT NOT NULL REFERENCES core.users(user_id) ON DELETE CASCADE,
+        card_number INTEGER NOT NULL,
+        PRIMARY KEY (user_id, card_number)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS core.referrals (
+        referred_id BIGINT PRIMARY KEY REFERENCES core.users(user_id) ON DELETE CASCADE,
+        referrer_id BIGINT NOT NULL REFERENCES core.users(user_id) ON DELETE CASCADE,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_referrals_referrer ON core.referrals (referrer_id);",
+    """
+    CREATE TABLE IF NOT EXISTS core.user_profiles (
+        user_id BIGINT PRIMARY KEY REFERENCES core.users(user_id) ON DELETE CASCADE,
+        mood TEXT,
+        mood_trend JSONB,
+        themes JSONB,
+        response_count INTEGER DEFAULT 0,
+        request_count INTEGER DEFAULT 0,
+        avg_response_length DOUBLE PRECISION DEFAULT 0,
+        days_active INTEGER DEFAULT 0,
+        interactions_per_day DOUBLE PRECISION DEFAULT 0,
+        last_updated TIMESTAMPTZ,
+        initial_resource TEXT,
+        final_resource TEXT,
+        recharge_method TEXT,
+        total_cards_drawn INTEGER DEFAULT 0,
+        last_reflection_date DATE,
+        reflection_count INTEGER DEFAULT 0
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS core.evening_reflections (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT NOT NULL REFERENCES core.users(user_id) ON DELETE CASCADE,
+        date DATE NOT NULL,
+        good_moments TEXT,
+        gratitude TEXT,
+        hard_moments TEXT,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        ai_summary TEXT
+    );
+    """,
+    # Последние рефлексии пользователя, их число и дата последней — по одному индексу
+    "CREATE INDEX IF NOT EXISTS idx_reflections_user_date ON core.evening_reflections (user_id, date DESC);",
+    """
+    CREATE TABLE IF NOT EXISTS core.user_recharge_methods (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT NOT NULL REFERENCES core.users(user_id) ON DELETE CASCADE,
+        method TEXT NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_recharge_user_created ON core.user_recharge_methods (user_id, created_at DESC);",
+    # Индекс секционированной таблицы создается на каждой партиции (CONCURRENTLY для нее недоступен)
+    "CREATE INDEX IF NOT EXISTS idx_actions_user_created ON core.actions (user_id, created_at);",
+]
+
+# Рассылка напоминаний: частичный покрывающий индекс только по пользователям с напоминаниями,
+# get_reminder_times читает его index-only scan-ом, не трогая остальных пользователей.
+# CONCURRENTLY — чтобы на большой таблице не блокировать записи бота.
+REMINDER_INDEX = """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_reminders ON core.users (user_id)
+    INCLUDE (reminder_time, reminder_time_evening, full_name, bonus_available, last_request)
+    WHERE reminder_time IS NOT NULL OR reminder_time_evening IS NOT NULL;
+"""
+
+
+def _app_tables(db):
+    _execute_each(db, APP_TABLES)
+    # После сбоя CONCURRENTLY остается INVALID-индекс, который IF NOT EXISTS пропустил бы, — строим заново
+    db.execute_ddl("DROP INDEX CONCURRENTLY IF EXISTS core.idx_users_reminders;", autocommit=True)
+    db.execute_ddl(REMINDER_INDEX, autocommit=True)
+
+
+def _rollup_responses(db):
+    # Агрегаты до этой миграции ответы не считали: для них responses остается 0
+    db.execute_ddl("ALTER TABLE core.action_daily_rollups ADD COLUMN IF NOT EXISTS responses INTEGER NOT NULL DEFAULT 0;")
+
+
+MIGRATIONS = [
+    Migration(1, "base schema", _base_schema),
+    Migration(2, "application tables and hot-path indexes", _app_tables),
+    Migration(3, "responses in action rollups", _rollup_responses),
+]
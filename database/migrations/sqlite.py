@@ -0,0 +1,148 @@
+# код/database/migrations/sqlite.py
+"""Миграции локального SQLite-бэкенда (db.py). Порядок и правила — см. database/migrations/__init__.py."""
+import logging
+
+from database.migrations import Migration
+
+logger = logging.getLogger(__name__)
+
+BASE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY, name TEXT, username TEXT,
+        last_request TEXT, reminder_time TEXT,
+        reminder_time_evening TEXT, bonus_available BOOLEAN DEFAULT FALSE
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS user_cards (
+        user_id INTEGER, card_number INTEGER,
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS actions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, username TEXT, name TEXT,
+        action TEXT NOT NULL, details TEXT, timestamp TEXT NOT NULL,
+        card_number INTEGER, resource TEXT, response_len INTEGER,
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    )""",
+    # Дневные агрегаты действий, в которые сворачиваются старые месячные партиции
+    """
+    CREATE TABLE IF NOT EXISTS action_daily_rollups (
+        user_id INTEGER NOT NULL, day TEXT NOT NULL, action TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day, action)
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS referrals (
+        referrer_id INTEGER, referred_id INTEGER UNIQUE,
+        FOREIGN KEY (referrer_id) REFERENCES users(user_id) ON DELETE CASCADE,
+        FOREIGN KEY (referred_id) REFERENCES users(user_id) ON DELETE CASCADE
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS feedback (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, name TEXT,
+        feedback TEXT NOT NULL, timestamp TEXT NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS user_profiles (
+        user_id INTEGER PRIMARY KEY, mood TEXT, mood_trend TEXT, themes TEXT,
+        response_count INTEGER DEFAULT 0, request_count INTEGER DEFAULT 0,
+        avg_response_length REAL DEFAULT 0, days_active INTEGER DEFAULT 0,
+        interactions_per_day REAL DEFAULT 0, last_updated TEXT,
+        initial_resource TEXT, final_resource TEXT, recharge_method TEXT,
+        total_cards_drawn INTEGER DEFAULT 0,
+        last_reflection_date TEXT,
+        reflection_count INTEGER DEFAULT 0,
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS evening_reflections (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,
+        date TEXT NOT NULL, good_moments TEXT, gratitude TEXT, -- date здесь TEXT
+        hard_moments TEXT, created_at TEXT NOT NULL, ai_summary TEXT,
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS user_recharge_methods (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        method TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    )""",
+]
+
+# Столбцы, появившиеся в таблицах уже после первого выпуска. В новых БД они есть в BASE_TABLES,
+# а в БД, созданных до версионирования, добавляются один раз через ALTER TABLE.
+LEGACY_COLUMNS = {
+    "user_profiles": {
+        "initial_resource": "TEXT", "final_resource": "TEXT", "recharge_method": "TEXT",
+        "total_cards_drawn": "INTEGER DEFAULT 0", "last_reflection_date": "TEXT",
+        "reflection_count": "INTEGER DEFAULT 0",
+    },
+    "users": {"reminder_time_evening": "TEXT"},
+    "evening_reflections": {"ai_summary": "TEXT"},
+    "actions": {"card_number": "INTEGER", "resource": "TEXT", "response_len": "INTEGER"},
+}
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_actions_user_timestamp ON actions (user_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_actions_timestamp ON actions (timestamp, id)",
+    "CREATE INDEX IF NOT EXISTS idx_user_cards_user ON user_cards (user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_users_reminder_time ON users (reminder_time)",
+    "CREATE INDEX IF NOT EXISTS idx_users_reminder_time_evening ON users (reminder_time_evening)",
+    "CREATE INDEX IF NOT EXISTS idx_reflections_user_date ON evening_reflections (user_id, date)",
+    "CREATE INDEX IF NOT EXISTS idx_recharge_user_timestamp ON user_recharge_methods (user_id, timestamp)",
+]
+
+
+def _base_tables(db):
+    with db.conn:
+        for ddl in BASE_TABLES:
+            db.conn.execute(ddl)
+
+
+def _add_missing_columns(db, table_name, columns):
+    """Добавляет отсутствующие столбцы через ALTER TABLE. Возвращает число добавленных."""
+    existing = {row["name"] for row in db.conn.execute(f"PRAGMA table_info({table_name})")}
+    added = 0
+    with db.conn:
+        for column, column_type in columns.items():
+            if column not in existing:
+                db.conn.execute(f"ALTER TABLE {table_name} ADD COLUMN {column} {column_type}")
+                logger.info(f"Added column '{column}' to {table_name}")
+                added += 1
+    return added
+
+
+def _legacy_columns(db):
+    for table_name, columns in LEGACY_COLUMNS.items():
+        if _add_missing_columns(db, table_name, columns) and table_name == "actions":
+            # Колонки только что появились: ужимаем старые details и заполняем их (пачками по id)
+            db.compact_action_details()
+
+
+def _indexes(db):
+    with db.conn:
+        for ddl in INDEXES:
+            db.conn.execute(ddl)
+
+
+def _utc_action_timestamps(db):
+    # Сравнение timestamp строками в SQL верно только при одном смещении у всех строк
+    db.normalize_action_timestamps()
+
+
+def _rollup_responses(db):
+    # Агрегаты до этой миграции ответы не считали: для них responses остается 0
+    _add_missing_columns(db, "action_daily_rollups", {"responses": "INTEGER NOT NULL DEFAULT 0"})
+
+
+MIGRATIONS = [
+    Migration(1, "base tables", _base_tables),
+    Migration(2, "columns added before versioned migrations", _legacy_columns),
+    Migration(3, "indexes", _indexes),
+    Migration(4, "action timestamps in UTC", _utc_action_timestamps),
+    Migration(5, "responses in action rollups", _rollup_responses),
+]
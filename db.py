@@ -1,9 +1,23 @@
 # код/db.py
 import sqlite3
 import json
-from datetime import datetime, date
+from datetime import datetime, date, timezone
 import os
-from config import TIMEZONE
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import lru_cache
+from config import (
+    TIMEZONE, SQLITE_CACHE_SIZE_KB, SQLITE_MMAP_SIZE,
+    SQLITE_BUSY_TIMEOUT_MS, SQLITE_STATEMENT_CACHE, ACTIONS_RETENTION_MONTHS,
+    USER_CACHE_SIZE, USER_CACHE_TTL, SQLITE_GROUP_COMMIT_MS, SQLITE_GROUP_COMMIT_MAX
+)
+from database.cache import UserCache
+from database.migrations import migrate
+from database.migrations.sqlite import MIGRATIONS as SQLITE_MIGRATIONS
 import logging
 
 # Импорт pytz для обработки таймзон
@@ -50,13 +64,394 @@ sqlite3.register_adapter(date, lambda val: val.isoformat())
 sqlite3.register_converter("timestamp", decode_timestamp)
 sqlite3.register_converter("DATE", decode_date)
 
+# --- Кодирование details действий ---
+def encode_details(details):
+    """Компактный JSON без отступов и пробелов (details — самая объемная колонка самой большой таблицы)."""
+    return json.dumps(details, ensure_ascii=False, separators=(",", ":"))
+
+def decode_details(raw, action_id=None, user_id=None):
+    """Декодирует details из БД в dict; битый JSON возвращается с пометкой, как и раньше."""
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except (json.JSONDecodeError, TypeError) as e:
+        logger.warning(f"Failed to decode details JSON for action ID {action_id}, user {user_id}: {e}. Raw details: {raw}")
+        return {"error": "invalid_json", "raw_details": raw}
+
+def extract_hot_fields(details):
+    """Достает из details часто используемые поля для отдельных типизированных колонок."""
+    if not isinstance(details, dict):
+        return None, None, None
+    card_number = details.get("card_number", details.get("card"))
+    try:
+        card_number = int(card_number) if card_number is not None else None
+    except (TypeError, ValueError):
+        card_number = None
+    resource = details.get("resource")
+    resource = resource if isinstance(resource, str) else None
+    response = details.get("response")
+    response_len = len(response) if isinstance(response, str) else None
+    return card_number, resource, response_len
+
+def _action_row_to_dict(row, raw_details=False):
+    """Преобразует строку таблицы actions в словарь, который отдают get_actions/iter_actions."""
+    details = row["details"]
+    if not raw_details:
+        details = decode_details(details, action_id=row["id"], user_id=row["user_id"])
+    return {
+        "id": row["id"], "user_id": row["user_id"],
+        "username": row["username"], "name": row["name"],
+        "action": row["action"], "details": details,
+        "timestamp": row["timestamp"] or datetime.min.isoformat(),
+        "card_number": row["card_number"], "resource": row["resource"],
+        "response_len": row["response_len"],
+    }
+
+def _user_row_to_dict(row, user_id):
+    """Строка users (в формате хранения) -> словарь пользователя, который отдает get_user."""
+    user_dict = dict(row)
+    last_request_val = user_dict.get("last_request")
+    if last_request_val and isinstance(last_request_val, str):
+        try:
+            # Декодируем явно, т.к. тип TEXT
+            user_dict["last_request"] = decode_timestamp(last_request_val.encode('utf-8'))
+        except Exception as e:
+            logger.error(f"Error decoding last_request '{last_request_val}' for user {user_id}: {e}")
+            user_dict["last_request"] = None
+    elif not isinstance(last_request_val, datetime):
+        user_dict["last_request"] = None
+
+    user_dict.setdefault("bonus_available", False)
+    user_dict.setdefault("reminder_time_evening", None)
+    user_dict["bonus_available"] = bool(user_dict["bonus_available"])
+    return user_dict
+
+def _profile_row_to_dict(row, user_id):
+    """Строка user_profiles (в формате хранения) -> профиль с декодированными датами и JSON-полями."""
+    profile_dict = dict(row)
+    last_updated_val = profile_dict.get("last_updated")
+    if last_updated_val and isinstance(last_updated_val, str):
+        try: profile_dict["last_updated"] = decode_timestamp(last_updated_val.encode('utf-8'))
+        except Exception as e:
+            logger.error(f"Error decoding last_updated '{last_updated_val}' for profile user {user_id}: {e}")
+            profile_dict["last_updated"] = None
+    elif not isinstance(last_updated_val, datetime): profile_dict["last_updated"] = None
+
+    last_reflection_str = profile_dict.get("last_reflection_date")
+    if last_reflection_str and isinstance(last_reflection_str, str):
+        try: profile_dict["last_reflection_date"] = date.fromisoformat(last_reflection_str)
+        except (ValueError, TypeError) as e:
+            logger.error(f"Error parsing last_reflection_date string '{last_reflection_str}' for user {user_id}: {e}")
+            profile_dict["last_reflection_date"] = None
+    elif not isinstance(last_reflection_str, date): profile_dict["last_reflection_date"] = None
+
+    for field in ["mood_trend", "themes"]:
+        json_val = profile_dict.get(field)
+        if json_val and isinstance(json_val, str):
+            try: profile_dict[field] = json.loads(json_val)
+            except (json.JSONDecodeError, TypeError):
+                logger.warning(f"Failed to decode JSON for field '{field}' for user {user_id}. Value: {json_val}")
+                profile_dict[field] = []
+        elif profile_dict.get(field) is None: profile_dict[field] = []
+
+    profile_dict.setdefault("initial_resource", None)
+    profile_dict.setdefault("final_resource", None)
+    profile_dict.setdefault("recharge_method", None)
+    profile_dict["response_count"] = profile_dict.get("response_count") or 0
+    profile_dict["request_count"] = profile_dict.get("request_count") or 0
+    profile_dict["avg_response_length"] = profile_dict.get("avg_response_length") or 0.0
+    profile_dict["days_active"] = profile_dict.get("days_active") or 0
+    profile_dict["interactions_per_day"] = profile_dict.get("interactions_per_day") or 0.0
+    profile_dict["total_cards_drawn"] = profile_dict.get("total_cards_drawn") or 0
+    profile_dict["reflection_count"] = profile_dict.get("reflection_count") or 0
+
+    return profile_dict
+
+ACTION_COLUMNS = "id, user_id, username, name, action, details, timestamp, card_number, resource, response_len"
+ACTION_PARTITION_RE = re.compile(r"^actions_(\d{4})_(\d{2})$")
+ACTION_PARTITION_DDL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY, user_id INTEGER, username TEXT, name TEXT,
+        action TEXT NOT NULL, details TEXT, timestamp TEXT NOT NULL,
+        card_number INTEGER, resource TEXT, response_len INTEGER
+    )"""
+
+def _next_month(month):
+    """'YYYY-MM' -> следующий месяц в том же формате."""
+    year, mon = int(month[:4]), int(month[5:7])
+    return f"{year + mon // 12}-{mon % 12 + 1:02d}"
+
+def _previous_month(month):
+    """'YYYY-MM' -> предыдущий месяц в том же формате."""
+    year, mon = int(month[:4]), int(month[5:7])
+    return f"{year - 1}-12" if mon == 1 else f"{year}-{mon - 1:02d}"
+
+def utc_timestamp(value):
+    """
+    Приводит момент времени (datetime или ISO-строку, в т.ч. с 'Z') к формату колонки actions.timestamp:
+    ISO в UTC с микросекундами, '2024-05-10T09:00:00.000000+00:00'. Одно смещение и одна ширина у всех
+    строк — поэтому сравнение строк в SQL (since/until, keyset-пагинация, месячные партиции) совпадает
+    со сравнением времени. Наивное время считается временем TIMEZONE. Нераспознанную строку возвращает как есть.
+    """
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return value
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = TIMEZONE.localize(value) if pytz else value
+        return value.astimezone(timezone.utc).isoformat(timespec="microseconds")
+    return value
+
+
+def _action_timestamp(value):
+    """
+    timestamp для save_action: всегда в формате utc_timestamp, чтобы в таблицах действий не было строк
+    с другим смещением. Отсутствующее или нераспознанное значение заменяется текущим временем.
+    """
+    if isinstance(value, (datetime, str)):
+        timestamp = utc_timestamp(value)
+        if isinstance(timestamp, str) and timestamp.endswith("+00:00"):
+            return timestamp
+        logger.warning(f"Unparsable action timestamp {value!r}; using current time.")
+    return utc_timestamp(datetime.now(TIMEZONE))
+
+
+def _timestamp_bound(value):
+    """Граница интервала в формате колонки timestamp (см. utc_timestamp); дата — начало дня в TIMEZONE."""
+    if isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+    return utc_timestamp(value)
+
+# --- Колонки, которые можно обновлять частично ---
+USER_COLUMNS = ("name", "username", "last_request", "reminder_time", "reminder_time_evening", "bonus_available")
+USER_INSERT_DEFAULTS = {"name": "", "username": "", "bonus_available": 0}
+PROFILE_COLUMNS = (
+    "mood", "mood_trend", "themes", "response_count", "request_count", "avg_response_length",
+    "days_active", "interactions_per_day", "last_updated", "initial_resource", "final_resource",
+    "recharge_method", "total_cards_drawn", "last_reflection_date", "reflection_count",
+)
+
+@lru_cache(maxsize=128)
+def _upsert_sql(table, insert_columns, update_columns):
+    """Строит (и кэширует) UPSERT по user_id, обновляющий только update_columns."""
+    columns = ("user_id",) + insert_columns
+    placeholders = ", ".join("?" * len(columns))
+    if update_columns:
+        conflict = "DO UPDATE SET " + ", ".join(f"{col} = excluded.{col}" for col in update_columns)
+    else:
+        conflict = "DO NOTHING"
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders}) ON CONFLICT(user_id) {conflict}"
+
+# --- Настройки соединений ---
+DETECT_TYPES = sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
+
+def _apply_pragmas(conn, read_only=False):
+    """Применяет PRAGMA-настройки производительности к соединению."""
+    conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    if read_only:
+        conn.execute("PRAGMA query_only = ON")
+        return
+    # WAL позволяет читателям (sqlite_web, read_conn) не блокировать писателя и наоборот.
+    # Режим сохраняется в самом файле БД, поэтому включаем его только с пишущего соединения.
+    journal_mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+    if str(journal_mode).lower() != "wal":
+        logger.warning(f"Could not switch SQLite journal_mode to WAL (current: {journal_mode}).")
+    # В режиме WAL NORMAL безопасен для целостности и убирает fsync на каждый коммит.
+    conn.execute("PRAGMA synchronous = NORMAL")
+
+
+def _move_actions_to_partition(conn, table, bounds):
+    """Переносит действия месяца bounds из actions в партицию table (в транзакции писателя); возвращает число строк."""
+    conn.execute(ACTION_PARTITION_DDL.format(table=table))
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_user_timestamp ON {table} (user_id, timestamp)")
+    cursor = conn.execute(
+        f"INSERT INTO {table} ({ACTION_COLUMNS}) SELECT {ACTION_COLUMNS} FROM actions WHERE timestamp >= ? AND timestamp < ?",
+        bounds
+    )
+    conn.execute("DELETE FROM actions WHERE timestamp >= ? AND timestamp < ?", bounds)
+    return cursor.rowcount
+
+
+# save_action не требует user_id; такие действия сворачиваются под этим id, чтобы ретеншн их не терял
+ROLLUP_UNKNOWN_USER_ID = 0
+
+
+def _roll_up_partition(conn, table):
+    """
+    Сворачивает партицию table в дневные агрегаты и удаляет ее (в транзакции писателя).
+    responses — сколько из count действий несли текстовый ответ (response_len IS NOT NULL).
+    """
+    # WHERE true нужен SQLite, чтобы ON CONFLICT не разбирался как часть SELECT
+    conn.execute(f"""
+        INSERT INTO action_daily_rollups (user_id, day, action, count, responses)
+        SELECT COALESCE(user_id, {ROLLUP_UNKNOWN_USER_ID}), substr(timestamp, 1, 10), action, COUNT(*),
+               SUM(response_len IS NOT NULL) FROM {table}
+        WHERE true
+        GROUP BY COALESCE(user_id, {ROLLUP_UNKNOWN_USER_ID}), substr(timestamp, 1, 10), action
+        ON CONFLICT(user_id, day, action) DO UPDATE
+        SET count = count + excluded.count, responses = responses + excluded.responses
+    """)
+    conn.execute(f"DROP TABLE {table}")
+
+
+def _insert_default_user(conn, params):
+    """
+    Создает строку пользователя со значениями по умолчанию (в транзакции писателя). Два первых get_user
+    одного пользователя из пула чтения могут прийти сюда оба, поэтому INSERT OR IGNORE: если строка
+    уже есть, возвращает ее, иначе None.
+    """
+    cursor = conn.execute(
+        """INSERT OR IGNORE INTO users (user_id, name, username, last_request, reminder_time, reminder_time_evening, bonus_available)
+           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        params
+    )
+    if cursor.rowcount > 0:
+        return None
+    return conn.execute("SELECT * FROM users WHERE user_id = ?", (params[0],)).fetchone()
+
+
+def _execute_rowcount(conn, sql, params):
+    """Выполняет один оператор записи и возвращает число затронутых строк."""
+    return conn.execute(sql, params).rowcount
+
+
+class SQLiteWriter:
+    """
+    Единственный писатель SQLite: отдельный поток, который выполняет все записи на пишущем
+    соединении и коммитит их группами. Пока идет коммит, новые записи копятся в очереди и уходят
+    следующей группой (до max_batch штук) одной транзакцией — один коммит на группу вместо одного
+    на запись. window > 0 дополнительно ждет попутные записи после первой (имеет смысл при дорогом fsync).
+    Вызывающий получает результат только после коммита своей группы, так что гарантии долговечности
+    те же, что у отдельной транзакции. Каждая запись идет в своем SAVEPOINT: ошибка одной откатывает только ее.
+    """
+
+    def __init__(self, conn, window=SQLITE_GROUP_COMMIT_MS / 1000, max_batch=SQLITE_GROUP_COMMIT_MAX):
+        self.conn = conn
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        # Счетчики для тестов и бенчмарков: сколько было коммитов и сколько записей в них вошло
+        self.commits = 0
+        self.writes = 0
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args):
+        """Ставит fn(conn, *args) в очередь писателя; возвращает Future с ее результатом после коммита."""
+        if self._closed:
+            raise sqlite3.ProgrammingError("SQLite writer is closed")
+        future = Future()
+        self._queue.put((future, fn, args))
+        return future
+
+    def run(self, fn, *args):
+        """Выполняет fn(conn, *args) в транзакции писателя и ждет коммита (из потока писателя — сразу)."""
+        if threading.current_thread() is self._thread:
+            return fn(self.conn, *args)
+        return self.submit(fn, *args).result()
+
+    def execute(self, sql, params=()):
+        """Один оператор записи через писателя; возвращает rowcount."""
+        return self.run(_execute_rowcount, sql, params)
+
+    def close(self):
+        """Коммитит уже поставленные записи и останавливает поток."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        # Запись, проскочившая проверку _closed в submit одновременно с close, не должна ждать вечно
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and not item[0].done():
+                item[0].set_exception(sqlite3.ProgrammingError("SQLite writer is closed"))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stop = self._collect(batch)
+            self._commit(batch)
+            if stop:
+                return
+
+    def _collect(self, batch):
+        """Добирает в группу записи, пришедшие за окно; True, если пришел сигнал остановки."""
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                return False
+            if item is None:
+                return True
+            batch.append(item)
+        return False
+
+    def _commit(self, batch):
+        results = []
+        try:
+            # IMMEDIATE сразу берет блокировку записи: конкурировать может только внешний процесс
+            self.conn.execute("BEGIN IMMEDIATE")
+            for future, fn, args in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self.conn.execute("SAVEPOINT write")
+                try:
+                    results.append((future, fn(self.conn, *args), None))
+                except Exception as e:
+                    self.conn.execute("ROLLBACK TO write")
+                    results.append((future, None, e))
+                self.conn.execute("RELEASE write")
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Group commit of {len(batch)} writes failed: {e}", exc_info=True)
+            try:
+                self.conn.rollback()
+            except sqlite3.Error:
+                pass
+            for future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.commits += 1
+        self.writes += len(results)
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
 
 # --- КЛАСС Database ---
 class Database:
     def __init__(self, path="/data/bot.db"):
         """
         Инициализация соединения с БД.
+        In-memory SQLite не поддерживается: пишущее соединение занято потоком-писателем, а отдельных
+        read-only соединений к такой БД нет. Для тестов без файла есть database/memory_db.MemoryDatabase.
         """
+        if path == ":memory:" or path.startswith("file::memory:") or "mode=memory" in path:
+            raise ValueError(f"In-memory SQLite database '{path}' is not supported; use database.memory_db.MemoryDatabase.")
+        self.user_cache = UserCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+        # Read-only соединения открываются по одному на поток (см. read_conn)
+        self._read_local = threading.local()
+        self._read_conns = []
+        self._read_conns_lock = threading.Lock()
         db_dir = os.path.dirname(path)
         if db_dir and not os.path.exists(db_dir):
             try:
@@ -69,21 +464,60 @@ class Database:
 
         try:
             # Используем нужные detect_types
-            self.conn = sqlite3.connect(path, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+            self.path = path
+            self.conn = sqlite3.connect(path, check_same_thread=False, detect_types=DETECT_TYPES, cached_statements=SQLITE_STATEMENT_CACHE)
             logger.info(f"Database connection initialized at path: {path}")
             self.conn.row_factory = sqlite3.Row
+            _apply_pragmas(self.conn)
             self.bot = None # Устанавливается в main.py
 
-            self.create_tables()
-            self._run_migrations()
-            self.create_indexes()
+            # Один запрос версии схемы; таблицы, столбцы и индексы — только если есть новые миграции
+            migrate(self, SQLITE_MIGRATIONS)
+            # Дальше все записи идут через единственный поток-писатель с групповым коммитом
+            self.writer = SQLiteWriter(self.conn)
+        except sqlite3.Error as e:
+            logger.critical(f"Database initialization failed: Could not connect or migrate the schema at {path}. Error: {e}", exc_info=True)
+            raise
+
+    @property
+    def read_conn(self):
+        """
+        Read-only соединение текущего потока. Методы вызываются из пула потоков (database/async_db.py),
+        а одно sqlite3-соединение нельзя безопасно использовать из нескольких потоков одновременно.
+        """
+        conn = getattr(self._read_local, "conn", None)
+        if conn is None:
+            conn = self._open_read_connection(self.path)
+            self._read_local.conn = conn
+            with self._read_conns_lock:
+                self._read_conns.append(conn)
+        return conn
 
+    def warmup_connection(self):
+        """Открывает read-only соединение текущего потока заранее (см. AsyncDatabase.warmup)."""
+        self.read_conn
+
+    def _open_read_connection(self, path):
+        """
+        Открывает read-only соединение к тому же файлу БД. Основное соединение вместо него не отдается:
+        им пользуется поток-писатель внутри незакоммиченной группы. Ошибку пробрасывает — читающий метод
+        ее залогирует, а следующий вызов попробует открыть соединение снова.
+        """
+        uri = f"file:{os.path.abspath(path)}?mode=ro"
+        read_conn = None
+        try:
+            read_conn = sqlite3.connect(uri, uri=True, check_same_thread=False, detect_types=DETECT_TYPES, cached_statements=SQLITE_STATEMENT_CACHE)
+            read_conn.row_factory = sqlite3.Row
+            _apply_pragmas(read_conn, read_only=True)
+            return read_conn
         except sqlite3.Error as e:
-            logger.critical(f"Database initialization failed: Could not connect or setup tables/migrations/indexes at {path}. Error: {e}", exc_info=True)
+            logger.error(f"Could not open read-only connection to {path}: {e}", exc_info=True)
+            if read_conn is not None:
+                read_conn.close()
             raise
 
     # ... (остальные методы класса Database без изменений) ...
-    # create_tables, _run_migrations, _add_columns_if_not_exist, create_indexes,
+    # schema_version, migration_lock, record_migration,
     # get_user, update_user, get_user_cards, count_user_cards, add_user_card,
     # reset_user_cards, save_action, get_actions, get_reminder_times,
     # get_all_users, is_card_available, add_referral, get_referrals,
@@ -91,218 +525,102 @@ class Database:
     # get_last_reflection_date, count_reflections, get_all_reflection_texts,
     # add_recharge_method, get_last_recharge_method, close
 
-    def create_tables(self):
-        # ... (код create_tables без изменений) ...
-        """Создает все необходимые таблицы с ПОЛНОЙ АКТУАЛЬНОЙ СХЕМОЙ, если они не существуют."""
-        logger.info("Ensuring base table structures exist...")
-        try:
-            with self.conn:
-                # Таблица users
-                self.conn.execute("""
-                    CREATE TABLE IF NOT EXISTS users (
-                        user_id INTEGER PRIMARY KEY, name TEXT, username TEXT,
-                        last_request TEXT, reminder_time TEXT,
-                        reminder_time_evening TEXT, bonus_available BOOLEAN DEFAULT FALSE
-                    )""")
-                # Таблица user_cards
-                self.conn.execute("""
-                    CREATE TABLE IF NOT EXISTS user_cards (
-                        user_id INTEGER, card_number INTEGER,
-                        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-                    )""")
-                # Таблица actions
-                self.conn.execute("""
-                    CREATE TABLE IF NOT EXISTS actions (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, username TEXT, name TEXT,
-                        action TEXT NOT NULL, details TEXT, timestamp TEXT NOT NULL,
-                        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-                    )""")
-                # Таблица referrals
-                self.conn.execute("""
-                    CREATE TABLE IF NOT EXISTS referrals (
-                        referrer_id INTEGER, referred_id INTEGER UNIQUE,
-                        FOREIGN KEY (referrer_id) REFERENCES users(user_id) ON DELETE CASCADE,
-                        FOREIGN KEY (referred_id) REFERENCES users(user_id) ON DELETE CASCADE
-                    )""")
-                # Таблица feedback
-                self.conn.execute("""
-                    CREATE TABLE IF NOT EXISTS feedback (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, name TEXT,
-                        feedback TEXT NOT NULL, timestamp TEXT NOT NULL,
-                        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-                    )""")
-                # Таблица user_profiles
-                self.conn.execute("""
-                    CREATE TABLE IF NOT EXISTS user_profiles (
-                        user_id INTEGER PRIMARY KEY, mood TEXT, mood_trend TEXT, themes TEXT,
-                        response_count INTEGER DEFAULT 0, request_count INTEGER DEFAULT 0,
-                        avg_response_length REAL DEFAULT 0, days_active INTEGER DEFAULT 0,
-                        interactions_per_day REAL DEFAULT 0, last_updated TEXT,
-                        initial_resource TEXT, final_resource TEXT, recharge_method TEXT,
-                        total_cards_drawn INTEGER DEFAULT 0,
-                        last_reflection_date TEXT,
-                        reflection_count INTEGER DEFAULT 0,
-                        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-                    )""")
-                # Таблица evening_reflections
-                self.conn.execute("""
-                    CREATE TABLE IF NOT EXISTS evening_reflections (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,
-                        date TEXT NOT NULL, good_moments TEXT, gratitude TEXT, -- date здесь TEXT
-                        hard_moments TEXT, created_at TEXT NOT NULL, ai_summary TEXT,
-                        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-                    )""")
-                # Таблица user_recharge_methods
-                self.conn.execute("""
-                    CREATE TABLE IF NOT EXISTS user_recharge_methods (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER NOT NULL,
-                        method TEXT NOT NULL,
-                        timestamp TEXT NOT NULL,
-                        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-                    )""")
-
-            logger.info("Base table structures checked/created successfully.")
-        except sqlite3.Error as e:
-            logger.error(f"Error creating base database tables: {e}", exc_info=True)
-            raise
+    # --- Версия схемы (database/migrations) ---
 
-    def _run_migrations(self):
-        # ... (код миграций без изменений) ...
-        """Добавляет новые столбцы в СУЩЕСТВУЮЩИЕ таблицы (ALTER TABLE), если их нет."""
-        logger.info("Running database migrations (checking for missing columns)...")
+    def schema_version(self):
+        """Текущая версия схемы; 0 — БД создана до версионирования или пустая."""
         try:
-            profile_columns = {
-                'initial_resource': 'TEXT', 'final_resource': 'TEXT', 'recharge_method': 'TEXT',
-                'total_cards_drawn': 'INTEGER DEFAULT 0', 'last_reflection_date': 'TEXT',
-                'reflection_count': 'INTEGER DEFAULT 0',
-            }
-            self._add_columns_if_not_exist('user_profiles', profile_columns)
-            users_columns = { 'reminder_time_evening': 'TEXT' }
-            self._add_columns_if_not_exist('users', users_columns)
-            reflection_columns = { 'ai_summary': 'TEXT' }
-            self._add_columns_if_not_exist('evening_reflections', reflection_columns)
-            logger.info("Database migrations finished successfully.")
-        except Exception as e:
-            logger.error(f"Error during database migration process: {e}", exc_info=True)
+            row = self.conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+        except sqlite3.OperationalError:
+            return 0
+        return row[0] or 0
 
-    def _add_columns_if_not_exist(self, table_name, columns_to_add):
-        # ... (код без изменений) ...
-        """Вспомогательная функция для добавления столбцов через ALTER TABLE."""
-        logger.debug(f"Checking/Adding columns for table '{table_name}'...")
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute(f"PRAGMA table_info({table_name})")
-            existing_columns = [row['name'] for row in cursor.fetchall()]
-            logger.debug(f"Existing columns in {table_name}: {existing_columns}")
-            added_count = 0
-            for col_name, col_type in columns_to_add.items():
-                if col_name not in existing_columns:
-                    alter_sql = f"ALTER TABLE {table_name} ADD COLUMN {col_name} {col_type}"
-                    logger.info(f"Executing migration: {alter_sql}")
-                    cursor.execute(alter_sql)
-                    logger.info(f"Successfully added column '{col_name}' to {table_name}")
-                    added_count += 1
-                else:
-                    logger.debug(f"Column '{col_name}' already exists in {table_name}.")
-            if added_count > 0:
-                self.conn.commit()
-                logger.info(f"Committed {added_count} column additions for {table_name}.")
-        except sqlite3.Error as e:
-            logger.error(f"Database migration error for {table_name} adding columns: {e}", exc_info=True)
-            self.conn.rollback()
-            raise e
-
-    def create_indexes(self):
-        # ... (код без изменений) ...
-        """Создает все необходимые индексы, ЕСЛИ ОНИ НЕ СУЩЕСТВУЮТ."""
-        logger.info("Creating database indexes if they don't exist...")
-        try:
-            with self.conn:
-                self.conn.execute("CREATE INDEX IF NOT EXISTS idx_actions_user_timestamp ON actions (user_id, timestamp)")
-                self.conn.execute("CREATE INDEX IF NOT EXISTS idx_user_cards_user ON user_cards (user_id)")
-                self.conn.execute("CREATE INDEX IF NOT EXISTS idx_users_reminder_time ON users (reminder_time)")
-                self.conn.execute("CREATE INDEX IF NOT EXISTS idx_users_reminder_time_evening ON users (reminder_time_evening)")
-                self.conn.execute("CREATE INDEX IF NOT EXISTS idx_reflections_user_date ON evening_reflections (user_id, date)")
-                self.conn.execute("CREATE INDEX IF NOT EXISTS idx_recharge_user_timestamp ON user_recharge_methods (user_id, timestamp)")
-            logger.info("Indexes checked/created successfully.")
-        except sqlite3.Error as e:
-            logger.error(f"Error creating database indexes: {e}", exc_info=True)
+    @contextmanager
+    def migration_lock(self):
+        """Писатель у SQLite-файла один (процесс бота), поэтому достаточно создать таблицу версий."""
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TEXT NOT NULL)"
+            )
+        yield
+
+    def record_migration(self, version, name):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                (version, name, datetime.now(TIMEZONE).isoformat())
+            )
 
     def get_user(self, user_id):
         # ... (код метода get_user) ...
-        """Получает данные пользователя. Если не найден, создает запись."""
+        """Получает данные пользователя (сначала из кэша). Если не найден, создает запись."""
+        user_dict = self.user_cache.get(user_id)
+        if user_dict is not None:
+            return user_dict
+        generation = self.user_cache.generation(user_id)
+        user_dict = self._load_user(user_id)
+        if user_dict is None:
+            # Ошибку БД не кэшируем, возвращаем пустого пользователя как раньше
+            return {"user_id": user_id, "name": "", "username": "", "last_request": None, "reminder_time": None, "reminder_time_evening": None, "bonus_available": False}
+        self.user_cache.set(user_id, user_dict, generation)
+        return user_dict
+
+    def _load_user(self, user_id):
+        """Читает строку пользователя из БД, создавая ее при отсутствии. None — при ошибке БД."""
         try:
-            cursor = self.conn.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
+            cursor = self.read_conn.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
             row = cursor.fetchone()
             if row:
-                user_dict = dict(row)
-                last_request_val = user_dict.get("last_request")
-                if last_request_val and isinstance(last_request_val, str):
-                    try:
-                        # Декодируем явно, т.к. тип TEXT
-                        user_dict["last_request"] = decode_timestamp(last_request_val.encode('utf-8'))
-                    except Exception as e:
-                         logger.error(f"Error decoding last_request '{last_request_val}' for user {user_id}: {e}")
-                         user_dict["last_request"] = None
-                elif not isinstance(last_request_val, datetime):
-                     user_dict["last_request"] = None
-
-                user_dict.setdefault("bonus_available", False)
-                user_dict.setdefault("reminder_time_evening", None)
-                user_dict["bonus_available"] = bool(user_dict["bonus_available"])
-                return user_dict
+                return _user_row_to_dict(row, user_id)
 
             logger.info(f"User {user_id} not found in 'users' table, creating default entry.")
             default_user_data = {
                 "user_id": user_id, "name": "", "username": "", "last_request": None,
                 "reminder_time": None, "reminder_time_evening": None, "bonus_available": False
             }
-            with self.conn:
-                self.conn.execute(
-                    """INSERT INTO users (user_id, name, username, last_request, reminder_time, reminder_time_evening, bonus_available)
-                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                    (user_id, default_user_data["name"], default_user_data["username"], None,
-                     default_user_data["reminder_time"], default_user_data["reminder_time_evening"],
-                     int(default_user_data["bonus_available"]))
-                )
+            existing = self.writer.run(
+                _insert_default_user,
+                (user_id, default_user_data["name"], default_user_data["username"], None,
+                 default_user_data["reminder_time"], default_user_data["reminder_time_evening"],
+                 int(default_user_data["bonus_available"]))
+            )
+            if existing is not None:
+                # Строку успел создать параллельный get_user/update_user — отдаем ее, а не значения по умолчанию
+                return _user_row_to_dict(existing, user_id)
             logger.info(f"Default user entry created for {user_id}")
             return default_user_data
         except sqlite3.Error as e:
             logger.error(f"Failed to get or create user {user_id}: {e}", exc_info=True)
-            return {"user_id": user_id, "name": "", "username": "", "last_request": None, "reminder_time": None, "reminder_time_evening": None, "bonus_available": False}
+            return None
 
     def update_user(self, user_id, data):
         # ... (код метода update_user) ...
-        """Обновляет данные пользователя (INSERT OR REPLACE)."""
-        current_user_data = self.get_user(user_id)
-        name_to_save = data.get("name", current_user_data.get("name", ""))
-        username_to_save = data.get("username", current_user_data.get("username", ""))
-        reminder_to_save = data.get("reminder_time", current_user_data.get("reminder_time"))
-        reminder_evening_to_save = data.get("reminder_time_evening", current_user_data.get("reminder_time_evening"))
-        bonus_to_save = data.get("bonus_available", current_user_data.get("bonus_available", False))
-        last_request_to_save = None
-        last_request_input = data.get("last_request", current_user_data.get("last_request"))
-        if isinstance(last_request_input, datetime):
-            last_request_to_save = last_request_input.isoformat()
-        elif isinstance(last_request_input, str):
-             last_request_to_save = last_request_input
+        """Обновляет только переданные поля пользователя одним UPSERT-ом (без чтения строки перед записью)."""
+        changes = {}
+        for key, value in data.items():
+            if key not in USER_COLUMNS:
+                logger.warning(f"update_user: ignoring unknown column '{key}' for user {user_id}")
+                continue
+            if key == "last_request":
+                value = value.isoformat() if isinstance(value, datetime) else (value if isinstance(value, str) else None)
+            elif key == "bonus_available":
+                value = int(bool(value))
+            changes[key] = value
+        # Новая строка получает те же значения по умолчанию, что и в get_user
+        row = {**USER_INSERT_DEFAULTS, **changes}
         try:
-            with self.conn:
-                self.conn.execute("""
-                    INSERT OR REPLACE INTO users (user_id, name, username, last_request, reminder_time, reminder_time_evening, bonus_available)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, ( user_id, name_to_save, username_to_save, last_request_to_save,
-                       reminder_to_save, reminder_evening_to_save, int(bonus_to_save) ))
+            self.writer.execute(_upsert_sql("users", tuple(row), tuple(changes)), (user_id, *row.values()))
         except sqlite3.Error as e:
             logger.error(f"Failed to update user {user_id}: {e}", exc_info=True)
+        finally:
+            self.user_cache.invalidate(user_id)
 
 
     def get_user_cards(self, user_id):
         # ... (код метода get_user_cards) ...
         """Возвращает список номеров карт, использованных пользователем."""
         try:
-            cursor = self.conn.execute("SELECT card_number FROM user_cards WHERE user_id = ?", (user_id,))
+            cursor = self.read_conn.execute("SELECT card_number FROM user_cards WHERE user_id = ?", (user_id,))
             return [row["card_number"] for row in cursor.fetchall()]
         except sqlite3.Error as e:
             logger.error(f"Failed to get user cards for {user_id}: {e}", exc_info=True)
@@ -312,7 +630,7 @@ class Database:
         # ... (код метода count_user_cards) ...
         """Возвращает количество карт, вытянутых пользователем."""
         try:
-            cursor = self.conn.execute("SELECT COUNT(*) FROM user_cards WHERE user_id = ?", (user_id,))
+            cursor = self.read_conn.execute("SELECT COUNT(*) FROM user_cards WHERE user_id = ?", (user_id,))
             result = cursor.fetchone()
             return result[0] if result else 0
         except sqlite3.Error as e:
@@ -323,8 +641,7 @@ class Database:
         # ... (код метода add_user_card) ...
         """Добавляет запись об использованной карте."""
         try:
-            with self.conn:
-                self.conn.execute("INSERT INTO user_cards (user_id, card_number) VALUES (?, ?)", (user_id, card_number))
+            self.writer.execute("INSERT INTO user_cards (user_id, card_number) VALUES (?, ?)", (user_id, card_number))
         except sqlite3.Error as e:
             logger.error(f"Failed to add user card {card_number} for {user_id}: {e}", exc_info=True)
 
@@ -332,8 +649,7 @@ class Database:
         # ... (код метода reset_user_cards) ...
         """Удаляет все записи об использованных картах для пользователя."""
         try:
-            with self.conn:
-                self.conn.execute("DELETE FROM user_cards WHERE user_id = ?", (user_id,))
+            self.writer.execute("DELETE FROM user_cards WHERE user_id = ?", (user_id,))
             logger.info(f"Reset used cards for user {user_id}")
         except sqlite3.Error as e:
             logger.error(f"Failed to reset user cards for {user_id}: {e}", exc_info=True)
@@ -341,69 +657,313 @@ class Database:
     def save_action(self, user_id, username, name, action, details, timestamp):
         # ... (код метода save_action) ...
         """Сохраняет запись о действии пользователя."""
-        timestamp_str = None
-        if isinstance(timestamp, datetime): timestamp_str = timestamp.isoformat()
-        elif isinstance(timestamp, str): timestamp_str = timestamp
-        else: timestamp_str = datetime.now(TIMEZONE).isoformat()
+        timestamp_str = _action_timestamp(timestamp)
         details_json = None
         if details is not None:
-            try: details_json = json.dumps(details, ensure_ascii=False, indent=2)
+            try: details_json = encode_details(details)
             except TypeError as e:
                 logger.error(f"Failed to serialize details for action '{action}', user {user_id}: {e}. Details: {details}")
-                details_json = json.dumps({"error": "serialization_failed", "original_details_type": str(type(details))})
+                details_json = encode_details({"error": "serialization_failed", "original_details_type": str(type(details))})
+        card_number, resource, response_len = extract_hot_fields(details)
         try:
-            with self.conn:
-                self.conn.execute(
-                    "INSERT INTO actions (user_id, username, name, action, details, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
-                    (user_id, username, name, action, details_json, timestamp_str)
-                )
+            self.writer.execute(
+                """INSERT INTO actions (user_id, username, name, action, details, timestamp, card_number, resource, response_len)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (user_id, username, name, action, details_json, timestamp_str, card_number, resource, response_len)
+            )
         except sqlite3.Error as e:
             logger.error(f"Failed to save action '{action}' for user {user_id}: {e}. Details JSON: {details_json}", exc_info=True)
 
-    def get_actions(self, user_id=None):
+    def get_actions(self, user_id=None, raw_details=False):
         # ... (код метода get_actions) ...
-        """Получает список действий пользователя (или всех), отсортированных по времени."""
-        actions = []
+        """
+        Получает список действий пользователя (или всех), отсортированных по времени.
+        При raw_details=True поле details остается сырой JSON-строкой (декодируется по требованию
+        через decode_details()), а горячие поля доступны как card_number/resource/response_len.
+        Для больших выборок используйте iter_actions().
+        """
+        return list(self.iter_actions(user_id=user_id, raw_details=raw_details))
+
+    def iter_actions(self, user_id=None, since=None, until=None, types=None, limit=None, batch_size=500, raw_details=False):
+        """
+        Лениво отдает действия в порядке (timestamp, id), подгружая их пачками по batch_size.
+        Фильтры выполняются в SQL по индексам: since включительно, until — исключительно,
+        types — список значений action. Пагинация keyset-ом, поэтому память не растет с объемом таблицы.
+        Читаются только месячные партиции, пересекающиеся с [since, until): запросы за последние дни
+        затрагивают лишь текущую таблицу actions.
+        """
+        conditions, params = [], []
+        if user_id:
+            conditions.append("user_id = ?"); params.append(user_id)
+        if since is not None:
+            since = _timestamp_bound(since)
+            conditions.append("timestamp >= ?"); params.append(since)
+        if until is not None:
+            until = _timestamp_bound(until)
+            conditions.append("timestamp < ?"); params.append(until)
+        if types:
+            types = list(types)
+            conditions.append(f"action IN ({', '.join('?' * len(types))})"); params.extend(types)
+
+        remaining = limit
+        for table in self._action_tables_for_range(since, until):
+            for action in self._iter_action_table(table, conditions, params, remaining, batch_size, raw_details):
+                yield action
+                if remaining is not None:
+                    remaining -= 1
+            if remaining is not None and remaining <= 0:
+                return
+
+    def _iter_action_table(self, table, conditions, params, limit, batch_size, raw_details):
+        """Keyset-пагинация по одной таблице действий (actions или месячной партиции)."""
+        remaining = limit
+        last_key = None
+        while remaining is None or remaining > 0:
+            page_size = batch_size if remaining is None else min(batch_size, remaining)
+            page_conditions, page_params = list(conditions), list(params)
+            if last_key is not None:
+                page_conditions.append("(timestamp > ? OR (timestamp = ? AND id > ?))")
+                page_params.extend([last_key[0], last_key[0], last_key[1]])
+            where = f" WHERE {' AND '.join(page_conditions)}" if page_conditions else ""
+            sql = (f"SELECT id, user_id, username, name, action, details, timestamp, card_number, resource, response_len "
+                   f"FROM {table}{where} ORDER BY timestamp, id LIMIT ?")
+            try:
+                rows = self.read_conn.execute(sql, (*page_params, page_size)).fetchall()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to iterate actions in {table}: {e}", exc_info=True)
+                return
+            for row in rows:
+                yield _action_row_to_dict(row, raw_details)
+            if len(rows) < page_size:
+                return
+            if remaining is not None:
+                remaining -= len(rows)
+            last_key = (rows[-1]["timestamp"], rows[-1]["id"])
+
+    def get_action_totals(self, user_id, types):
+        """
+        Итоги по всей истории пользователя без чтения самих строк: count — число действий из types,
+        responses — сколько из них с текстовым ответом (details["response"] — строка, см. response_len),
+        first_day — день первого любого действия (date в TIMEZONE). Учитывает и сырые строки (actions и
+        партиции, по индексу user_id), и дневные агрегаты ретеншна, поэтому не уменьшается,
+        когда старые месяцы сворачиваются.
+        """
+        types = list(types)
+        in_types = ", ".join("?" * len(types)) or "NULL"
+        count, responses, first_days = 0, 0, []
         try:
-            sql = "SELECT id, user_id, username, name, action, details, timestamp FROM actions"
-            params = []
-            if user_id:
-                sql += " WHERE user_id = ?"
-                params.append(user_id)
-            sql += " ORDER BY timestamp ASC"
-            cursor = self.conn.execute(sql, params)
-            for row in cursor.fetchall():
-                row_dict = dict(row)
-                details_dict = {}
-                if row_dict.get("details"):
-                    try: details_dict = json.loads(row_dict["details"])
-                    except (json.JSONDecodeError, TypeError) as e:
-                        logger.warning(f"Failed to decode details JSON for action ID {row_dict.get('id')}, user {row_dict.get('user_id')}: {e}. Raw details: {row_dict['details']}")
-                        details_dict = {"error": "invalid_json", "raw_details": row_dict["details"]}
-                timestamp_str = row_dict.get("timestamp", datetime.min.isoformat())
-                actions.append({
-                    "id": row_dict.get("id"), "user_id": row_dict.get("user_id"),
-                    "username": row_dict.get("username"), "name": row_dict.get("name"),
-                    "action": row_dict.get("action"), "details": details_dict,
-                    "timestamp": timestamp_str
-                })
+            for table in self._action_tables_for_range():
+                row = self.read_conn.execute(
+                    f"SELECT SUM(action IN ({in_types})), SUM(action IN ({in_types}) AND response_len IS NOT NULL), MIN(timestamp) "
+                    f"FROM {table} WHERE user_id = ?",
+                    (*types, *types, user_id)
+                ).fetchone()
+                count += row[0] or 0
+                responses += row[1] or 0
+                first = decode_timestamp(row[2].encode("utf-8")) if row[2] else None
+                if first is not None:
+                    first_days.append((first.astimezone(TIMEZONE) if first.tzinfo else first).date())
+            row = self.read_conn.execute(
+                f"SELECT SUM(CASE WHEN action IN ({in_types}) THEN count ELSE 0 END), "
+                f"SUM(CASE WHEN action IN ({in_types}) THEN responses ELSE 0 END), MIN(day) "
+                f"FROM action_daily_rollups WHERE user_id = ?",
+                (*types, *types, user_id)
+            ).fetchone()
+            count += row[0] or 0
+            responses += row[1] or 0
+            if row[2]:
+                first_days.append(date.fromisoformat(row[2]))
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Failed to get action totals for user {user_id}: {e}", exc_info=True)
+        return {"count": count, "responses": responses, "first_day": min(first_days) if first_days else None}
+
+    # --- Месячные партиции действий и ретеншн ---
+
+    def _action_partitions(self):
+        """Возвращает отсортированный по времени список [(month 'YYYY-MM', table_name)] архивных партиций."""
+        try:
+            rows = self.read_conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'actions_%'"
+            ).fetchall()
         except sqlite3.Error as e:
-            logger.error(f"Failed to get actions (user_id: {user_id}): {e}", exc_info=True)
-        return actions
+            logger.error(f"Failed to list action partitions: {e}", exc_info=True)
+            return []
+        partitions = []
+        for row in rows:
+            match = ACTION_PARTITION_RE.match(row["name"])
+            if match:
+                partitions.append((f"{match.group(1)}-{match.group(2)}", row["name"]))
+        return sorted(partitions)
+
+    def _action_tables_for_range(self, since=None, until=None):
+        """Партиции, пересекающиеся с [since, until), в хронологическом порядке, и в конце — текущая actions."""
+        tables = []
+        for month, table in self._action_partitions():
+            if since is not None and _next_month(month) <= since[:7]:
+                continue
+            if until is not None and month > until[:7]:
+                continue
+            tables.append(table)
+        tables.append("actions")
+        return tables
+
+    def rotate_action_partitions(self, now=None):
+        """
+        Переносит действия прошлых месяцев из горячей таблицы actions в таблицы actions_YYYY_MM.
+        Каждый месяц переносится отдельной транзакцией. Возвращает число перенесенных строк.
+        """
+        # Месяцы партиций — по UTC, как и хранимые timestamp
+        current_month = (now or datetime.now(TIMEZONE)).astimezone(timezone.utc).strftime("%Y-%m")
+        moved = 0
+        try:
+            months = [row[0] for row in self.read_conn.execute(
+                "SELECT DISTINCT substr(timestamp, 1, 7) FROM actions WHERE timestamp < ?", (current_month,)
+            ).fetchall()]
+            for month in sorted(months):
+                if not re.fullmatch(r"\d{4}-\d{2}", month or ""):
+                    logger.warning(f"Skipping actions with unparsable timestamp month '{month}' during rotation.")
+                    continue
+                table = f"actions_{month.replace('-', '_')}"
+                bounds = (month, _next_month(month))
+                month_moved = self.writer.run(_move_actions_to_partition, table, bounds)
+                moved += month_moved
+                logger.info(f"Moved {month_moved} actions of {month} into partition {table}.")
+        except sqlite3.Error as e:
+            logger.error(f"Failed to rotate action partitions: {e}", exc_info=True)
+        return moved
+
+    def apply_action_retention(self, keep_months=ACTIONS_RETENTION_MONTHS, now=None):
+        """
+        Сворачивает партиции старше keep_months месяцев в дневные агрегаты
+        action_daily_rollups (user_id, day, action, count, responses; day — дата по UTC, как timestamp) и удаляет их сырые строки.
+        Действия без user_id сворачиваются под ROLLUP_UNKNOWN_USER_ID. Возвращает число удаленных партиций.
+        """
+        cutoff_month = (now or datetime.now(TIMEZONE)).astimezone(timezone.utc).strftime("%Y-%m")
+        for _ in range(keep_months):
+            cutoff_month = _previous_month(cutoff_month)
+        dropped = 0
+        for month, table in self._action_partitions():
+            if month >= cutoff_month:
+                break
+            try:
+                self.writer.run(_roll_up_partition, table)
+                dropped += 1
+                logger.info(f"Rolled up and dropped action partition {table}.")
+            except sqlite3.Error as e:
+                logger.error(f"Failed to apply retention to partition {table}: {e}", exc_info=True)
+                break
+        return dropped
+
+    def run_action_maintenance(self):
+        """Ежедневное обслуживание действий: ротация партиций и ретеншн (вызывается планировщиком)."""
+        moved = self.rotate_action_partitions()
+        dropped = self.apply_action_retention()
+        logger.info(f"Action maintenance finished: moved {moved} rows, dropped {dropped} partitions.")
+        return {"moved": moved, "dropped": dropped}
+
+    def compact_action_details(self, batch_size=1000):
+        """
+        Однократная миграция: переписывает details старых действий в компактный JSON
+        (раньше писался с indent=2) и заполняет колонки card_number/resource/response_len.
+        Идет пачками по id, каждая пачка — отдельная транзакция.
+        """
+        logger.info("Compacting actions.details and backfilling hot columns...")
+        last_id = 0
+        updated = 0
+        try:
+            while True:
+                rows = self.conn.execute(
+                    "SELECT id, details FROM actions WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+                ).fetchall()
+                if not rows:
+                    break
+                updates = []
+                for row in rows:
+                    raw = row["details"]
+                    try:
+                        details = json.loads(raw) if raw else None
+                    except (json.JSONDecodeError, TypeError):
+                        # Битый JSON оставляем как есть, чтобы не потерять исходные данные
+                        updates.append((raw, None, None, None, row["id"]))
+                        continue
+                    compact = encode_details(details) if raw else raw
+                    updates.append((compact, *extract_hot_fields(details), row["id"]))
+                with self.conn:
+                    self.conn.executemany(
+                        "UPDATE actions SET details = ?, card_number = ?, resource = ?, response_len = ? WHERE id = ?", updates
+                    )
+                updated += len(updates)
+                last_id = rows[-1]["id"]
+            logger.info(f"Compacted details for {updated} actions.")
+        except sqlite3.Error as e:
+            logger.error(f"Failed to compact action details (stopped after id {last_id}): {e}", exc_info=True)
+        return updated
+
+    def normalize_action_timestamps(self, batch_size=1000):
+        """
+        Однократная миграция: переписывает timestamp действий в формат utc_timestamp в actions и во всех
+        партициях, пачками по id (каждая пачка — отдельная транзакция). Строки партиции, которые после
+        перевода в UTC попали в другой месяц, возвращаются в горячую actions — их разложит следующая ротация.
+        """
+        logger.info("Normalizing action timestamps to UTC...")
+        updated = 0
+        try:
+            for table in self._action_tables_for_range():
+                last_id = 0
+                while True:
+                    rows = self.conn.execute(
+                        f"SELECT id, timestamp FROM {table} WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+                    ).fetchall()
+                    if not rows:
+                        break
+                    updates = []
+                    for row in rows:
+                        normalized = utc_timestamp(row["timestamp"]) if row["timestamp"] else row["timestamp"]
+                        if normalized != row["timestamp"]:
+                            updates.append((normalized, row["id"]))
+                    with self.conn:
+                        self.conn.executemany(f"UPDATE {table} SET timestamp = ? WHERE id = ?", updates)
+                    updated += len(updates)
+                    last_id = rows[-1]["id"]
+                if table != "actions":
+                    month = table[len("actions_"):].replace("_", "-")
+                    with self.conn:
+                        self.conn.execute(
+                            f"INSERT INTO actions ({ACTION_COLUMNS}) SELECT {ACTION_COLUMNS} FROM {table} WHERE substr(timestamp, 1, 7) != ?",
+                            (month,)
+                        )
+                        self.conn.execute(f"DELETE FROM {table} WHERE substr(timestamp, 1, 7) != ?", (month,))
+            logger.info(f"Normalized timestamps of {updated} actions.")
+        except sqlite3.Error as e:
+            logger.error(f"Failed to normalize action timestamps: {e}", exc_info=True)
+            raise
+        return updated
 
     def get_reminder_times(self):
         # ... (код метода get_reminder_times) ...
-        """Возвращает словарь {user_id: {'morning': time, 'evening': time}} для пользователей с установленными напоминаниями."""
+        """
+        Возвращает словарь {user_id: {'morning', 'evening', 'name', 'bonus_available', 'last_request'}}
+        для пользователей с установленными напоминаниями — всё, что нужно для рассылки, одним запросом.
+        """
         reminders = {}
         try:
-            cursor = self.conn.execute("""
-                SELECT user_id, reminder_time, reminder_time_evening
+            cursor = self.read_conn.execute("""
+                SELECT user_id, reminder_time, reminder_time_evening, name, bonus_available, last_request
                 FROM users WHERE reminder_time IS NOT NULL OR reminder_time_evening IS NOT NULL
             """)
             for row in cursor.fetchall():
+                last_request = row["last_request"]
+                if isinstance(last_request, str):
+                    try:
+                        last_request = decode_timestamp(last_request.encode('utf-8'))
+                    except Exception:
+                        last_request = None
                 reminders[row["user_id"]] = {
                     'morning': row["reminder_time"],
-                    'evening': row["reminder_time_evening"]
+                    'evening': row["reminder_time_evening"],
+                    'name': row["name"] or "",
+                    'bonus_available': bool(row["bonus_available"]),
+                    'last_request': last_request if isinstance(last_request, datetime) else None
                 }
             return reminders
         except sqlite3.Error as e:
@@ -414,16 +974,17 @@ class Database:
         # ... (код метода get_all_users) ...
         """Возвращает список всех user_id."""
         try:
-            cursor = self.conn.execute("SELECT user_id FROM users")
+            cursor = self.read_conn.execute("SELECT user_id FROM users")
             return [row["user_id"] for row in cursor.fetchall()]
         except sqlite3.Error as e:
             logger.error(f"Failed to get all users: {e}", exc_info=True)
             return []
 
-    def is_card_available(self, user_id, today_date: date):
+    def is_card_available(self, user_id, today_date: date, user_data=None):
         # ... (код метода is_card_available) ...
-        """Проверяет, доступна ли карта дня для пользователя сегодня."""
-        user_data = self.get_user(user_id)
+        """Проверяет, доступна ли карта дня для пользователя сегодня. user_data — уже загруженная строка пользователя."""
+        if user_data is None:
+            user_data = self.get_user(user_id)
         if not user_data: return True
         last_request_dt = user_data.get("last_request") # datetime или None
         if isinstance(last_request_dt, datetime):
@@ -439,14 +1000,13 @@ class Database:
         # ... (код метода add_referral) ...
         """Добавляет запись о реферале (если такой еще не существует)."""
         try:
-            with self.conn:
-                cursor = self.conn.execute("INSERT OR IGNORE INTO referrals (referrer_id, referred_id) VALUES (?, ?)", (referrer_id, referred_id))
-                if cursor.rowcount > 0:
-                    logger.info(f"Referral added: referrer {referrer_id}, referred {referred_id}")
-                    return True
-                else:
-                    logger.info(f"Referral already exists or failed: referrer {referrer_id}, referred {referred_id}")
-                    return False
+            inserted = self.writer.execute("INSERT OR IGNORE INTO referrals (referrer_id, referred_id) VALUES (?, ?)", (referrer_id, referred_id))
+            if inserted > 0:
+                logger.info(f"Referral added: referrer {referrer_id}, referred {referred_id}")
+                return True
+            else:
+                logger.info(f"Referral already exists or failed: referrer {referrer_id}, referred {referred_id}")
+                return False
         except sqlite3.Error as e:
             logger.error(f"Failed to add referral ({referrer_id} -> {referred_id}): {e}", exc_info=True)
             return False
@@ -455,7 +1015,7 @@ class Database:
         # ... (код метода get_referrals) ...
         """Возвращает список ID пользователей, приглашенных данным пользователем."""
         try:
-            cursor = self.conn.execute("SELECT referred_id FROM referrals WHERE referrer_id = ?", (referrer_id,))
+            cursor = self.read_conn.execute("SELECT referred_id FROM referrals WHERE referrer_id = ?", (referrer_id,))
             return [row["referred_id"] for row in cursor.fetchall()]
         except sqlite3.Error as e:
             logger.error(f"Failed to get referrals for {referrer_id}: {e}", exc_info=True)
@@ -465,47 +1025,10 @@ class Database:
         # ... (код метода get_user_profile) ...
         """Получает профиль пользователя из таблицы user_profiles."""
         try:
-            cursor = self.conn.execute("SELECT * FROM user_profiles WHERE user_id = ?", (user_id,))
+            cursor = self.read_conn.execute("SELECT * FROM user_profiles WHERE user_id = ?", (user_id,))
             row = cursor.fetchone()
             if row:
-                profile_dict = dict(row)
-                last_updated_val = profile_dict.get("last_updated")
-                if last_updated_val and isinstance(last_updated_val, str):
-                    try: profile_dict["last_updated"] = decode_timestamp(last_updated_val.encode('utf-8'))
-                    except Exception as e:
-                         logger.error(f"Error decoding last_updated '{last_updated_val}' for profile user {user_id}: {e}")
-                         profile_dict["last_updated"] = None
-                elif not isinstance(last_updated_val, datetime): profile_dict["last_updated"] = None
-
-                last_reflection_str = profile_dict.get("last_reflection_date")
-                if last_reflection_str and isinstance(last_reflection_str, str):
-                     try: profile_dict["last_reflection_date"] = date.fromisoformat(last_reflection_str)
-                     except (ValueError, TypeError) as e:
-                         logger.error(f"Error parsing last_reflection_date string '{last_reflection_str}' for user {user_id}: {e}")
-                         profile_dict["last_reflection_date"] = None
-                elif not isinstance(last_reflection_str, date): profile_dict["last_reflection_date"] = None
-
-                for field in ["mood_trend", "themes"]:
-                    json_val = profile_dict.get(field)
-                    if json_val and isinstance(json_val, str):
-                        try: profile_dict[field] = json.loads(json_val)
-                        except (json.JSONDecodeError, TypeError):
-                            logger.warning(f"Failed to decode JSON for field '{field}' for user {user_id}. Value: {json_val}")
-                            profile_dict[field] = []
-                    elif profile_dict.get(field) is None: profile_dict[field] = []
-
-                profile_dict.setdefault("initial_resource", None)
-                profile_dict.setdefault("final_resource", None)
-                profile_dict.setdefault("recharge_method", None)
-                profile_dict["response_count"] = profile_dict.get("response_count") or 0
-                profile_dict["request_count"] = profile_dict.get("request_count") or 0
-                profile_dict["avg_response_length"] = profile_dict.get("avg_response_length") or 0.0
-                profile_dict["days_active"] = profile_dict.get("days_active") or 0
-                profile_dict["interactions_per_day"] = profile_dict.get("interactions_per_day") or 0.0
-                profile_dict["total_cards_drawn"] = profile_dict.get("total_cards_drawn") or 0
-                profile_dict["reflection_count"] = profile_dict.get("reflection_count") or 0
-
-                return profile_dict
+                return _profile_row_to_dict(row, user_id)
             return None
         except sqlite3.Error as e:
             logger.error(f"Failed to get user profile for {user_id}: {e}", exc_info=True)
@@ -513,48 +1036,23 @@ class Database:
 
     def update_user_profile(self, user_id, profile_update_data):
         # ... (код метода update_user_profile) ...
-        """Обновляет профиль пользователя (INSERT OR REPLACE)."""
-        current_profile = self.get_user_profile(user_id) or {}
-        last_updated_dt = profile_update_data.get("last_updated", datetime.now(TIMEZONE))
-        last_updated_iso = last_updated_dt.isoformat() if isinstance(last_updated_dt, datetime) else datetime.now(TIMEZONE).isoformat()
-        last_reflection_date_to_save = None
-        last_reflection_input = profile_update_data.get("last_reflection_date", current_profile.get("last_reflection_date"))
-        if isinstance(last_reflection_input, date): last_reflection_date_to_save = last_reflection_input.isoformat()
-        elif isinstance(last_reflection_input, str): last_reflection_date_to_save = last_reflection_input
-
-        profile_to_save = {
-            "user_id": user_id,
-            "mood": profile_update_data.get("mood", current_profile.get("mood")),
-            "mood_trend": json.dumps(profile_update_data.get("mood_trend", current_profile.get("mood_trend", []))),
-            "themes": json.dumps(profile_update_data.get("themes", current_profile.get("themes", []))),
-            "response_count": profile_update_data.get("response_count", current_profile.get("response_count", 0)),
-            "request_count": profile_update_data.get("request_count", current_profile.get("request_count", 0)),
-            "avg_response_length": profile_update_data.get("avg_response_length", current_profile.get("avg_response_length", 0.0)),
-            "days_active": profile_update_data.get("days_active", current_profile.get("days_active", 0)),
-            "interactions_per_day": profile_update_data.get("interactions_per_day", current_profile.get("interactions_per_day", 0.0)),
-            "last_updated": last_updated_iso,
-            "initial_resource": profile_update_data.get("initial_resource", current_profile.get("initial_resource")),
-            "final_resource": profile_update_data.get("final_resource", current_profile.get("final_resource")),
-            "recharge_method": profile_update_data.get("recharge_method", current_profile.get("recharge_method")),
-            "total_cards_drawn": profile_update_data.get("total_cards_drawn", current_profile.get("total_cards_drawn", 0)),
-            "last_reflection_date": last_reflection_date_to_save,
-            "reflection_count": profile_update_data.get("reflection_count", current_profile.get("reflection_count", 0)),
-        }
+        """Обновляет только переданные поля профиля одним UPSERT-ом (UPSERT по user_id)."""
+        changes = {}
+        for key, value in profile_update_data.items():
+            if key not in PROFILE_COLUMNS:
+                if key != "user_id":
+                    logger.debug(f"update_user_profile: ignoring unknown field '{key}' for user {user_id}")
+                continue
+            if key in ("mood_trend", "themes"):
+                value = json.dumps(value if value is not None else [], ensure_ascii=False)
+            elif key == "last_reflection_date":
+                value = value.isoformat() if isinstance(value, date) else (value if isinstance(value, str) else None)
+            changes[key] = value
+        # last_updated обновляется при каждой записи, как и раньше
+        last_updated_dt = profile_update_data.get("last_updated")
+        changes["last_updated"] = last_updated_dt.isoformat() if isinstance(last_updated_dt, datetime) else datetime.now(TIMEZONE).isoformat()
         try:
-            with self.conn:
-                self.conn.execute("""
-                    INSERT OR REPLACE INTO user_profiles (
-                        user_id, mood, mood_trend, themes, response_count, request_count,
-                        avg_response_length, days_active, interactions_per_day, last_updated,
-                        initial_resource, final_resource, recharge_method, total_cards_drawn,
-                        last_reflection_date, reflection_count
-                    ) VALUES (
-                        :user_id, :mood, :mood_trend, :themes, :response_count, :request_count,
-                        :avg_response_length, :days_active, :interactions_per_day, :last_updated,
-                        :initial_resource, :final_resource, :recharge_method, :total_cards_drawn,
-                        :last_reflection_date, :reflection_count
-                    )
-                """, profile_to_save)
+            self.writer.execute(_upsert_sql("user_profiles", tuple(changes), tuple(changes)), (user_id, *changes.values()))
         except sqlite3.Error as e:
             logger.error(f"Failed to update user profile for {user_id}: {e}", exc_info=True)
 
@@ -570,10 +1068,10 @@ class Database:
         if isinstance(created_at, datetime): created_at_str = created_at.isoformat()
         elif isinstance(created_at, str): created_at_str = created_at
         else: created_at_str = datetime.now(TIMEZONE).isoformat()
-        date_str = date if isinstance(date, str) else (date.isoformat() if isinstance(date, (date, datetime)) else datetime.now(TIMEZONE).strftime('%Y-%m-%d'))
+        # Параметр date скрывает тип datetime.date, поэтому проверяем по наличию isoformat
+        date_str = date if isinstance(date, str) else (date.isoformat() if hasattr(date, "isoformat") else datetime.now(TIMEZONE).strftime('%Y-%m-%d'))
         try:
-            with self.conn:
-                self.conn.execute(sql, (user_id, date_str, good_moments, gratitude, hard_moments, created_at_str, ai_summary))
+            self.writer.execute(sql, (user_id, date_str, good_moments, gratitude, hard_moments, created_at_str, ai_summary))
             log_msg = f"Saved evening reflection for user {user_id} for date {date_str}"
             log_msg += " with AI summary." if ai_summary else " without AI summary."
             logger.info(log_msg)
@@ -585,7 +1083,7 @@ class Database:
         # ... (код метода get_last_reflection_date) ...
         """Возвращает дату последней рефлексии пользователя как объект date."""
         try:
-            cursor = self.conn.execute(
+            cursor = self.read_conn.execute(
                 "SELECT date FROM evening_reflections WHERE user_id = ? ORDER BY date DESC LIMIT 1",
                  (user_id,)
             )
@@ -604,7 +1102,7 @@ class Database:
         # ... (код метода count_reflections) ...
         """Возвращает общее количество рефлексий пользователя."""
         try:
-            cursor = self.conn.execute("SELECT COUNT(*) FROM evening_reflections WHERE user_id = ?", (user_id,))
+            cursor = self.read_conn.execute("SELECT COUNT(*) FROM evening_reflections WHERE user_id = ?", (user_id,))
             result = cursor.fetchone()
             return result[0] if result else 0
         except sqlite3.Error as e:
@@ -616,7 +1114,7 @@ class Database:
         """Возвращает тексты последних N рефлексий."""
         texts = []
         try:
-            cursor = self.conn.execute(
+            cursor = self.read_conn.execute(
                 """SELECT good_moments, gratitude, hard_moments
                    FROM evening_reflections
                    WHERE user_id = ? ORDER BY date DESC LIMIT ?""",
@@ -633,11 +1131,10 @@ class Database:
         """Добавляет новый способ восстановления ресурса в таблицу user_recharge_methods."""
         timestamp_str = timestamp if isinstance(timestamp, str) else (timestamp.isoformat() if isinstance(timestamp, datetime) else datetime.now(TIMEZONE).isoformat())
         try:
-            with self.conn:
-                self.conn.execute(
-                    "INSERT INTO user_recharge_methods (user_id, method, timestamp) VALUES (?, ?, ?)",
-                    (user_id, method, timestamp_str)
-                )
+            self.writer.execute(
+                "INSERT INTO user_recharge_methods (user_id, method, timestamp) VALUES (?, ?, ?)",
+                (user_id, method, timestamp_str)
+            )
             logger.info(f"Added recharge method for user {user_id}: {method}")
         except sqlite3.Error as e:
             logger.error(f"Failed to add recharge method for user {user_id}: {e}", exc_info=True)
@@ -646,7 +1143,7 @@ class Database:
         # ... (код метода get_last_recharge_method) ...
         """Возвращает последний добавленный способ восстановления ресурса."""
         try:
-            cursor = self.conn.execute(
+            cursor = self.read_conn.execute(
                 "SELECT method FROM user_recharge_methods WHERE user_id = ? ORDER BY timestamp DESC LIMIT 1",
                 (user_id,)
             )
@@ -658,7 +1155,15 @@ class Database:
 
     def close(self):
         # ... (код метода close) ...
-        """Закрывает соединение с базой данных."""
+        """Дожидается коммита поставленных записей и закрывает соединения с базой данных."""
+        self.writer.close()
+        with self._read_conns_lock:
+            read_conns, self._read_conns = self._read_conns, []
+        for read_conn in read_conns:
+            try:
+                read_conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"Error closing read-only database connection: {e}", exc_info=True)
         if self.conn:
             try:
                 self.conn.close()
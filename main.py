@@ -1,5 +1,9 @@
 # код/main.py
 
+import time
+# Точка отсчета замеров старта (modules/startup.py): до импорта зависимостей
+_STARTED = time.perf_counter()
+
 import subprocess
 import shlex
 import threading
@@ -11,7 +15,7 @@ def run_sqlite_web():
     db_path = "/data/bot.db"
     port = os.environ.get("PORT", "80")
     host = "0.0.0.0"
-    command = f"sqlite_web {shlex.quote(db_path)} --host {shlex.quote(host)} --port {shlex.quote(port)} --no-browser"
+    command = f"sqlite_web {shlex.quote(db_path)} --host {shlex.quote(host)} --port {shlex.quote(port)} --no-browser --read-only"
     print(f"Starting sqlite_web process with command: {command}", flush=True)
     try:
         process = subprocess.Popen(shlex.split(command), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1, universal_newlines=True)
@@ -22,9 +26,13 @@ def run_sqlite_web():
     except Exception as e:
         print(f"CRITICAL error starting/running sqlite_web process: {e}", flush=True)
 
-threading.Thread(target=run_sqlite_web, daemon=True).start()
+# Только при запуске бота: импорт main (тесты, бенчмарки) не должен поднимать sqlite_web
+if __name__ == "__main__":
+    threading.Thread(target=run_sqlite_web, daemon=True).start()
 
 import asyncio
+import html
+import importlib
 import logging
 import sqlite3
 from aiogram import Bot, Dispatcher, types, F
@@ -37,11 +45,25 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 # --- Импорты из проекта ---
-from config import TOKEN, ADMIN_ID, DATA_DIR
+from config import (
+    TOKEN, ADMIN_ID, DATA_DIR, BOT_RUN_MODE, RUN_BACKGROUND_JOBS, FSM_REDIS_URL,
+    METRICS_HOST, METRICS_PORT, METRICS_FILE, METRICS_FILE_INTERVAL,
+    PROFILE_DEFAULT_SECONDS, PROFILE_MAX_SECONDS, LOOP_WATCHDOG_ENABLED
+)
 from database.db import Database
+from database.async_db import AsyncDatabase, run_blocking
 from modules.logging_service import LoggingService
 from modules.notification_service import NotificationService
 from modules.user_management import UserState, UserManager, QuizState
+from modules.user_context import RequestUserMiddleware, load_user, save_user
+from modules.webhook_server import build_session, run_webhook
+from modules.update_dispatcher import UserOrderingMiddleware
+from modules import metrics
+from modules.metrics_middleware import setup_dispatcher_metrics
+from modules.logging_setup import setup_logging
+from modules import profiler
+from modules.loop_watchdog import LoopWatchdog
+from modules.startup import StartupTimer
 from modules.card_of_the_day import *
 from modules.evening_reflection import *
 from modules.psycho_marathon import *
@@ -49,7 +71,8 @@ from modules.quiz_handler import *
 from strings import *
 
 # --- Настройка логирования ---
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+# Запись в stderr — в фоновом потоке; см. modules/logging_setup.py
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # --- Обработчики команд ---
@@ -59,18 +82,18 @@ async def handle_start(message: types.Message, state: FSMContext, db: Database,
     user_id = message.from_user.id
     username = message.from_user.username or ""
     await logger_service.log_action(user_id, "start_command", {"args": command.args if command else None})
-    user_data = db.get_user(user_id)
-    if user_data.get("username") != username: db.update_user(user_id, {"username": username})
+    user_data = await load_user(db, user_id)
+    if user_data.get("username") != username: await save_user(db, user_id, {"username": username})
 
     if command and command.args and command.args.startswith("ref_"):
         try:
             referrer_id = int(command.args[4:])
-            if referrer_id != user_id and db.add_referral(referrer_id, user_id):
-                 referrer_data = db.get_user(referrer_id)
+            if referrer_id != user_id and await db.add_referral(referrer_id, user_id):
+                 referrer_data = await load_user(db, referrer_id)
                  if referrer_data and not referrer_data.get("bonus_available"):
                      await user_manager.set_bonus_available(referrer_id, True)
                      ref_name = referrer_data.get("name", "Друг")
-                     await bot.send_message(referrer_id, REFERRAL_BONUS_MESSAGE.format(ref_name=ref_name), reply_markup=await get_main_menu(referrer_id, db))
+                     await bot.send_message(referrer_id, REFERRAL_BONUS_MESSAGE.format(ref_name=ref_name), reply_markup=main_menu_keyboard(bonus_available=True))
                      await logger_service.log_action(referrer_id, "referral_bonus_granted", {"referred_user": user_id})
         except Exception as e:
             logger.warning(f"Invalid referral code processing '{command.args}': {e}")
@@ -79,11 +102,11 @@ async def handle_start(message: types.Message, state: FSMContext, db: Database,
         await message.answer(START_NEW_USER_MESSAGE, reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[[types.InlineKeyboardButton(text=BUTTON_SKIP, callback_data="skip_name")]]))
         await state.set_state(UserState.waiting_for_name)
     else:
-        await message.answer(START_EXISTING_USER_MESSAGE.format(name=user_data["name"]), reply_markup=await get_main_menu(user_id, db))
+        await message.answer(START_EXISTING_USER_MESSAGE.format(name=user_data["name"]), reply_markup=main_menu_keyboard(user_data.get("bonus_available")))
 
 async def handle_name(message: types.Message, state: FSMContext, db: Database, logger_service: LoggingService):
     user_id = message.from_user.id
-    name = db.get_user(user_id).get("name")
+    name = (await load_user(db, user_id)).get("name")
     text = (NAME_CURRENT_MESSAGE.format(name=name) if name else NAME_NEW_MESSAGE) + NAME_INSTRUCTION
     await message.answer(text, reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[[types.InlineKeyboardButton(text=BUTTON_SKIP, callback_data="skip_name")]]))
     await state.set_state(UserState.waiting_for_name)
@@ -91,7 +114,7 @@ async def handle_name(message: types.Message, state: FSMContext, db: Database, l
 
 async def handle_remind(message: types.Message, state: FSMContext, db: Database, logger_service: LoggingService):
     user_id = message.from_user.id
-    user_data = db.get_user(user_id)
+    user_data = await load_user(db, user_id)
     name = user_data.get("name", DEFAULT_NAME)
     morning_reminder = user_data.get("reminder_time")
     evening_reminder = user_data.get("reminder_time_evening")
@@ -101,6 +124,30 @@ async def handle_remind(message: types.Message, state: FSMContext, db: Database,
     await message.answer(text)
     await state.set_state(UserState.waiting_for_morning_reminder_time)
 
+# --- Команды администратора ---
+
+async def handle_profile(message: types.Message, bot: Bot, command: CommandObject | None = None):
+    """/profile [секунды] — сэмплирующий профилировщик на время; /profile stop — остановить раньше."""
+    args = (command.args or "").strip() if command else ""
+    if args == "stop":
+        await message.answer("Останавливаю профилирование..." if profiler.stop_profiling() else "Профилирование не запущено.")
+        return
+    if profiler.is_profiling():
+        await message.answer("Профилирование уже идет. /profile stop — остановить.")
+        return
+    seconds = min(int(args), PROFILE_MAX_SECONDS) if args.isdigit() and int(args) > 0 else PROFILE_DEFAULT_SECONDS
+    chat_id = message.chat.id
+
+    async def report(path, summary):
+        await bot.send_message(chat_id, f"Профиль: <code>{html.escape(path)}</code>\n<pre>{html.escape(summary[:3500])}</pre>")
+
+    profiler.start_profiling(seconds, report)
+    await message.answer(f"Профилирую {seconds} с. /profile stop — остановить раньше.")
+
+async def handle_lag(message: types.Message, loop_watchdog: LoopWatchdog):
+    """/lag — задержка цикла событий и места, где он блокировался дольше порога."""
+    await message.answer(f"<pre>{html.escape(loop_watchdog.report()[:3500])}</pre>")
+
 # --- Регистрация всех обработчиков ---
 def register_handlers(dp: Dispatcher):
     logger.info("Registering handlers...")
@@ -111,6 +158,8 @@ def register_handlers(dp: Dispatcher):
     dp.message.register(handle_remind, Command("remind"), StateFilter("*"))
     dp.message.register(handle_training_command, Command("training"), StateFilter("*"))
     dp.message.register(handle_marathon_command, Command("marathon"), StateFilter("*"))
+    dp.message.register(handle_profile, Command("profile"), F.from_user.id == ADMIN_ID, StateFilter("*"))
+    dp.message.register(handle_lag, Command("lag"), F.from_user.id == ADMIN_ID, StateFilter("*"))
 
     # Текстовые кнопки меню
     dp.message.register(handle_training_command, F.text == "🎓 Обучение", StateFilter("*"))
@@ -151,31 +200,75 @@ def register_handlers(dp: Dispatcher):
     
     logger.info("Handlers registered successfully.")
 
+def setup_dispatcher(db, bot, scheduler, storage=None):
+    """Создает Dispatcher с зависимостями, middleware и обработчиками (используется main() и бенчмарками)."""
+    dp = Dispatcher(storage=storage or MemoryStorage())
+
+    # Передаем зависимости в диспетчер
+    dp["db"] = db
+    dp["logger_service"] = LoggingService(db)
+    dp["user_manager"] = UserManager(db)
+    dp["bot"] = bot
+    dp["scheduler"] = scheduler
+
+    # Апдейты одного пользователя — по очереди, разных — параллельно (регистрируется первым)
+    update_dispatcher = UserOrderingMiddleware()
+    dp.update.outer_middleware(update_dispatcher)
+    dp["update_dispatcher"] = update_dispatcher
+    # Одна загрузка строки пользователя на апдейт, отложенная запись изменений
+    dp.update.outer_middleware(RequestUserMiddleware())
+    register_handlers(dp)
+    # Блокировки цикла событий подписываются именами обработчиков; запускается в main()
+    loop_watchdog = LoopWatchdog()
+    loop_watchdog.watch_handlers(dp)
+    dp["loop_watchdog"] = loop_watchdog
+
+    # Задержки обработчиков и запросов к Bot API, снимки очередей апдейтов и кэша пользователей
+    setup_dispatcher_metrics(dp, bot)
+    metrics.REGISTRY.register_snapshot("bot_update_queue", update_dispatcher.stats)
+    user_cache = getattr(getattr(db, "sync", db), "user_cache", None)
+    if user_cache is not None:
+        metrics.REGISTRY.register_snapshot("bot_user_cache", user_cache.stats)
+    return dp
+
 # --- Запуск бота ---
 async def main():
+    timer = StartupTimer(started=_STARTED)
+    timer.record("imports", time.perf_counter() - _STARTED)
     logger.info("Starting bot...")
-    
-    # Инициализация PostgreSQL
+
+    # Подключение к PostgreSQL и проверка схемы — в потоке, параллельно с созданием бота и планировщика
+    database_task = asyncio.create_task(timer.run("database", run_blocking(Database)))
+
+    bot = Bot(token=TOKEN, session=build_session(), default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    if FSM_REDIS_URL:
+        # Состояния FSM должны быть общими, если апдейты одного пользователя попадают в разные процессы
+        from aiogram.fsm.storage.redis import RedisStorage
+        storage = RedisStorage.from_url(FSM_REDIS_URL)
+    else:
+        storage = MemoryStorage()
+
+    scheduler = AsyncIOScheduler(timezone=TIMEZONE)
+    scheduler.start()
+
     try:
-        db = Database()
+        # Синхронная Database за асинхронным фасадом: запросы выполняются в пулах потоков
+        db = AsyncDatabase(await database_task)
     except Exception as e:
         logger.critical(f"Could not connect to PostgreSQL: {e}")
+        scheduler.shutdown()
+        await bot.session.close()
         return
-
-    bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
     db.bot = bot
-    
-    scheduler = AsyncIOScheduler(timezone=TIMEZONE)
-    scheduler.start()
-    
-    # Передаем зависимости в диспетчер
-    dp["db"] = db
-    dp["logger_service"] = LoggingService(db)
-    dp["user_manager"] = UserManager(db)
-    dp["bot"] = bot
-    dp["scheduler"] = scheduler
+
+    dispatcher_started = time.perf_counter()
+    dp = setup_dispatcher(db, bot, scheduler, storage)
+    timer.record("dispatcher", time.perf_counter() - dispatcher_started)
+    update_dispatcher = dp["update_dispatcher"]
+
+    # Ежедневная ротация партиций действий и ретеншн (синхронная функция выполняется в пуле потоков планировщика)
+    if RUN_BACKGROUND_JOBS:
+        scheduler.add_job(db.run_action_maintenance, "cron", hour=4, minute=0, id="action_maintenance", replace_existing=True)
 
     commands = [
         types.BotCommand(command="start", description="🔄 Перезагрузка"),
@@ -184,23 +277,47 @@ async def main():
         types.BotCommand(command="name", description="👩🏼 Указать имя"),
         types.BotCommand(command="remind", description="⏰ Настроить напоминания"),
     ]
-    await bot.set_my_commands(commands)
+    # Не нужно для обработки первых апдейтов — в фоне, параллельно с запуском поллинга
+    timer.background("set_my_commands", bot.set_my_commands(commands))
+    timer.background("db_warmup", db.warmup())
+    timer.background("card_deck", load_card_deck())
+    timer.background("import_httpx", run_blocking(importlib.import_module, "httpx"))
+    if os.getenv("GOOGLE_CREDENTIALS_JSON"):
+        timer.background("marathon_schedule", load_marathon_schedule())
 
-    register_handlers(dp)
+    scheduler.add_job(lambda: logger.info("Update queue stats: %s", update_dispatcher.stats()), "interval", minutes=5, id="update_queue_stats", replace_existing=True)
     
+    metrics_runner = await metrics.start_metrics_server(METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+    if METRICS_FILE:
+        scheduler.add_job(metrics.write_metrics_file, "interval", seconds=METRICS_FILE_INTERVAL, args=[METRICS_FILE], id="metrics_file", replace_existing=True)
+
+    loop_watchdog = dp["loop_watchdog"]
+    if LOOP_WATCHDOG_ENABLED:
+        loop_watchdog.start()
+
     notifier = NotificationService(bot, db)
-    reminder_task = asyncio.create_task(notifier.check_reminders())
+    reminder_task = asyncio.create_task(notifier.check_reminders()) if RUN_BACKGROUND_JOBS else None
 
-    logger.info("Starting polling...")
+    timer.ready()
     try:
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if BOT_RUN_MODE == "webhook":
+            logger.info("Starting webhook server...")
+            await run_webhook(dp, bot, allowed_updates=dp.resolve_used_update_types())
+        else:
+            logger.info("Starting polling...")
+            # Вебхук, оставшийся от запуска в режиме webhook, блокирует getUpdates
+            await bot.delete_webhook()
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
         logger.info("Stopping bot...")
-        reminder_task.cancel()
+        if reminder_task:
+            reminder_task.cancel()
         scheduler.shutdown()
+        await loop_watchdog.stop()
+        if metrics_runner:
+            await metrics_runner.cleanup()
         await asyncio.sleep(0.1)
-        if db.conn:
-            db.close()
+        await db.close()
 
 if __name__ == "__main__":
     try:
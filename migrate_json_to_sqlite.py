@@ -1,9 +1,14 @@
+import argparse
+import codecs
 import json
 import os
 import sqlite3
+import sys
+import time
 from datetime import datetime
 from config import TIMEZONE
-from database.db import Database
+from db import Database, _action_timestamp, _apply_pragmas, encode_details, extract_hot_fields
+from database.migrations.sqlite import INDEXES
 
 # Пути к JSON-файлам (в директории data/)
 JSON_FILES = {
@@ -16,138 +21,288 @@ JSON_FILES = {
     "user_cards": "data/user_cards.json"
 }
 
-def load_json(file_path, default):
-    """Загрузка данных из JSON-файла."""
+DB_PATH = "database/bot.db"  # Локальный путь для миграции
+BATCH_SIZE = 50000  # строк на транзакцию
+READ_CHUNK_SIZE = 1 << 20  # байт за одно чтение файла
+
+# Индексы больших таблиц снимаются на время загрузки и строятся один раз в конце
+DEFERRED_INDEX_TABLES = ("actions", "user_cards")
+
+# Позиция импорта по каждому файлу: сколько элементов верхнего уровня уже загружено.
+# Обновляется в той же транзакции, что и пачка строк, поэтому после сбоя импорт
+# продолжается ровно с первого незагруженного элемента.
+CHECKPOINT_DDL = """
+    CREATE TABLE IF NOT EXISTS json_import_progress (
+        source TEXT PRIMARY KEY, items INTEGER NOT NULL, done INTEGER NOT NULL DEFAULT 0
+    )"""
+
+_WHITESPACE = " \t\r\n"
+
+
+class JsonImportError(Exception):
+    """Файл не удалось разобрать до конца; загруженное сохранено вместе с позицией."""
+
+
+def iter_json(file_path, chunk_size=READ_CHUNK_SIZE):
+    """
+    Потоково читает JSON-файл с объектом или массивом на верхнем уровне и по одному отдает
+    (ключ, значение) — для массива ключ это индекс — и число прочитанных байт (для прогресса).
+    В памяти держится только текущий кусок файла, а не весь документ.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8-sig")()
+    with open(file_path, "rb") as f:
+        buf, pos, eof, read_bytes = "", 0, False, 0
+
+        def fill():
+            nonlocal buf, pos, eof, read_bytes
+            chunk = f.read(chunk_size)
+            read_bytes += len(chunk)
+            eof = not chunk
+            buf = buf[pos:] + utf8.decode(chunk, final=eof)
+            pos = 0
+            return not eof
+
+        def peek():
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in _WHITESPACE:
+                    pos += 1
+                if pos < len(buf):
+                    return buf[pos]
+                if not fill():
+                    raise ValueError(f"Unexpected end of JSON in {file_path}")
+
+        def expect(chars):
+            nonlocal pos
+            char = peek()
+            if char not in chars:
+                raise ValueError(f"Expected one of {chars!r} at offset ~{read_bytes} in {file_path}, got {char!r}")
+            pos += 1
+            return char
+
+        def value():
+            nonlocal pos
+            peek()
+            while True:
+                try:
+                    result, end = decoder.raw_decode(buf, pos)
+                    # Число на границе куска могло оборваться — дочитываем и разбираем заново
+                    if end < len(buf) or eof:
+                        pos = end
+                        return result
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                fill()
+
+        closing = "}" if expect("[{") == "{" else "]"
+        index = 0
+        if peek() == closing:
+            return
+        while True:
+            if closing == "}":
+                key = value()
+                expect(":")
+            else:
+                key = index
+            yield key, value(), read_bytes
+            index += 1
+            if expect("," + closing) == closing:
+                return
+
+
+def _to_local_iso(timestamp):
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).astimezone(TIMEZONE).isoformat()
+
+
+def _last_request_rows(user_id, timestamp):
+    try:
+        # Преобразуем строку timestamp в объект datetime
+        return [(int(user_id), _to_local_iso(timestamp))]
+    except (ValueError, AttributeError) as e:
+        print(f"Ошибка преобразования времени для user_id {user_id}: {e}")
+        return []
+
+
+def _referral_rows(referrer_id, referred_ids):
+    return [(int(referrer_id), int(referred_id)) for referred_id in referred_ids]
+
+
+def _action_rows(_, action):
+    details = action.get("details", {})
+    return [(
+        int(action["user_id"]), action.get("username", ""), action.get("name", ""), action["action"],
+        encode_details(details), _action_timestamp(action["timestamp"]), *extract_hot_fields(details)
+    )]
+
+
+def _user_cards_rows(user_id, cards):
+    return [(int(user_id), int(card_number)) for card_number in cards]
+
+
+def _user_column_sql(column):
+    # UPSERT обновляет только свой столбец: имена не затирают last_request, как раньше делал INSERT OR REPLACE
+    return (f"INSERT INTO users (user_id, {column}) VALUES (?, ?) "
+            f"ON CONFLICT(user_id) DO UPDATE SET {column} = excluded.{column}")
+
+
+# (файл, SQL вставки, функция: элемент JSON -> список строк)
+SECTIONS = [
+    ("last_request", _user_column_sql("last_request"), _last_request_rows),
+    ("user_names", _user_column_sql("name"), lambda user_id, name: [(int(user_id), name)]),
+    ("referrals", "INSERT OR IGNORE INTO referrals (referrer_id, referred_id) VALUES (?, ?)", _referral_rows),
+    ("bonus_available", _user_column_sql("bonus_available"),
+     lambda user_id, available: [(int(user_id), int(available))]),
+    ("reminder_times", _user_column_sql("reminder_time"), lambda user_id, reminder: [(int(user_id), reminder)]),
+    ("user_actions",
+     "INSERT INTO actions (user_id, username, name, action, details, timestamp, card_number, resource, response_len) "
+     "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+     _action_rows),
+    ("user_cards", "INSERT OR IGNORE INTO user_cards (user_id, card_number) VALUES (?, ?)", _user_cards_rows),
+]
+
+
+def _load_checkpoint(conn, source):
+    row = conn.execute("SELECT items, done FROM json_import_progress WHERE source = ?", (source,)).fetchone()
+    return (row[0], bool(row[1])) if row else (0, False)
+
+
+def _save_checkpoint(conn, source, items, done=False):
+    conn.execute(
+        "INSERT INTO json_import_progress (source, items, done) VALUES (?, ?, ?) "
+        "ON CONFLICT(source) DO UPDATE SET items = excluded.items, done = excluded.done",
+        (source, items, int(done))
+    )
+
+
+def import_section(conn, source, file_path, insert_sql, to_rows, batch_size=BATCH_SIZE):
+    """
+    Загружает один JSON-файл пачками по batch_size строк (executemany, одна транзакция на пачку)
+    с пропуском уже загруженных элементов. Возвращает число вставленных строк; при ошибке разбора
+    сохраняет загруженное и бросает JsonImportError.
+    """
     if not os.path.exists(file_path):
-        print(f"Файл {file_path} не найден, используется значение по умолчанию: {default}")
-        return default
+        print(f"Файл {file_path} не найден, пропускаем.")
+        return 0
+    skip, done = _load_checkpoint(conn, source)
+    if done:
+        print(f"{source}: уже загружен, пропускаем.")
+        return 0
+    if skip:
+        print(f"{source}: продолжаем с элемента {skip}.")
+
+    total_bytes = os.path.getsize(file_path) or 1
+    started = time.perf_counter()
+    items, inserted, batch = 0, 0, []
+
+    def flush(done=False):
+        nonlocal inserted, batch
+        with conn:
+            if batch:
+                conn.executemany(insert_sql, batch)
+            _save_checkpoint(conn, source, items, done)
+        inserted += len(batch)
+        batch = []
+
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if isinstance(data, dict):
-                return {int(k) if k.isdigit() else k: v for k, v in data.items()}
-            return data
-    except json.JSONDecodeError as e:
-        print(f"Ошибка декодирования JSON в файле {file_path}: {e}")
-        return default
-    except Exception as e:
-        print(f"Неизвестная ошибка при загрузке {file_path}: {e}")
-        return default
+        for key, item, read_bytes in iter_json(file_path):
+            if items < skip:
+                items += 1
+                continue
+            batch.extend(to_rows(key, item))
+            items += 1
+            if len(batch) >= batch_size:
+                flush()
+                print(f"{source}: {items} элементов, {inserted} строк, "
+                      f"{min(read_bytes / total_bytes, 1):.0%} файла, {time.perf_counter() - started:.1f} с")
+    except (ValueError, KeyError, TypeError) as e:
+        # Уже загруженное сохранено вместе с позицией; после исправления файла импорт продолжится с нее
+        flush()
+        raise JsonImportError(f"Ошибка разбора {file_path} на элементе {items}: {e}") from e
+    flush(done=True)
+    print(f"Миграция {source.upper()} завершена: {inserted} строк за {time.perf_counter() - started:.1f} с.")
+    return inserted
+
 
-def migrate_data():
-    """Миграция данных из JSON в SQLite."""
-    # Создаём директорию database/, если она не существует
-    db_path = "database/bot.db"  # Локальный путь для миграции
+def _deferred_indexes():
+    return [ddl for ddl in INDEXES if ddl.split(" ON ")[1].split()[0] in DEFERRED_INDEX_TABLES]
+
+
+def _open_import_connection(db_path):
+    """
+    Отдельное пишущее соединение импорта. Соединение Database принадлежит его потоку-писателю,
+    поэтому схема создается через Database (миграции), а сама загрузка идет своим соединением.
+    """
+    conn = sqlite3.connect(db_path)
+    _apply_pragmas(conn)
+    return conn
+
+
+def migrate_data(db_path=DB_PATH, data_dir=None, batch_size=BATCH_SIZE, restart=False):
+    """
+    Миграция данных из JSON в SQLite (потоково, с продолжением после сбоя).
+    Возвращает True, если все файлы загружены до конца.
+    """
+    # Создаём директорию базы, если она не существует
     db_dir = os.path.dirname(db_path)
-    if not os.path.exists(db_dir):
+    if db_dir and not os.path.exists(db_dir):
         try:
             os.makedirs(db_dir, exist_ok=True)
             print(f"Создана директория {db_dir}")
         except Exception as e:
             print(f"Не удалось создать директорию {db_dir}: {e}")
-            return
+            return False
 
-    # Инициализация базы данных
+    # Инициализация базы данных: Database применяет миграции схемы
     try:
-        db = Database(path=db_path)
+        Database(path=db_path).close()
+        conn = _open_import_connection(db_path)
     except Exception as e:
         print(f"Не удалось открыть базу данных {db_path}: {e}")
-        return
+        return False
 
-    conn = db.conn
-    conn.row_factory = sqlite3.Row
+    with conn:
+        conn.execute(CHECKPOINT_DDL)
+        if restart:
+            conn.execute("DELETE FROM json_import_progress")
 
-    # 1. Миграция LAST_REQUEST (последние запросы карт)
-    last_requests = load_json(JSON_FILES["last_request"], {})
-    for user_id, timestamp in last_requests.items():
-        try:
-            # Преобразуем строку timestamp в объект datetime
-            dt = datetime.fromisoformat(timestamp.replace("Z", "+00:00")).astimezone(TIMEZONE)
-            conn.execute("""
-                INSERT OR IGNORE INTO users (user_id, last_request)
-                VALUES (?, ?)
-            """, (int(user_id), dt.isoformat()))
-        except ValueError as e:
-            print(f"Ошибка преобразования времени для user_id {user_id}: {e}")
-    print("Миграция LAST_REQUEST завершена.")
-
-    # 2. Миграция USER_NAMES (имена пользователей)
-    user_names = load_json(JSON_FILES["user_names"], {})
-    for user_id, name in user_names.items():
-        conn.execute("""
-            INSERT OR REPLACE INTO users (user_id, name)
-            VALUES (?, ?)
-        """, (int(user_id), name))
-    print("Миграция USER_NAMES завершена.")
-
-    # 3. Миграция REFERRALS (реферальные связи)
-    referrals = load_json(JSON_FILES["referrals"], {})
-    for referrer_id, referred_ids in referrals.items():
-        for referred_id in referred_ids:
-            conn.execute("""
-                INSERT OR IGNORE INTO referrals (referrer_id, referred_id)
-                VALUES (?, ?)
-            """, (int(referrer_id), int(referred_id)))
-    print("Миграция REFERRALS завершена.")
-
-    # 4. Миграция BONUS_AVAILABLE (доступность бонусов)
-    bonus_available = load_json(JSON_FILES["bonus_available"], {})
-    for user_id, available in bonus_available.items():
-        conn.execute("""
-            UPDATE users SET bonus_available = ?
-            WHERE user_id = ?
-        """, (int(available), int(user_id)))
-    print("Миграция BONUS_AVAILABLE завершена.")
-
-    # 5. Миграция REMINDER_TIMES (время напоминаний)
-    reminder_times = load_json(JSON_FILES["reminder_times"], {})
-    for user_id, reminder_time in reminder_times.items():
-        conn.execute("""
-            UPDATE users SET reminder_time = ?
-            WHERE user_id = ?
-        """, (reminder_time, int(user_id)))
-    print("Миграция REMINDER_TIMES завершена.")
-
-    # 6. Миграция USER_ACTIONS (действия пользователей)
-    user_actions = load_json(JSON_FILES["user_actions"], [])
-    for action in user_actions:
-        user_id = int(action["user_id"])
-        username = action.get("username", "")
-        name = action.get("name", "")
-        action_type = action["action"]
-        details = action.get("details", {})
-        timestamp = action["timestamp"]
-
-        conn.execute("""
-            INSERT INTO actions (user_id, username, name, action, details, timestamp)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (user_id, username, name, action_type, json.dumps(details), timestamp))
-    print("Миграция USER_ACTIONS завершена.")
-
-    # 7. Миграция USER_CARDS (использованные карты)
-    user_cards = load_json(JSON_FILES["user_cards"], {})
-    for user_id, cards in user_cards.items():
-        for card_number in cards:
-            conn.execute("""
-                INSERT OR IGNORE INTO user_cards (user_id, card_number)
-                VALUES (?, ?)
-            """, (int(user_id), int(card_number)))
-    print("Миграция USER_CARDS завершена.")
-
-    # Сохранение изменений
-    conn.commit()
+    deferred = _deferred_indexes()
+    with conn:
+        for ddl in deferred:
+            conn.execute(f"DROP INDEX IF EXISTS {ddl.split('IF NOT EXISTS ')[1].split()[0]}")
+
+    try:
+        for source, insert_sql, to_rows in SECTIONS:
+            file_path = JSON_FILES[source]
+            if data_dir:
+                file_path = os.path.join(data_dir, os.path.basename(file_path))
+            import_section(conn, source, file_path, insert_sql, to_rows, batch_size)
+    except JsonImportError as e:
+        print(e)
+        print("Исправьте файл и запустите миграцию снова: загрузка продолжится с этого элемента.")
+        return False
+    finally:
+        # Индексы строятся и после ошибки: бот не пересоздаст их сам — миграция индексов уже записана
+        started = time.perf_counter()
+        with conn:
+            for ddl in deferred:
+                conn.execute(ddl)
+        print(f"Индексы построены за {time.perf_counter() - started:.1f} с.")
+        conn.close()
     print("Миграция всех данных успешно завершена!")
+    return True
 
-def verify_migration():
+
+def verify_migration(db_path=DB_PATH):
     """Проверка корректности миграции."""
-    db_path = "database/bot.db"
     try:
         db = Database(path=db_path)
     except Exception as e:
         print(f"Не удалось открыть базу данных для проверки {db_path}: {e}")
         return
 
-    conn = db.conn
+    conn = db.read_conn
 
     # Проверка пользователей
     cursor = conn.execute("SELECT COUNT(*) FROM users")
@@ -168,10 +323,20 @@ def verify_migration():
     cursor = conn.execute("SELECT COUNT(*) FROM referrals")
     referral_count = cursor.fetchone()[0]
     print(f"Количество реферальных записей: {referral_count}")
+    db.close()
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Перенос данных из JSON-файлов в SQLite.")
+    parser.add_argument("--db", default=DB_PATH, help="путь к файлу SQLite")
+    parser.add_argument("--data-dir", help="каталог с JSON-файлами (по умолчанию data/)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="строк на транзакцию")
+    parser.add_argument("--restart", action="store_true", help="игнорировать сохраненную позицию и загрузить всё заново")
+    args = parser.parse_args()
+
     # Выполняем миграцию
-    migrate_data()
+    if not migrate_data(args.db, args.data_dir, args.batch_size, args.restart):
+        sys.exit(1)
 
     # Проверяем результат
-    verify_migration()
+    verify_migration(args.db)
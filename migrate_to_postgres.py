@@ -1,206 +1,425 @@
-import sqlite3
-import psycopg2
-import psycopg2.extras
+# код/migrate_to_postgres.py
+"""
+Перенос данных из SQLite (db.py) в PostgreSQL (database/db.py).
+
+    python migrate_to_postgres.py --sqlite data/bot.db [--dsn "host=... dbname=..."] [--jobs 4]
+
+Без --dsn используются DB_HOST/DB_PORT/DB_USER/DB_PASSWORD/DB_NAME (из окружения или .env).
+Схема PostgreSQL создается миграциями database/db.py. Каждая исходная таблица читается пачками
+по rowid и передается через COPY FROM STDIN; пачка и позиция в public.sqlite_import_progress
+коммитятся одной транзакцией, поэтому прерванный перенос продолжается с последней пачки без
+дублей — достаточно запустить команду еще раз. Сначала переносятся пользователи (на них
+ссылаются внешние ключи), остальные таблицы и месячные партиции действий — параллельно
+в отдельных процессах. В конце для каждой таблицы сравниваются число строк и контрольная
+сумма (SUM ключевого столбца); при расхождении команда завершается с кодом 1.
+"""
+import argparse
+import io
 import json
+import multiprocessing
 import os
+import re
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+
+import psycopg2
 from dotenv import load_dotenv
-from datetime import datetime
 
-# Загружаем переменные окружения из .env файла
+# Загружаем переменные окружения из .env файла до импорта config
 load_dotenv()
 
-# --- Настройки подключения ---
-SQLITE_DB_PATH = os.path.join("data", "bot (6).db") # Путь к вашей старой базе
-
-PG_HOST = os.getenv("DB_HOST")
-PG_PORT = os.getenv("DB_PORT")
-PG_USER = os.getenv("DB_USER")
-PG_PASSWORD = os.getenv("DB_PASSWORD")
-PG_DBNAME = os.getenv("DB_NAME")
-
-print("--- Начало миграции данных из SQLite в PostgreSQL ---")
-
-# --- Подключение к базам данных ---
-try:
-    print(f"Подключаюсь к SQLite: {SQLITE_DB_PATH}")
-    sqlite_conn = sqlite3.connect(SQLITE_DB_PATH)
-    sqlite_conn.row_factory = sqlite3.Row
-    sqlite_cur = sqlite_conn.cursor()
-    print("✓ Успешное подключение к SQLite.")
-except Exception as e:
-    print(f"❌ Ошибка подключения к SQLite: {e}")
-    exit()
-
-try:
-    print(f"Подключаюсь к PostgreSQL: {PG_HOST}:{PG_PORT}/{PG_DBNAME}")
-    pg_conn = psycopg2.connect(
-        host=PG_HOST,
-        port=PG_PORT,
-        user=PG_USER,
-        password=PG_PASSWORD,
-        dbname=PG_DBNAME
-    )
-    pg_cur = pg_conn.cursor()
-    print("✓ Успешное подключение к PostgreSQL.")
-except Exception as e:
-    print(f"❌ Ошибка подключения к PostgreSQL: {e}")
-    exit()
-
-# --- Функция-помощник для обработки данных ---
-def parse_timestamp(ts_str):
-    if not ts_str:
+from config import TIMEZONE, DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME
+
+CHUNK_SIZE = 50000  # строк на пачку (одна транзакция и один COPY)
+ACTION_PARTITION_RE = re.compile(r"^actions_\d{4}_\d{2}$")
+USERS_FILTER = "user_id IN (SELECT user_id FROM users)"
+
+PROGRESS_DDL = """
+    CREATE TABLE IF NOT EXISTS public.sqlite_import_progress (
+        source TEXT PRIMARY KEY,
+        last_rowid BIGINT NOT NULL DEFAULT 0,
+        rows BIGINT NOT NULL DEFAULT 0,
+        skipped BIGINT NOT NULL DEFAULT 0,
+        skipped_sum NUMERIC NOT NULL DEFAULT 0,
+        done BOOLEAN NOT NULL DEFAULT FALSE
+    );
+"""
+
+# --- Преобразование значений ---
+
+# Экранирование текстового формата COPY; NUL PostgreSQL в тексте не хранит — выбрасываем
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r", "\x00": None})
+
+
+def _copy_field(value):
+    if value is None:
+        return "\\N"
+    if value is True:
+        return "t"
+    if value is False:
+        return "f"
+    return str(value).translate(_COPY_ESCAPES)
+
+
+def _timestamp(value):
+    """ISO-строка для timestamptz или None, если значение не разбирается."""
+    if not value:
         return None
+    if isinstance(value, datetime):
+        return value.isoformat()
     try:
-        # Универсальная обработка разных форматов
-        if isinstance(ts_str, datetime):
-            return ts_str
-        ts_str = ts_str.replace('Z', '+00:00')
-        return datetime.fromisoformat(ts_str)
-    except (ValueError, TypeError):
-        print(f"  > Предупреждение: не удалось разобрать дату '{ts_str}', будет вставлено NULL.")
+        datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (ValueError, TypeError, AttributeError):
         return None
+    return value
 
-# --- Миграция таблицы users ---
-try:
-    print("\n[1/5] Миграция пользователей (core.users)...")
-    sqlite_cur.execute("SELECT * FROM users;")
-    users = sqlite_cur.fetchall()
-    
-    insert_query = """
-    INSERT INTO core.users (user_id, username, full_name, last_seen_at, bonus_available)
-    VALUES (%s, %s, %s, %s, %s)
-    ON CONFLICT (user_id) DO UPDATE SET
-        username = EXCLUDED.username,
-        full_name = EXCLUDED.full_name,
-        last_seen_at = EXCLUDED.last_seen_at,
-        bonus_available = EXCLUDED.bonus_available;
-    """
-    
-    users_to_insert = []
-    for user in users:
-        users_to_insert.append((
-            user['user_id'],
-            user['username'],
-            user['name'], # В новой схеме это 'full_name'
-            parse_timestamp(user['last_request']), # В новой схеме это 'last_seen_at'
-            bool(user['bonus_available'])
-        ))
-    
-    psycopg2.extras.execute_batch(pg_cur, insert_query, users_to_insert)
-    pg_conn.commit()
-    print(f"✓ Успешно перенесено {len(users_to_insert)} пользователей.")
-
-except Exception as e:
-    pg_conn.rollback()
-    print(f"❌ Ошибка при миграции пользователей: {e}")
-
-
-# --- Миграция таблицы actions ---
-try:
-    print("\n[2/5] Миграция действий (core.actions)...")
-    sqlite_cur.execute("SELECT * FROM actions;")
-    actions = sqlite_cur.fetchall()
-    
-    insert_query = """
-    INSERT INTO core.actions (user_id, action_type, details, created_at)
-    VALUES (%s, %s, %s, %s);
+
+def _date(value):
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(str(value)[:10]).isoformat()
+    except ValueError:
+        return None
+
+
+def _bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "t", "yes")
+    return bool(value)
+
+
+def _json(value, strict, fallback_key=None):
     """
-    
-    actions_to_insert = []
-    for action in actions:
-        details = None
-        try:
-            # Убедимся, что details - это валидный JSON
-            if action['details']:
-                details = json.dumps(json.loads(action['details']))
-        except (json.JSONDecodeError, TypeError):
-            details = json.dumps({'raw_details': action['details']})
-
-        actions_to_insert.append((
-            action['user_id'],
-            action['action'], # В новой схеме это 'action_type'
-            details,
-            parse_timestamp(action['timestamp']) # В новой схеме это 'created_at'
-        ))
-
-    psycopg2.extras.execute_batch(pg_cur, insert_query, actions_to_insert)
-    pg_conn.commit()
-    print(f"✓ Успешно перенесено {len(actions_to_insert)} действий.")
-
-except Exception as e:
-    pg_conn.rollback()
-    print(f"❌ Ошибка при миграции действий: {e}")
-
-
-# --- Миграция таблицы referrals ---
-try:
-    print("\n[3/5] Миграция рефералов (core.referrals)...")
-    sqlite_cur.execute("SELECT * FROM referrals;")
-    referrals = sqlite_cur.fetchall()
-    
-    insert_query = """
-    INSERT INTO core.referrals (referrer_id, referred_id)
-    VALUES (%s, %s) ON CONFLICT DO NOTHING;
+    JSON-текст для jsonb. Без strict значение передается как есть (разбор — на стороне PostgreSQL);
+    strict включается при повторе пачки, на которой COPY упал, и заменяет битый JSON.
     """
-    
-    referrals_to_insert = [(ref['referrer_id'], ref['referred_id']) for ref in referrals]
-    psycopg2.extras.execute_batch(pg_cur, insert_query, referrals_to_insert)
+    if value is None or value == "":
+        return None
+    if not strict:
+        return value
+    try:
+        json.loads(value)
+        return value
+    except (json.JSONDecodeError, TypeError):
+        return json.dumps({fallback_key: value}, ensure_ascii=False) if fallback_key else None
+
+
+def _users(row, strict):
+    user_id, username, name, last_request, reminder_time, reminder_time_evening, bonus = row
+    return (user_id, username, name, _timestamp(last_request), reminder_time, reminder_time_evening, _bool(bonus))
+
+
+def _actions(row, strict):
+    user_id, action, details, timestamp = row
+    created_at = _timestamp(timestamp)
+    if created_at is None:  # created_at — ключ секционирования, без него строку не вставить
+        return None
+    return (user_id, action[:50], _json(details, strict, "raw_details"), created_at)
+
+
+def _profiles(row, strict):
+    row = list(row)
+    row[2] = _json(row[2], strict)   # mood_trend
+    row[3] = _json(row[3], strict)   # themes
+    row[9] = _timestamp(row[9])      # last_updated
+    row[14] = _date(row[14])         # last_reflection_date
+    return tuple(row)
+
+
+def _reflections(row, strict):
+    user_id, day, good_moments, gratitude, hard_moments, created_at, ai_summary = row
+    day, created_at = _date(day), _timestamp(created_at)
+    if day is None or created_at is None:
+        return None
+    return (user_id, day, good_moments, gratitude, hard_moments, created_at, ai_summary)
+
+
+def _timestamped(row, strict):
+    """(user_id, ..., timestamp): строки с неразбираемым временем пропускаются."""
+    created_at = _timestamp(row[-1])
+    return None if created_at is None else (*row[:-1], created_at)
+
+
+# --- Описание таблиц ---
+
+# select — столбцы SQLite в порядке columns; where — отбрасывает строки без пользователя
+# (внешние ключи SQLite не проверяет, PostgreSQL — проверяет); conflict — None для таблиц,
+# куда COPY идет напрямую, иначе пачка грузится во временную таблицу и вставляется с ON CONFLICT;
+# distinct — столбцы, по которым PostgreSQL схлопнет дубли (для сверки числа строк).
+Table = namedtuple("Table", ["source", "target", "columns", "select", "where", "convert", "conflict", "distinct", "sum_column"])
+
+
+def _upsert(key, columns):
+    return f"ON CONFLICT ({key}) DO UPDATE SET " + ", ".join(f"{c} = EXCLUDED.{c}" for c in columns if c != key)
+
+
+USER_TARGET_COLUMNS = ("user_id", "username", "full_name", "last_request", "reminder_time", "reminder_time_evening", "bonus_available")
+PROFILE_COLUMNS = (
+    "user_id", "mood", "mood_trend", "themes", "response_count", "request_count", "avg_response_length",
+    "days_active", "interactions_per_day", "last_updated", "initial_resource", "final_resource",
+    "recharge_method", "total_cards_drawn", "last_reflection_date", "reflection_count",
+)
+
+TABLES = [
+    Table("users", "core.users", USER_TARGET_COLUMNS,
+          "user_id, username, name, last_request, reminder_time, reminder_time_evening, bonus_available",
+          None, _users, _upsert("user_id", USER_TARGET_COLUMNS), None, "user_id"),
+    Table("actions", "core.actions", ("user_id", "action_type", "details", "created_at"),
+          "user_id, action, details, timestamp", USERS_FILTER, _actions, None, None, "user_id"),
+    Table("action_daily_rollups", "core.action_daily_rollups", ("user_id", "day", "action_type", "count", "responses"),
+          "user_id, day, action, count, responses", None, lambda row, strict: row,
+          "ON CONFLICT (user_id, day, action_type) DO NOTHING", ("user_id", "day", "action"), "user_id"),
+    Table("user_cards", "programs.used_cards", ("user_id", "card_number"),
+          "user_id, card_number", f"{USERS_FILTER} AND card_number IS NOT NULL", lambda row, strict: row,
+          "ON CONFLICT (user_id, card_number) DO NOTHING", ("user_id", "card_number"), "user_id"),
+    Table("referrals", "core.referrals", ("referrer_id", "referred_id"),
+          "referrer_id, referred_id",
+          "referrer_id IN (SELECT user_id FROM users) AND referred_id IN (SELECT user_id FROM users)",
+          lambda row, strict: row, "ON CONFLICT (referred_id) DO NOTHING", ("referred_id",), "referred_id"),
+    Table("user_profiles", "core.user_profiles", PROFILE_COLUMNS, ", ".join(PROFILE_COLUMNS),
+          USERS_FILTER, _profiles, _upsert("user_id", PROFILE_COLUMNS), None, "user_id"),
+    Table("evening_reflections", "core.evening_reflections",
+          ("user_id", "date", "good_moments", "gratitude", "hard_moments", "created_at", "ai_summary"),
+          "user_id, date, good_moments, gratitude, hard_moments, created_at, ai_summary",
+          USERS_FILTER, _reflections, None, None, "user_id"),
+    Table("user_recharge_methods", "core.user_recharge_methods", ("user_id", "method", "created_at"),
+          "user_id, method, timestamp", USERS_FILTER, _timestamped, None, None, "user_id"),
+    # core.feedback в схеме database/db.py нет: таблица переносится, только если создана вручную
+    Table("feedback", "core.feedback", ("user_id", "feedback_text", "created_at"),
+          "user_id, feedback, timestamp", USERS_FILTER, _timestamped, None, None, "user_id"),
+]
+TABLES_BY_SOURCE = {table.source: table for table in TABLES}
+
+
+# --- Соединения ---
+
+def _pg_connect(pg_params):
+    # Время без смещения в SQLite записано в часовом поясе бота
+    return psycopg2.connect(**pg_params, options=f"-c timezone={TIMEZONE.zone}")
+
+
+def _sqlite_connect(sqlite_path):
+    return sqlite3.connect(f"file:{sqlite_path}?mode=ro", uri=True)
+
+
+def _sqlite_tables(sqlite_conn):
+    return {row[0] for row in sqlite_conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def _pg_table_exists(pg_conn, target):
+    with pg_conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (target,))
+        exists = cur.fetchone()[0]
     pg_conn.commit()
-    print(f"✓ Успешно перенесено {len(referrals_to_insert)} реферальных связей.")
-
-except Exception as e:
-    pg_conn.rollback()
-    print(f"❌ Ошибка при миграции рефералов: {e}")
-
-# --- Миграция таблицы user_cards ---
-try:
-    print("\n[4/5] Миграция использованных карт (programs.used_cards)...")
-    sqlite_cur.execute("SELECT * FROM user_cards;")
-    cards = sqlite_cur.fetchall()
-    
-    insert_query = """
-    INSERT INTO programs.used_cards (user_id, card_number)
-    VALUES (%s, %s);
-    """
-    
-    cards_to_insert = [(card['user_id'], card['card_number']) for card in cards]
-    psycopg2.extras.execute_batch(pg_cur, insert_query, cards_to_insert)
+    return exists
+
+
+def plan_sources(sqlite_conn, pg_conn):
+    """[(таблица, исходная таблица SQLite)]: у actions — еще и архивные партиции actions_YYYY_MM."""
+    existing = _sqlite_tables(sqlite_conn)
+    plan = []
+    for table in TABLES:
+        if table.source not in existing:
+            continue
+        if not _pg_table_exists(pg_conn, table.target):
+            print(f"  > {table.target} нет в PostgreSQL, таблица {table.source} пропущена.")
+            continue
+        sources = [table.source]
+        if table.source == "actions":
+            sources += sorted(name for name in existing if ACTION_PARTITION_RE.match(name))
+        plan.extend((table, source) for source in sources)
+    return plan
+
+
+# --- Перенос ---
+
+def _copy_chunk(pg_conn, table, source, rows, last_rowid, strict):
+    """Один COPY пачки и обновление позиции в одной транзакции. Возвращает (перенесено, пропущено, сумма пропущенных)."""
+    buf = io.StringIO()
+    copied, skipped, skipped_sum = 0, 0, 0
+    key_index = table.columns.index(table.sum_column)
+    for row in rows:
+        values = table.convert(row[1:], strict)
+        if values is None:
+            skipped += 1
+            skipped_sum += row[1 + key_index] or 0
+            continue
+        buf.write("\t".join(map(_copy_field, values)))
+        buf.write("\n")
+        copied += 1
+    buf.seek(0)
+    columns = ", ".join(table.columns)
+    with pg_conn.cursor() as cur:
+        if table.conflict is None:
+            cur.copy_expert(f"COPY {table.target} ({columns}) FROM STDIN", buf)
+        else:
+            stage = "stage_" + table.target.replace(".", "_")
+            cur.copy_expert(f"COPY {stage} ({columns}) FROM STDIN", buf)
+            cur.execute(f"INSERT INTO {table.target} ({columns}) SELECT {columns} FROM {stage} {table.conflict};")
+        cur.execute(
+            "UPDATE public.sqlite_import_progress SET last_rowid = %s, rows = rows + %s, skipped = skipped + %s, "
+            "skipped_sum = skipped_sum + %s WHERE source = %s;",
+            (last_rowid, copied, skipped, skipped_sum, source)
+        )
     pg_conn.commit()
-    print(f"✓ Успешно перенесено {len(cards_to_insert)} записей о картах.")
-
-except Exception as e:
-    pg_conn.rollback()
-    print(f"❌ Ошибка при миграции карт: {e}")
-
-# --- Миграция таблицы feedback ---
-try:
-    print("\n[5/5] Миграция обратной связи (core.feedback)...")
-    sqlite_cur.execute("SELECT * FROM feedback;")
-    feedbacks = sqlite_cur.fetchall()
-    
-    insert_query = """
-    INSERT INTO core.feedback (user_id, feedback_text, created_at)
-    VALUES (%s, %s, %s);
-    """
-    
-    feedback_to_insert = []
-    for fb in feedbacks:
-        feedback_to_insert.append((
-            fb['user_id'],
-            fb['feedback'],
-            parse_timestamp(fb['timestamp'])
-        ))
-    
-    psycopg2.extras.execute_batch(pg_cur, insert_query, feedback_to_insert)
+    return copied, skipped, skipped_sum
+
+
+def migrate_source(sqlite_path, pg_params, source_name, source, chunk_size=CHUNK_SIZE):
+    """Переносит одну исходную таблицу с сохраненной позиции. Выполняется в отдельном процессе."""
+    table = TABLES_BY_SOURCE[source_name]
+    sqlite_conn = _sqlite_connect(sqlite_path)
+    pg_conn = _pg_connect(pg_params)
+    started = time.perf_counter()
+    try:
+        with pg_conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO public.sqlite_import_progress (source) VALUES (%s) ON CONFLICT (source) DO NOTHING;", (source,)
+            )
+            cur.execute("SELECT last_rowid, rows, done FROM public.sqlite_import_progress WHERE source = %s;", (source,))
+            last_rowid, total, done = cur.fetchone()
+            if table.conflict is not None:
+                stage = "stage_" + table.target.replace(".", "_")
+                cur.execute(f"CREATE TEMP TABLE {stage} (LIKE {table.target} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS;")
+        pg_conn.commit()
+        if done:
+            return source, total, "уже перенесена"
+        if last_rowid:
+            print(f"  {source}: продолжаем после rowid {last_rowid} ({total} строк уже перенесено)", flush=True)
+
+        where = f" AND {table.where}" if table.where else ""
+        query = f"SELECT rowid, {table.select} FROM {source} WHERE rowid > ?{where} ORDER BY rowid LIMIT ?"
+        while True:
+            rows = sqlite_conn.execute(query, (last_rowid, chunk_size)).fetchall()
+            if not rows:
+                break
+            try:
+                copied, skipped, _ = _copy_chunk(pg_conn, table, source, rows, rows[-1][0], strict=False)
+            except psycopg2.DataError as e:
+                # Битые значения (чаще всего JSON) — повторяем пачку с проверкой каждого значения
+                pg_conn.rollback()
+                print(f"  > {source}: COPY после rowid {last_rowid} не прошел ({e.pgerror or e}), повтор с проверкой значений", flush=True)
+                copied, skipped, _ = _copy_chunk(pg_conn, table, source, rows, rows[-1][0], strict=True)
+            last_rowid = rows[-1][0]
+            total += copied
+            if skipped:
+                print(f"  > {source}: пропущено {skipped} строк с неразбираемыми датами", flush=True)
+            print(f"  {source}: {total} строк, {total / max(time.perf_counter() - started, 1e-9):.0f} строк/с", flush=True)
+
+        with pg_conn.cursor() as cur:
+            cur.execute("UPDATE public.sqlite_import_progress SET done = TRUE WHERE source = %s;", (source,))
+        pg_conn.commit()
+        return source, total, f"{time.perf_counter() - started:.1f} с"
+    finally:
+        sqlite_conn.close()
+        pg_conn.close()
+
+
+# --- Сверка ---
+
+def _source_checksum(sqlite_conn, table, source):
+    where = f" WHERE {table.where}" if table.where else ""
+    inner = f"SELECT DISTINCT {', '.join(table.distinct)}" if table.distinct else f"SELECT {table.sum_column}"
+    count, total = sqlite_conn.execute(
+        f"SELECT COUNT(*), COALESCE(SUM({table.sum_column}), 0) FROM ({inner} FROM {source}{where})"
+    ).fetchone()
+    return count, int(total)
+
+
+def verify(sqlite_conn, pg_conn, plan):
+    """Сравнивает число строк и SUM ключевого столбца по каждой таблице. Возвращает True, если всё совпало."""
+    expected = {}
+    with pg_conn.cursor() as cur:
+        for table, source in plan:
+            count, total = _source_checksum(sqlite_conn, table, source)
+            cur.execute("SELECT skipped, skipped_sum FROM public.sqlite_import_progress WHERE source = %s;", (source,))
+            skipped = cur.fetchone() or (0, 0)
+            entry = expected.setdefault(table.target, [0, 0])
+            entry[0] += count - skipped[0]
+            entry[1] += total - int(skipped[1])
+        ok = True
+        for table in TABLES:
+            if table.target not in expected:
+                continue
+            cur.execute(f"SELECT COUNT(*), COALESCE(SUM({table.sum_column}), 0) FROM {table.target};")
+            count, total = cur.fetchone()
+            want_count, want_total = expected[table.target]
+            matches = (count, int(total)) == (want_count, want_total)
+            ok = ok and matches
+            mark = "✓" if matches else "❌"
+            print(f"{mark} {table.target}: {count} строк (ожидалось {want_count}), сумма {total} (ожидалось {want_total})")
     pg_conn.commit()
-    print(f"✓ Успешно перенесено {len(feedback_to_insert)} отзывов.")
-    
-except Exception as e:
-    pg_conn.rollback()
-    print(f"❌ Ошибка при миграции обратной связи: {e}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Перенос данных из SQLite в PostgreSQL.")
+    parser.add_argument("--sqlite", default=os.path.join("data", "bot.db"), help="путь к файлу SQLite")
+    parser.add_argument("--dsn", help="строка подключения PostgreSQL (по умолчанию — DB_* из окружения)")
+    parser.add_argument("--jobs", type=int, default=min(4, os.cpu_count() or 1), help="параллельных процессов")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="строк на пачку")
+    parser.add_argument("--verify-only", action="store_true", help="только сверить число строк и контрольные суммы")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.sqlite):
+        print(f"❌ Файл SQLite не найден: {args.sqlite}")
+        return 1
+    if args.dsn:
+        pg_params = {"dsn": args.dsn}
+    else:
+        pg_params = {"host": DB_HOST, "port": DB_PORT, "user": DB_USER, "password": DB_PASSWORD, "dbname": DB_NAME}
+
+    print("--- Начало миграции данных из SQLite в PostgreSQL ---")
+    # Схема создается и обновляется теми же миграциями, что и при старте бота
+    from database.db import Database
+    Database(dsn=args.dsn).close()
+
+    sqlite_conn = _sqlite_connect(args.sqlite)
+    pg_conn = _pg_connect(pg_params)
+    try:
+        with pg_conn.cursor() as cur:
+            cur.execute(PROGRESS_DDL)
+        pg_conn.commit()
+        plan = plan_sources(sqlite_conn, pg_conn)
+
+        failed = []
+        if not args.verify_only:
+            started = time.perf_counter()
+            # Пользователи — первыми: остальные таблицы ссылаются на них внешними ключами
+            first = [(table, source) for table, source in plan if table.source == "users"]
+            rest = [(table, source) for table, source in plan if table.source != "users"]
+            for table, source in first:
+                print(f"✓ {source}: {migrate_source(args.sqlite, pg_params, table.source, source, args.chunk_size)[1]} строк")
+            # spawn: дочерние процессы не должны наследовать открытые соединения родителя
+            with ProcessPoolExecutor(max_workers=max(args.jobs, 1), mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = {
+                    pool.submit(migrate_source, args.sqlite, pg_params, table.source, source, args.chunk_size): source
+                    for table, source in rest
+                }
+                for future in as_completed(futures):
+                    try:
+                        source, total, note = future.result()
+                        print(f"✓ {source}: {total} строк ({note})", flush=True)
+                    except Exception as e:
+                        failed.append(futures[future])
+                        print(f"❌ Ошибка при переносе {futures[future]}: {e}", flush=True)
+            print(f"\nПеренос занял {time.perf_counter() - started:.1f} с.")
+            if failed:
+                print(f"❌ Не перенесены: {', '.join(sorted(failed))}. Запустите команду еще раз — перенос продолжится с сохраненной позиции.")
+
+        print("\n--- Сверка ---")
+        ok = verify(sqlite_conn, pg_conn, plan)
+    finally:
+        sqlite_conn.close()
+        pg_conn.close()
+    print("\n--- Миграция завершена! ---" if ok and not failed else "\n--- Миграция завершена с ошибками ---")
+    return 0 if ok and not failed else 1
 
 
-# --- Завершение ---
-sqlite_conn.close()
-pg_conn.close()
-print("\n--- Миграция завершена! ---") 
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
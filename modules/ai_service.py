@@ -1,27 +1,60 @@
 # код/ai_service.py
 
-import httpx
 import json
 import random
 import asyncio
+import time
 # --- ИЗМЕНЕНО: импортируем переменные YandexGPT ---
-from config import YANDEX_API_KEY, YANDEX_FOLDER_ID, YANDEX_GPT_URL, TIMEZONE
+from config import YANDEX_API_KEY, YANDEX_FOLDER_ID, YANDEX_GPT_URL, TIMEZONE, PROFILE_ACTIONS_WINDOW_DAYS
 from strings import (
     AI_UNIVERSAL_QUESTIONS, AI_FALLBACK_QUESTION, AI_QUESTION_PREFIX,
     NO_DATA, NOT_YET, NOT_UPDATED, DEFAULT_NAME
 )
-from datetime import datetime, date 
+from datetime import datetime, date, timedelta
 import re
 import logging
 from database.db import Database
+from modules.user_context import load_user
+from modules.metrics import LLM_REQUEST_SECONDS, LLM_RETRIES
 try:
     import pytz
 except ImportError:
     pytz = None
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+_httpx_module = None
+
+
+def _httpx():
+    """
+    httpx при первом обращении: модуль грузится при старте бота, а клиент нужен только
+    к первому запросу к YandexGPT (main.py прогревает импорт в фоне после запуска).
+    """
+    global _httpx_module
+    if _httpx_module is None:
+        import httpx
+        _httpx_module = httpx
+    return _httpx_module
+
+
+async def _post_yandex_gpt(client, call_type, attempt, headers, payload):
+    """POST в YandexGPT с записью задержки (по типу вызова и статусу ответа) и числа повторных попыток."""
+    httpx = _httpx()
+    if attempt > 0:
+        LLM_RETRIES.inc(call_type=call_type)
+    status = "error"
+    started = time.perf_counter()
+    try:
+        response = await client.post(YANDEX_GPT_URL, headers=headers, json=payload)
+        status = str(response.status_code)
+        return response
+    except httpx.TimeoutException:
+        status = "timeout"
+        raise
+    finally:
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, call_type=call_type, status=status)
+
 
 # --- Блок функций анализа текста (без изменений) ---
 def analyze_mood(text):
@@ -83,6 +116,7 @@ async def get_grok_question(user_id, user_request, user_response, feedback_type,
     Генерирует углубляющий вопрос от Grok с механизмом повторных попыток.
     NOTE: Эта функция теперь использует YandexGPT, несмотря на название.
     """
+    httpx = _httpx()
     if db is None:
         logger.error("Database object 'db' is required for get_grok_question")
         fallback_question = AI_FALLBACK_QUESTION.format(step=step, question=AI_UNIVERSAL_QUESTIONS.get(step, 'Что ещё приходит на ум?'))
@@ -167,7 +201,7 @@ async def get_grok_question(user_id, user_request, user_response, feedback_type,
         try:
             async with httpx.AsyncClient(timeout=20.0) as client:
                 logger.info(f"Sending Q{step} request to YandexGPT API for user {user_id} (Attempt {attempt + 1})")
-                response = await client.post(YANDEX_GPT_URL, headers=headers, json=payload)
+                response = await _post_yandex_gpt(client, "question", attempt, headers, payload)
                 response.raise_for_status()
                 data = response.json()
                 logger.info(f"Received Q{step} response from YandexGPT API for user {user_id}.")
@@ -243,6 +277,7 @@ async def get_grok_summary(user_id, interaction_data, db: Database = None):
     Генерирует краткое резюме сессии с картой.
     NOTE: Эта функция теперь использует YandexGPT, несмотря на название.
     """
+    httpx = _httpx()
     if db is None:
         logger.error("Database object 'db' is required for get_grok_summary")
         return "Ошибка: Не удалось получить доступ к базе данных для генерации резюме."
@@ -309,7 +344,7 @@ async def get_grok_summary(user_id, interaction_data, db: Database = None):
         try:
             async with httpx.AsyncClient(timeout=25.0) as client:
                 logger.info(f"Sending SUMMARY request to YandexGPT API for user {user_id} (Attempt {attempt + 1})")
-                response = await client.post(YANDEX_GPT_URL, headers=headers, json=payload)
+                response = await _post_yandex_gpt(client, "summary", attempt, headers, payload)
                 response.raise_for_status()
                 data = response.json()
                 logger.info(f"Received SUMMARY response from YandexGPT API for user {user_id}.")
@@ -373,6 +408,7 @@ async def get_grok_supportive_message(user_id, db: Database = None):
     Генерирует поддерживающее сообщение и вопрос о способе восстановления.
     NOTE: Эта функция теперь использует YandexGPT, несмотря на название.
     """
+    httpx = _httpx()
     if db is None:
         logger.error("Database object 'db' is required for get_grok_supportive_message")
         fallback_message = ("Пожалуйста, позаботься о себе. Ты важен(на). ✨\n\n"
@@ -386,7 +422,7 @@ async def get_grok_supportive_message(user_id, db: Database = None):
     }
 
     profile = await build_user_profile(user_id, db)
-    user_info = db.get_user(user_id)
+    user_info = await load_user(db, user_id)
     name = user_info.get("name", "Друг") if user_info else "Друг"
     profile_themes = profile.get("themes", [])
 
@@ -431,7 +467,7 @@ async def get_grok_supportive_message(user_id, db: Database = None):
         try:
             async with httpx.AsyncClient(timeout=15.0) as client:
                 logger.info(f"Sending SUPPORTIVE request to YandexGPT API for user {user_id} (Attempt {attempt + 1})")
-                response = await client.post(YANDEX_GPT_URL, headers=headers, json=payload)
+                response = await _post_yandex_gpt(client, "supportive", attempt, headers, payload)
                 response.raise_for_status()
                 data = response.json()
                 logger.info(f"Received SUPPORTIVE response from YandexGPT API for user {user_id}.")
@@ -483,9 +519,28 @@ async def get_grok_supportive_message(user_id, db: Database = None):
     return final_message if final_message is not None else random.choice(fallback_texts)
 
 
-# --- Построение профиля пользователя (без изменений) ---
+# --- Построение профиля пользователя ---
+# Действия с ответами пользователя в диалоге с картой: response_count в профиле — те из них,
+# где details["response"] строка (get_action_totals()["responses"])
+RESPONSE_ACTIONS = [
+    "initial_response_provided", "grok_response_provided",
+    "initial_response", "first_grok_response",
+    "second_grok_response", "third_grok_response"
+]
+
+
+async def _recent_actions(db, user_id, since):
+    """Действия пользователя начиная с since: iter_actions читает только партиции, пересекающиеся с окном."""
+    return [action async for action in db.iter_actions(user_id=user_id, since=since)]
+
+
 async def build_user_profile(user_id, db: Database):
-    profile_data = db.get_user_profile(user_id)
+    """
+    Пересобирает профиль пользователя. Настроение, темы и ресурсы считаются по действиям за последние
+    PROFILE_ACTIONS_WINDOW_DAYS дней, а response_count и days_active — за всю историю через
+    get_action_totals (вместе с днями, уже свернутыми ретеншном в агрегаты).
+    """
+    profile_data = await db.get_user_profile(user_id)
     now = datetime.now(TIMEZONE)
 
     cache_ttl = 1800
@@ -522,16 +577,20 @@ async def build_user_profile(user_id, db: Database):
     logger.info(f"Rebuilding profile for user {user_id} (Cache expired or profile missing/invalid)")
     base_profile_data = profile_data if profile_data else {"user_id": user_id}
 
-    actions = db.get_actions(user_id)
-    reflection_texts_list = db.get_all_reflection_texts(user_id)
-    last_recharge_method = db.get_last_recharge_method(user_id)
-    last_reflection_date_obj = db.get_last_reflection_date(user_id)
-    reflection_count = db.count_reflections(user_id)
-    total_cards_drawn = db.count_user_cards(user_id)
+    # Независимые чтения выполняются параллельно в пуле чтения
+    (actions, action_totals, reflection_texts_list, last_recharge_method,
+     last_reflection_date_obj, reflection_count, total_cards_drawn) = await asyncio.gather(
+        _recent_actions(db, user_id, now - timedelta(days=PROFILE_ACTIONS_WINDOW_DAYS)),
+        db.get_action_totals(user_id, RESPONSE_ACTIONS),
+        db.get_all_reflection_texts(user_id),
+        db.get_last_recharge_method(user_id),
+        db.get_last_reflection_date(user_id),
+        db.count_reflections(user_id),
+        db.count_user_cards(user_id),
+    )
 
     responses = []
     mood_trend_responses = []
-    timestamps = []
     last_initial_resource = base_profile_data.get("initial_resource")
     last_final_resource = base_profile_data.get("final_resource")
 
@@ -539,12 +598,7 @@ async def build_user_profile(user_id, db: Database):
         details = action.get("details", {})
         action_type = action.get("action", "")
 
-        relevant_response_actions = [
-            "initial_response_provided", "grok_response_provided",
-            "initial_response", "first_grok_response",
-            "second_grok_response", "third_grok_response"
-        ]
-        if action_type in relevant_response_actions and "response" in details:
+        if action_type in RESPONSE_ACTIONS and "response" in details:
             response_text = details["response"]
             if isinstance(response_text, str):
                 responses.append(response_text)
@@ -555,33 +609,8 @@ async def build_user_profile(user_id, db: Database):
         if action_type == "final_resource_selected" and "resource" in details:
              last_final_resource = details["resource"]
 
-        raw_timestamp = action.get("timestamp")
-        if isinstance(raw_timestamp, str):
-            try:
-                if raw_timestamp.endswith('Z'):
-                    dt_naive = datetime.fromisoformat(raw_timestamp[:-1])
-                    dt_aware = pytz.utc.localize(dt_naive) if pytz else dt_naive.replace(tzinfo=datetime.timezone.utc)
-                elif '+' in raw_timestamp:
-                    dt_aware = datetime.fromisoformat(raw_timestamp)
-                else:
-                    dt_naive = datetime.fromisoformat(raw_timestamp)
-                    dt_aware = pytz.utc.localize(dt_naive) if pytz else dt_naive.replace(tzinfo=datetime.timezone.utc)
-                ts = dt_aware.astimezone(TIMEZONE) if pytz else dt_aware
-                timestamps.append(ts)
-            except (ValueError, TypeError) as e:
-                logger.warning(f"Could not parse ISO timestamp string '{raw_timestamp}' for user {user_id}, action '{action.get('action')}': {e}")
-            except Exception as e:
-                 logger.warning(f"Error converting timestamp '{raw_timestamp}' for user {user_id}, action '{action.get('action')}': {e}")
-        elif isinstance(raw_timestamp, datetime):
-             try:
-                 ts = raw_timestamp.astimezone(TIMEZONE) if raw_timestamp.tzinfo and pytz else (TIMEZONE.localize(raw_timestamp) if pytz and not raw_timestamp.tzinfo else raw_timestamp)
-                 timestamps.append(ts)
-             except Exception as e:
-                 logger.warning(f"Error converting datetime timestamp '{raw_timestamp}' for user {user_id}, action '{action.get('action')}': {e}")
-        else:
-             logger.warning(f"Skipping action due to invalid timestamp type: {type(raw_timestamp)} in action: {action.get('action')}")
-
-    if not actions and not reflection_count and not total_cards_drawn and not base_profile_data.get("last_updated"):
+    first_action_day = action_totals["first_day"]
+    if not actions and first_action_day is None and not reflection_count and not total_cards_drawn and not base_profile_data.get("last_updated"):
         logger.info(f"No actions or other data for user {user_id}. Creating empty profile.")
         empty_profile = {
             "user_id": user_id, "mood": "unknown", "mood_trend": [], "themes": ["не определено"],
@@ -590,7 +619,7 @@ async def build_user_profile(user_id, db: Database):
             "total_cards_drawn": 0, "last_reflection_date": None, "reflection_count": 0,
             "last_updated": now
         }
-        db.update_user_profile(user_id, empty_profile)
+        await db.update_user_profile(user_id, empty_profile)
         return empty_profile
 
     all_responses_text = " ".join(responses)
@@ -607,14 +636,11 @@ async def build_user_profile(user_id, db: Database):
         mood = base_profile_data.get("mood", "unknown")
 
     themes = extract_themes(full_text) if full_text.strip() else base_profile_data.get("themes", ["не определено"])
-    response_count = len(responses)
+    response_count = action_totals["responses"]
 
     days_active = 0
-    if timestamps:
-        unique_dates = {ts.date() for ts in timestamps}
-        if unique_dates:
-             first_interaction_date = min(unique_dates)
-             days_active = (now.date() - first_interaction_date).days + 1
+    if first_action_day is not None:
+        days_active = (now.date() - first_action_day).days + 1
     elif base_profile_data:
         days_active = base_profile_data.get("days_active", 0)
 
@@ -645,7 +671,7 @@ async def build_user_profile(user_id, db: Database):
         "reflection_count": reflection_count,
         "last_updated": now
     }
-    db.update_user_profile(user_id, updated_profile)
+    await db.update_user_profile(user_id, updated_profile)
     logger.info(f"Profile rebuilt and updated for user {user_id}.")
 
     return updated_profile
@@ -657,6 +683,7 @@ async def get_reflection_summary(user_id: int, reflection_data: dict, db: Databa
     Генерирует AI-резюме для вечерней рефлексии.
     NOTE: Эта функция теперь использует YandexGPT, несмотря на название.
     """
+    httpx = _httpx()
     logger.info(f"Starting evening reflection summary generation for user {user_id}")
     headers = {
         "Authorization": f"Api-Key {YANDEX_API_KEY}",
@@ -669,7 +696,7 @@ async def get_reflection_summary(user_id: int, reflection_data: dict, db: Databa
     hard_moments = reflection_data.get("hard_moments", "не указано")
 
     profile = await build_user_profile(user_id, db)
-    user_info = db.get_user(user_id)
+    user_info = await load_user(db, user_id)
     name = user_info.get("name", "Друг") if user_info else "Друг"
     profile_themes_str = ", ".join(profile.get("themes", ["не определено"]))
 
@@ -715,7 +742,7 @@ async def get_reflection_summary(user_id: int, reflection_data: dict, db: Databa
         try:
             async with httpx.AsyncClient(timeout=25.0) as client:
                 logger.info(f"Sending REFLECTION SUMMARY request to YandexGPT API for user {user_id} (Attempt {attempt + 1})")
-                response = await client.post(YANDEX_GPT_URL, headers=headers, json=payload)
+                response = await _post_yandex_gpt(client, "reflection_summary", attempt, headers, payload)
                 response.raise_for_status()
                 data = response.json()
                 logger.info(f"Received REFLECTION SUMMARY response from YandexGPT API for user {user_id}.")
@@ -21,6 +21,8 @@ from .ai_service import (
 )
 from datetime import datetime, date # Добавили date
 from modules.user_management import UserState
+from modules.user_context import load_user, save_user
+from database.async_db import run_blocking
 from database.db import Database
 import logging
 
@@ -34,22 +36,62 @@ if not CARDS_DIR.startswith("/data") and not os.path.exists(CARDS_DIR):
      logger.warning(f"Cards directory '{CARDS_DIR}' did not exist and was created. Make sure card images are present.")
 
 
+def _list_card_files():
+    """Возвращает имена файлов карт в CARDS_DIR или None, если папки нет (блокирующий вызов)."""
+    if not os.path.isdir(CARDS_DIR):
+        return None
+    return [f for f in os.listdir(CARDS_DIR) if f.startswith("card_") and f.endswith(".jpg")]
+
+
+_card_deck = None
+
+
+async def load_card_deck(refresh=False):
+    """
+    Имена файлов карт, прочитанные один раз на процесс (колода меняется только с деплоем).
+    Отсутствующая или пустая папка не кэшируется — следующий вызов прочитает ее снова.
+    """
+    global _card_deck
+    if _card_deck is None or refresh:
+        # Чтение каталога блокирующее — выполняем в пуле потоков
+        files = await run_blocking(_list_card_files)
+        if not files:
+            return files
+        _card_deck = files
+    return _card_deck
+
+
 # --- Основная клавиатура (ИЗМЕНЕНО) ---
-async def get_main_menu(user_id, db: Database):
-    """Возвращает основную клавиатуру меню."""
+def _build_main_menu(with_bonus):
     keyboard = [
         [types.KeyboardButton(text="✨ Карта дня")],
         [types.KeyboardButton(text="🎓 Обучение"), types.KeyboardButton(text="🏃‍♀️ Марафоны")],
         [types.KeyboardButton(text="🌙 Итог дня")]
     ]
+    if with_bonus:
+        keyboard.append([types.KeyboardButton(text="💌 Подсказка Вселенной")])
+    return types.ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
+
+# Варианты меню собираются один раз при импорте и переиспользуются всеми сообщениями (не изменять!)
+MAIN_MENU = _build_main_menu(with_bonus=False)
+MAIN_MENU_WITH_BONUS = _build_main_menu(with_bonus=True)
+
+def main_menu_keyboard(bonus_available=False):
+    """Возвращает готовую клавиатуру меню по флагу bonus_available, без обращения к БД."""
+    return MAIN_MENU_WITH_BONUS if bonus_available else MAIN_MENU
+
+async def get_main_menu(user_id, db: Database):
+    """
+    Возвращает основную клавиатуру меню.
+    Флаг бонуса берется из строки пользователя текущего апдейта или кэша пользователей (load_user),
+    поэтому в конце сценариев отдельного запроса к БД нет.
+    """
     try:
-        user_data = db.get_user(user_id)
-        if user_data and user_data.get("bonus_available"):
-            keyboard.append([types.KeyboardButton(text="💌 Подсказка Вселенной")])
+        user_data = await load_user(db, user_id)
+        return main_menu_keyboard(bool(user_data and user_data.get("bonus_available")))
     except Exception as e:
         logger.error(f"Error getting user data for main menu (user {user_id}): {e}", exc_info=True)
-    
-    return types.ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
+        return MAIN_MENU
 
 
 # ================================
@@ -63,15 +105,15 @@ async def handle_card_request(message: types.Message, state: FSMContext, db: Dat
     Проверяет доступность карты и запускает замер ресурса.
     """
     user_id = message.from_user.id
-    user_data = db.get_user(user_id) or {}
+    user_data = await load_user(db, user_id) or {}
     name = user_data.get("name") or ""
     name = name.strip() if isinstance(name, str) else ""
     now = datetime.now(TIMEZONE)
     today = now.date()
 
-    logger.info(f"User {user_id}: Checking card availability for {today}")
-    card_available = db.is_card_available(user_id, today)
-    logger.info(f"User {user_id}: Card available? {card_available}")
+    logger.debug("User %s: checking card availability for %s", user_id, today)
+    card_available = await db.is_card_available(user_id, today, user_data=user_data)
+    logger.debug("User %s: card available? %s", user_id, card_available)
 
     # *** Обратите внимание на эту логику - если пользователь в исключениях, он все равно пойдет дальше ***
     if user_id not in NO_CARD_LIMIT_USERS and not card_available:
@@ -91,13 +133,13 @@ async def handle_card_request(message: types.Message, state: FSMContext, db: Dat
                 logger.error(f"Error formatting last_request time for user {user_id}: {e}")
                 last_req_time_str = TIME_ERROR
         text = CARD_ALREADY_DRAWN_MESSAGE_WITH_NAME.format(name=name, time=last_req_time_str) if name else CARD_ALREADY_DRAWN_MESSAGE_NO_NAME.format(time=last_req_time_str)
-        logger.info(f"User {user_id}: Sending 'already drawn' message.")
+        logger.info("User %s: sending 'already drawn' message.", user_id)
         await message.answer(text, reply_markup=await get_main_menu(user_id, db))
         await state.clear()
         return
 
     # *** Эта строка может быть немного запутывающей, если card_available == False, но пользователь в исключениях ***
-    logger.info(f"User {user_id}: Card available, starting initial resource check.")
+    logger.info("User %s: card available, starting initial resource check.", user_id)
     await logger_service.log_action(user_id, "card_flow_started", {"trigger": "button"})
     await ask_initial_resource(message, state, db, logger_service) # Переход к Шагу 1
 
@@ -105,7 +147,7 @@ async def handle_card_request(message: types.Message, state: FSMContext, db: Dat
 async def ask_initial_resource(message: types.Message, state: FSMContext, db: Database, logger_service):
     """Шаг 1: Задает вопрос о начальном ресурсном состоянии."""
     user_id = message.from_user.id
-    user_data = db.get_user(user_id) or {}
+    user_data = await load_user(db, user_id) or {}
     name = user_data.get("name") or ""
     name = name.strip() if isinstance(name, str) else ""
     text = INITIAL_RESOURCE_QUESTION_WITH_NAME.format(name=name) if name else INITIAL_RESOURCE_QUESTION_NO_NAME
@@ -134,7 +176,7 @@ async def ask_request_type_choice(event: types.Message | types.CallbackQuery, st
         user_id = event.from_user.id; message = event.message
     else:
         user_id = event.from_user.id; message = event
-    user_data = db.get_user(user_id) or {}
+    user_data = await load_user(db, user_id) or {}
     name = user_data.get("name") or ""; name = name.strip() if isinstance(name, str) else ""
     text = REQUEST_TYPE_QUESTION_WITH_NAME.format(name=name) if name else REQUEST_TYPE_QUESTION_NO_NAME
     keyboard = types.InlineKeyboardMarkup(inline_keyboard=[[ types.InlineKeyboardButton(text=BUTTON_MENTAL, callback_data="request_type_mental"), types.InlineKeyboardButton(text=BUTTON_TYPED, callback_data="request_type_typed"), ]])
@@ -186,26 +228,26 @@ async def draw_card_direct(message: types.Message, state: FSMContext, db: Databa
     # Используем переданный user_id
     user_data_fsm = await state.get_data()
     user_request = user_data_fsm.get("user_request", "")
-    user_db_data = db.get_user(user_id) or {} # Получаем данные по правильному ID
+    user_db_data = await load_user(db, user_id) or {} # Получаем данные по правильному ID
     name = user_db_data.get("name") or ""
     name = name.strip() if isinstance(name, str) else ""
     now_iso = datetime.now(TIMEZONE).isoformat()
 
     try:
          # Обновляем время последнего запроса для правильного ID
-         db.update_user(user_id, {"last_request": now_iso})
+         await save_user(db, user_id, {"last_request": now_iso})
     except Exception as e:
          logger.error(f"Failed to update last_request time for user {user_id}: {e}", exc_info=True)
 
     card_number = None
     try:
-        used_cards = db.get_user_cards(user_id)
+        used_cards = await db.get_user_cards(user_id)
+        all_card_files = await load_card_deck()
         # Убедимся, что папка существует перед чтением
-        if not os.path.isdir(CARDS_DIR):
+        if all_card_files is None:
              logger.error(f"Cards directory not found or not a directory: {CARDS_DIR}")
              await message.answer("Не могу найти папку с картами..."); await state.clear(); return
 
-        all_card_files = [f for f in os.listdir(CARDS_DIR) if f.startswith("card_") and f.endswith(".jpg")]
         if not all_card_files:
             logger.error(f"No card images found in {CARDS_DIR}.")
             await message.answer("В папке нет изображений карт..."); await state.clear(); return
@@ -225,8 +267,8 @@ async def draw_card_direct(message: types.Message, state: FSMContext, db: Databa
 
         available_cards = [c for c in all_cards if c not in used_cards]
         if not available_cards:
-            logger.info(f"Card deck reset for user {user_id} as all cards were used.")
-            db.reset_user_cards(user_id)
+            logger.info("Card deck reset for user %s as all cards were used.", user_id)
+            await db.reset_user_cards(user_id)
             available_cards = all_cards.copy() # Сбрасываем до полного списка
 
         # Доп. проверка на случай, если даже после сброса карт нет (маловероятно)
@@ -235,7 +277,7 @@ async def draw_card_direct(message: types.Message, state: FSMContext, db: Databa
              await message.answer("Не могу найти доступную карту..."); await state.clear(); return
 
         card_number = random.choice(available_cards)
-        db.add_user_card(user_id, card_number) # Добавляем карту в использованные
+        await db.add_user_card(user_id, card_number) # Добавляем карту в использованные
         await state.update_data(card_number=card_number)
 
     except Exception as card_logic_err:
@@ -246,7 +288,7 @@ async def draw_card_direct(message: types.Message, state: FSMContext, db: Databa
 
     # Отправка карты и вопроса (если номер карты успешно определен)
     card_path = os.path.join(CARDS_DIR, f"card_{card_number}.jpg")
-    if not os.path.exists(card_path):
+    if not await run_blocking(os.path.exists, card_path):
         logger.error(f"Card image file not found: {card_path} after selecting number {card_number} for user {user_id}.")
         await message.answer("Изображение для выбранной карты потерялось...")
         await state.clear()
@@ -296,7 +338,7 @@ async def process_initial_response(message: types.Message, state: FSMContext, db
 async def ask_exploration_choice(message: types.Message, state: FSMContext, db: Database, logger_service):
     """Шаг 5: Спрашивает, хочет ли пользователь исследовать ассоциации дальше с помощью Grok."""
     user_id = message.from_user.id
-    user_data = db.get_user(user_id) or {}
+    user_data = await load_user(db, user_id) or {}
     name = user_data.get("name") or ""
     name = name.strip() if isinstance(name, str) else ""
     text = (f"{name}, спасибо, что поделилась! Хочешь поисследовать эти ассоциации глубже с помощью нескольких вопросов от меня (это займет еще 5-7 минут)?" if name else "Спасибо, что поделилась! Хочешь поисследовать эти ассоциации глубже с помощью нескольких вопросов от меня (это займет еще 5-7 минут)?")
@@ -450,7 +492,7 @@ async def process_third_grok_response(message: types.Message, state: FSMContext,
     # Обновляем профиль пользователя после полного цикла вопросов
     try:
         await build_user_profile(user_id, db)
-        logger.info(f"User profile updated after full Grok interaction for user {user_id}")
+        logger.info("User profile updated after full Grok interaction for user %s", user_id)
     except Exception as e:
         logger.error(f"Failed to update user profile after interaction for user {user_id}: {e}", exc_info=True)
 
@@ -468,7 +510,7 @@ async def generate_and_send_summary(user_id: int, message: types.Message, state:
         return
 
     data = await state.get_data()
-    logger.info(f"Starting summary generation for user {user_id}")
+    logger.info("Starting summary generation for user %s", user_id)
     try:
         await message.bot.send_chat_action(user_id, 'typing') # Используем переданный user_id
     except Exception as e:
@@ -530,7 +572,7 @@ async def finish_interaction_flow(user_id: int, message: types.Message, state: F
              logger.error(f"Failed to clear state for INVALID user_id reference: {clear_err}", exc_info=True)
         return
 
-    user_db_data = db.get_user(user_id) or {}
+    user_db_data = await load_user(db, user_id) or {}
     name = user_db_data.get("name") or ""
     name = name.strip() if isinstance(name, str) else ""
     data = await state.get_data()
@@ -592,7 +634,7 @@ async def process_recharge_method(message: types.Message, state: FSMContext, db:
     """Шаг 8.5: Обрабатывает ответ о способе восстановления ресурса."""
     user_id = message.from_user.id # <<< ID пользователя из его сообщения
     recharge_method_text = message.text.strip()
-    user_db_data = db.get_user(user_id) or {}
+    user_db_data = await load_user(db, user_id) or {}
     name = user_db_data.get("name") or ""
     name = name.strip() if isinstance(name, str) else ""
     if not recharge_method_text: await message.answer("Пожалуйста, напиши, что тебе помогает восстановиться."); return
@@ -600,10 +642,10 @@ async def process_recharge_method(message: types.Message, state: FSMContext, db:
 
     try:
         now_iso = datetime.now(TIMEZONE).isoformat()
-        db.add_recharge_method(user_id, recharge_method_text, now_iso)
+        await db.add_recharge_method(user_id, recharge_method_text, now_iso)
         await state.update_data(recharge_method=recharge_method_text) # Сохраняем в state на всякий случай
         await logger_service.log_action(user_id, "recharge_method_provided", {"recharge_method": recharge_method_text})
-        logger.info(f"Recharge method '{recharge_method_text}' added to separate table for user {user_id}")
+        logger.info("Recharge method added to separate table for user %s", user_id)
     except Exception as e:
         logger.error(f"Failed to add recharge method to DB for user {user_id}: {e}", exc_info=True)
 
@@ -624,7 +666,7 @@ async def show_final_feedback_and_menu(message: types.Message, state: FSMContext
         await state.clear() # Пытаемся очистить состояние
         return
 
-    user_db_data = db.get_user(user_id) or {}
+    user_db_data = await load_user(db, user_id) or {}
     name = user_db_data.get("name") or ""
     name = name.strip() if isinstance(name, str) else ""
     data = await state.get_data()
@@ -640,8 +682,8 @@ async def show_final_feedback_and_menu(message: types.Message, state: FSMContext
         # Оставляем только не-None значения
         final_profile_data = {k: v for k, v in final_profile_data.items() if v is not None}
         if final_profile_data:
-            db.update_user_profile(user_id, final_profile_data)
-            logger.info(f"Final profile data (resources) saved for user {user_id} before state clear.") # Лог с правильным ID
+            await db.update_user_profile(user_id, final_profile_data)
+            logger.debug("Final profile data (resources) saved for user %s before state clear.", user_id)
     except Exception as e:
         logger.error(f"Error saving final profile resource data for user {user_id} before clear: {e}", exc_info=True)
 
@@ -666,19 +708,16 @@ async def show_final_feedback_and_menu(message: types.Message, state: FSMContext
 
     # Очищаем состояние FSM
     try:
-        current_state_before_clear = await state.get_state()
-        current_data_before_clear = await state.get_data() # Получаем данные перед очисткой для лога
-        logger.info(f"Clearing state for user {user_id} after card session. Current state: {current_state_before_clear}. Data: {current_data_before_clear}") # Лог с правильным ID
+        # Данные FSM (тексты ответов пользователя) в лог не пишем: это объемно и лишнее чтение хранилища
         await state.clear()
-        current_state_after_clear = await state.get_state()
-        logger.info(f"State cleared for user {user_id}. New state: {current_state_after_clear}") # Лог с правильным ID
+        logger.debug("State cleared for user %s after card session.", user_id)
     except Exception as e:
          logger.error(f"Failed to clear state for user {user_id}: {e}", exc_info=True)
 
 # === Обработчик финальной обратной связи (👍/🤔/😕) ===
 async def process_card_feedback(callback: types.CallbackQuery, state: FSMContext, db: Database, logger_service):
     user_id = callback.from_user.id
-    user_data = db.get_user(user_id) or {}
+    user_data = await load_user(db, user_id) or {}
     name = user_data.get("name") or ""
     name = name.strip() if isinstance(name, str) else ""
     callback_data = callback.data
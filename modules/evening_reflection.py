@@ -115,8 +115,8 @@ async def process_hard_moments(message: types.Message, state: FSMContext, db: Da
     try:
         today_str = datetime.now(TIMEZONE).strftime('%Y-%m-%d')
         created_at_iso = datetime.now(TIMEZONE).isoformat()
-        # --- ИСПРАВЛЕНИЕ: УБИРАЕМ await ПЕРЕД db.save_evening_reflection ---
-        db.save_evening_reflection(
+        # Запись выполняется в пуле потоков записи (database/async_db.py)
+        await db.save_evening_reflection(
             user_id=user_id,
             date=today_str,
             good_moments=good_moments,
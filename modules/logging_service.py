@@ -1,21 +1,28 @@
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 from config import TIMEZONE
+from modules.user_context import current_user, load_user
+
+logger = logging.getLogger(__name__)
 
 class LoggingService:
     def __init__(self, db):
         self.db = db
-        logging.basicConfig(level=logging.INFO)
 
     async def log_action(self, user_id, action, details=None):
-        chat = await self.db.bot.get_chat(user_id)
-        username = chat.username or ""
-        name = self.db.get_user(user_id)["name"]
+        # Внутри апдейта username и имя берутся из контекста запроса, без похода в Telegram и БД
+        ctx = current_user(self.db, user_id)
+        if ctx is not None:
+            username = ctx.username
+        else:
+            chat = await self.db.bot.get_chat(user_id)
+            username = chat.username or ""
+        name = (await load_user(self.db, user_id) or {}).get("name", "")
         timestamp = datetime.now(TIMEZONE).isoformat()
-        self.db.save_action(user_id, username, name, action, details or {}, timestamp)
-        logging.info(f"User {user_id}: {action}, details: {details}")
+        await self.db.save_action(user_id, username, name, action, details or {}, timestamp)
+        logger.info("User %s: %s, details: %s", user_id, action, details)
 
-    def get_logs_for_today(self):
-        today = datetime.now(TIMEZONE).date()
-        logs = self.db.get_actions()
-        return [log for log in logs if datetime.fromisoformat(log["timestamp"]).astimezone(TIMEZONE).date() == today]
+    def iter_logs_for_today(self, types=None, batch_size=500):
+        """Асинхронно и лениво отдает сегодняшние действия; фильтрация по дате выполняется в БД."""
+        start_of_day = datetime.now(TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+        return self.db.iter_actions(since=start_of_day, until=start_of_day + timedelta(days=1), types=types, batch_size=batch_size)
@@ -0,0 +1,137 @@
+# код/modules/logging_setup.py
+"""
+Единая настройка логирования процесса. Обработчики модулей пишут в QueueHandler, а
+форматирование (JSON, трейсбеки) и запись в поток выполняет отдельный поток QueueListener,
+так что цикл событий не ждет stderr. Повторяющиеся INFO/DEBUG-строки одного шаблона
+прореживаются SamplingFilter. Шаблоны сообщений — в %-стиле (logger.info("... %s", x)):
+отброшенные уровнем или выборкой записи вообще не форматируются.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from config import LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_LIMIT, LOG_SAMPLE_WINDOW
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+
+_listener = None
+_queue_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: время (UTC), уровень, логгер, сообщение, трейсбек и число прореженных повторов."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        sampled_out = getattr(record, "sampled_out", None)
+        if sampled_out:
+            entry["sampled_out"] = sampled_out
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает не больше limit записей одного шаблона (логгер + строка формата) за окно window секунд.
+    WARNING и выше не прореживаются. Первая запись шаблона в следующем окне получает атрибут
+    sampled_out — сколько повторов было отброшено в предыдущем.
+    """
+
+    def __init__(self, limit, window=60.0):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._counts = {}
+        self._suppressed = {}
+        self._window_start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.limit <= 0 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg).__name__)
+        now = time.monotonic()
+        with self._lock:
+            if now - self._window_start >= self.window:
+                self._suppressed = {k: count - self.limit for k, count in self._counts.items() if count > self.limit}
+                self._counts = {}
+                self._window_start = now
+            count = self._counts.get(key, 0) + 1
+            self._counts[key] = count
+            if count > self.limit:
+                return False
+            dropped = self._suppressed.pop(key, 0)
+        if dropped:
+            record.sampled_out = dropped
+        return True
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    В отличие от стандартного QueueHandler, в вызывающем потоке только подставляет аргументы
+    в сообщение (чтобы изменяемые объекты не поменялись до записи); форматтер и трейсбек —
+    в потоке слушателя.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, sample_limit=LOG_SAMPLE_LIMIT, sample_window=LOG_SAMPLE_WINDOW, stream=None):
+    """
+    Заменяет обработчики корневого логгера на очередь с фоновым слушателем. Повторный вызов
+    перенастраивает конвейер. Возвращает QueueListener (останавливается также при выходе).
+    """
+    global _listener, _queue_handler
+    stop_logging()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _LazyQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_limit, sample_window))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _queue_handler = queue_handler
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Снимает обработчик-очередь с корневого логгера, дописывает очередь и останавливает поток слушателя."""
+    global _listener, _queue_handler
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
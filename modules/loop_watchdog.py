@@ -0,0 +1,151 @@
+# код/modules/loop_watchdog.py
+"""
+Сторож задержки цикла событий. Корутина-«пульс» просыпается каждые LOOP_LAG_INTERVAL секунд
+и меряет, насколько позже срока ее разбудили (lag). Если пульса нет дольше LOOP_LAG_THRESHOLD,
+вспомогательный поток снимает стек потока цикла событий прямо во время блокировки: по нему
+видно обработчик и строку проекта, которая держит цикл (синхронный запрос к БД, gspread, файлы).
+Худшие места собираются в отчет (/lag для администратора) и в метрики.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from config import LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD
+from modules.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "bot_loop_lag_seconds", "Задержка пробуждения цикла событий",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+LOOP_STALLS = REGISTRY.counter("bot_loop_stalls_total", "Блокировки цикла событий дольше порога", ["handler"])
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return getattr(code, "co_qualname", code.co_name)
+
+
+class LoopWatchdog:
+    """
+    start() вызывается из работающего цикла событий, stop() — при завершении.
+    watch_handlers(dp) позволяет подписывать блокировки именами зарегистрированных обработчиков.
+    """
+
+    def __init__(self, threshold=LOOP_LAG_THRESHOLD, interval=LOOP_LAG_INTERVAL, keep=100):
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls = deque(maxlen=keep)  # последние блокировки
+        self.offenders = {}  # (обработчик, место в коде) -> {"count", "total", "max"}
+        self._lags = deque(maxlen=1000)
+        self._handler_codes = {}
+        self._last_beat = None
+        self._captured_beat = None
+        self._pending = None
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def watch_handlers(self, dp):
+        """Запоминает code-объекты обработчиков диспетчера, чтобы найти их в снятом стеке."""
+        for observer in dp.observers.values():
+            for handler in observer.handlers:
+                code = getattr(handler.callback, "__code__", None)
+                if code is not None:
+                    self._handler_codes[code] = handler.callback.__name__
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info("Loop watchdog started (interval %.3f s, threshold %.3f s)", self.interval, self.threshold)
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    async def _heartbeat(self):
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - before - self.interval)
+            self._last_beat = now
+            self._lags.append(lag)
+            LOOP_LAG_SECONDS.observe(lag)
+            pending, self._pending = self._pending, None
+            # Стек мог быть снят на самой границе уже закончившейся короткой задержки
+            if pending is not None and lag >= self.threshold:
+                self._record_stall(pending, lag)
+
+    def _watch(self):
+        while not self._stop.wait(self.interval / 2):
+            beat = self._last_beat
+            if beat == self._captured_beat or time.monotonic() - beat < self.threshold:
+                continue
+            self._captured_beat = beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                self._pending = self._describe(frame)
+
+    def _describe(self, frame):
+        """Обработчик (ближайший к листу зарегистрированный), место в коде проекта и текст стека."""
+        handler = culprit = None
+        current = frame
+        while current is not None:
+            code = current.f_code
+            if handler is None and code in self._handler_codes:
+                handler = self._handler_codes[code]
+            if culprit is None and code.co_filename.startswith(PROJECT_ROOT) and code.co_filename != __file__:
+                culprit = f"{_frame_name(current)} ({code.co_filename[len(PROJECT_ROOT):]}:{current.f_lineno})"
+            current = current.f_back
+        return {
+            "at": time.time(),
+            "handler": handler or "-",
+            "culprit": culprit or f"{_frame_name(frame)} ({frame.f_code.co_filename}:{frame.f_lineno})",
+            "stack": "".join(traceback.format_stack(frame, limit=25)),
+        }
+
+    def _record_stall(self, stall, lag):
+        stall["duration"] = lag
+        self.stalls.append(stall)
+        stats = self.offenders.setdefault((stall["handler"], stall["culprit"]), {"count": 0, "total": 0.0, "max": 0.0})
+        stats["count"] += 1
+        stats["total"] += lag
+        stats["max"] = max(stats["max"], lag)
+        LOOP_STALLS.inc(handler=stall["handler"])
+        logger.warning("Event loop blocked for %.3f s in handler %s at %s\n%s",
+                       lag, stall["handler"], stall["culprit"], stall["stack"])
+
+    def report(self, top=10):
+        """Текстовый отчет: задержка цикла за последние пробуждения и худшие места по суммарному времени блокировок."""
+        lags = sorted(self._lags)
+
+        def percentile(q):
+            return lags[min(len(lags) - 1, int(q * len(lags)))] * 1000 if lags else 0.0
+
+        lines = [
+            f"loop lag p50 {percentile(0.50):.1f} ms, p99 {percentile(0.99):.1f} ms, max {(lags[-1] * 1000 if lags else 0.0):.1f} ms "
+            f"(last {len(lags)} beats); stalls >= {self.threshold * 1000:.0f} ms: {sum(s['count'] for s in self.offenders.values())}"
+        ]
+        worst = sorted(self.offenders.items(), key=lambda item: item[1]["total"], reverse=True)[:top]
+        for (handler, culprit), stats in worst:
+            lines.append(f"{stats['total']:7.2f} s total, {stats['count']:4d}x, max {stats['max']:.2f} s  {handler} @ {culprit}")
+        return "\n".join(lines)
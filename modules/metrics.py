@@ -0,0 +1,201 @@
+# код/modules/metrics.py
+"""
+Метрики в текстовом формате Prometheus: счетчики и гистограммы с метками, плюс «снимки»
+(gauge) из stats() кэша пользователей и очередей апдейтов.
+Отдаются локальным HTTP-эндпоинтом /metrics (METRICS_PORT) и/или пишутся в файл (METRICS_FILE).
+Модуль импортируют и Database-фасад, и сервисы, поэтому aiogram и aiohttp здесь не импортируются:
+middleware диспетчера — в modules/metrics_middleware.py, aiohttp — при запуске HTTP-сервера.
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек (секунды)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Монотонный счетчик с метками: inc(method="getMe")."""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(name, "") for name in self.labelnames), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(zip(self.labelnames, key))} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Гистограмма с метками: observe(0.12, handler="x") или with hist.time(handler="x"): ..."""
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # метки -> [счетчики по корзинам (не накопительные) + корзина +Inf, сумма, количество]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        series = self._series.get(tuple(labels.get(name, "") for name in self.labelnames))
+        return series[2] if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        for key, (counts, total, count) in items:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', _format_value(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class Registry:
+    """Набор метрик процесса. Снимки — функции, возвращающие dict чисел (например, UserCache.stats)."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def register_snapshot(self, prefix, stats_func):
+        """Каждый числовой ключ stats_func() отдается как gauge <prefix>_<ключ>; повторная регистрация заменяет старую."""
+        with self._lock:
+            self._snapshots[prefix] = stats_func
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+            snapshots = list(self._snapshots.items())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for prefix, stats_func in snapshots:
+            try:
+                stats = stats_func()
+            except Exception as e:
+                logger.error(f"Failed to collect metrics snapshot '{prefix}': {e}", exc_info=True)
+                continue
+            for key, value in stats.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.histogram("bot_handler_seconds", "Время работы обработчика апдейта", ["handler"])
+HANDLER_ERRORS = REGISTRY.counter("bot_handler_errors_total", "Исключения в обработчиках", ["handler"])
+DB_CALL_SECONDS = REGISTRY.histogram("bot_db_call_seconds", "Время вызова метода Database с ожиданием пула", ["method"])
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "bot_yandexgpt_request_seconds", "Время HTTP-запроса к YandexGPT", ["call_type", "status"])
+LLM_RETRIES = REGISTRY.counter("bot_yandexgpt_retries_total", "Повторные попытки запросов к YandexGPT", ["call_type"])
+TELEGRAM_REQUEST_SECONDS = REGISTRY.histogram("bot_telegram_request_seconds", "Время запроса к Bot API", ["method"])
+TELEGRAM_ERRORS = REGISTRY.counter("bot_telegram_errors_total", "Ошибки Bot API по типу исключения", ["method", "error"])
+REMINDER_TICK_SECONDS = REGISTRY.histogram(
+    "bot_reminder_tick_seconds", "Длительность одного прохода напоминаний",
+    buckets=(0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+REMINDERS = REGISTRY.counter("bot_reminders_total", "Напоминания по результату отправки", ["result"])
+
+
+async def start_metrics_server(host, port):
+    """Поднимает локальный HTTP-сервер с /metrics и возвращает его AppRunner (для cleanup)."""
+    from aiohttp import web
+
+    async def metrics_handler(request):
+        return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return runner
+
+
+def write_metrics_file(path):
+    """Атомарно записывает текущие метрики в файл (для сбора node_exporter textfile и т.п.)."""
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(REGISTRY.render())
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.error(f"Failed to write metrics file {path}: {e}", exc_info=True)
@@ -0,0 +1,63 @@
+# код/modules/metrics_middleware.py
+"""
+Middleware aiogram, которые пишут задержки обработчиков и запросов к Bot API в реестр
+modules/metrics.py; импортируется только из main.py.
+"""
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+
+from modules.metrics import HANDLER_ERRORS, HANDLER_SECONDS, TELEGRAM_ERRORS, TELEGRAM_REQUEST_SECONDS
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Inner-middleware событий: к этому моменту фильтры пройдены и известен обработчик (data["handler"]),
+    поэтому задержка пишется с меткой имени зарегистрированной функции.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        callback = getattr(handler_object, "callback", None)
+        name = getattr(callback, "__name__", None) or type(event).__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, handler=name)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: задержка каждого запроса к Bot API и ошибки по типу (TelegramRetryAfter и т.д.)."""
+
+    async def __call__(self, make_request, bot, method):
+        api_method = getattr(method, "__api_method__", type(method).__name__)
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            TELEGRAM_ERRORS.inc(method=api_method, error=type(e).__name__)
+            raise
+        finally:
+            TELEGRAM_REQUEST_SECONDS.observe(time.perf_counter() - started, method=api_method)
+
+
+def setup_dispatcher_metrics(dp, bot):
+    """Подключает метрики обработчиков ко всем событиям диспетчера и метрики Bot API к сессии бота."""
+    middleware = HandlerMetricsMiddleware()
+    for event_name, observer in dp.observers.items():
+        # update — внутренний обработчик диспетчера, error — обработчики ошибок
+        if event_name not in ("update", "error"):
+            observer.middleware(middleware)
+    bot.session.middleware(TelegramMetricsMiddleware())
@@ -0,0 +1,204 @@
+# код/modules/profiler.py
+"""
+Сэмплирующий профилировщик по запросу администратора (/profile).
+Фоновый поток раз в PROFILE_SAMPLE_INTERVAL секунд снимает стеки всех потоков через
+sys._current_frames() — код бота не инструментируется, поэтому накладные расходы малы,
+а когда профилирование не запущено, их нет совсем. Результат — файл speedscope
+(https://www.speedscope.app) в DATA_DIR и текстовый топ самых горячих функций цикла событий.
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from config import DATA_DIR, TIMEZONE, PROFILE_SAMPLE_INTERVAL
+from database.async_db import run_blocking
+
+logger = logging.getLogger(__name__)
+
+_task = None
+_stop_event = None
+
+
+def _short_path(filename):
+    """Путь относительно site-packages или проекта — для читаемости отчета."""
+    for marker in ("site-packages" + os.sep, os.getcwd() + os.sep):
+        index = filename.find(marker)
+        if index != -1:
+            return filename[index + len(marker):]
+    return filename
+
+
+def _is_idle(frame):
+    """Поток цикла событий ждет в selector.select — он свободен."""
+    name, filename, _ = frame
+    return name == "select" and filename.endswith("selectors.py")
+
+
+class SamplingProfiler:
+    """Снимает стеки потоков с заданным интервалом между start() и stop()."""
+
+    def __init__(self, interval=PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()  # (ident, имя потока, стек от корня к листу) -> число сэмплов
+        self.loop_thread_id = None
+        self.duration = 0.0
+        self._thread = None
+        self._stop = threading.Event()
+        self._started = None
+
+    @property
+    def active(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Запускает сэмплирование; поток, вызвавший start(), считается потоком цикла событий."""
+        if self.active:
+            raise RuntimeError("Profiler is already running")
+        self.samples.clear()
+        self.loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.duration = time.perf_counter() - self._started if self._started else 0.0
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names, names_refreshed = {}, 0.0
+        while not self._stop.wait(self.interval):
+            now = time.monotonic()
+            if now - names_refreshed > 1.0:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                names_refreshed = now
+            for ident, frame in sys._current_frames().items():
+                if ident == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                stack.reverse()
+                self.samples[(ident, names.get(ident, str(ident)), tuple(stack))] += 1
+
+    def to_speedscope(self, name="cardbot"):
+        """Профиль в формате speedscope: по одному sampled-профилю на поток, вес сэмпла — интервал."""
+        frame_index, frames = {}, []
+        profiles = {}
+        for (ident, thread_name, stack), count in self.samples.items():
+            indexes = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": _short_path(frame[1]), "line": frame[2]})
+                indexes.append(frame_index[frame])
+            profile = profiles.setdefault(ident, {
+                "type": "sampled", "name": thread_name, "unit": "seconds",
+                "startValue": 0, "endValue": 0, "samples": [], "weights": [],
+            })
+            weight = count * self.interval
+            profile["samples"].append(indexes)
+            profile["weights"].append(weight)
+            profile["endValue"] += weight
+        ordered = sorted(profiles.items(), key=lambda item: item[0] != self.loop_thread_id)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "cardbot profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [profile for _, profile in ordered],
+        }
+
+    def write_speedscope(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_speedscope(), f, ensure_ascii=False)
+        return path
+
+    def summary(self, top=15):
+        """
+        Топ функций потока цикла событий: собственное время (функция — лист стека) и полное
+        (функция где-то в стеке), в процентах от занятых сэмплов. Ожидание в select считается простоем.
+        """
+        own, total = Counter(), Counter()
+        busy = idle = 0
+        for (ident, _, stack), count in self.samples.items():
+            if ident != self.loop_thread_id or not stack:
+                continue
+            if _is_idle(stack[-1]):
+                idle += count
+                continue
+            busy += count
+            own[stack[-1]] += count
+            for frame in set(stack):
+                total[frame] += count
+        lines = [f"{self.duration:.1f} s, {busy + idle} samples of the event loop, busy {100 * busy / max(1, busy + idle):.1f}%"]
+        if busy:
+            lines.append("  self%  total%  function")
+            for frame, count in own.most_common(top):
+                name, filename, line = frame
+                lines.append(f"{100 * count / busy:6.1f} {100 * total[frame] / busy:7.1f}  {name} ({_short_path(filename)}:{line})")
+        return "\n".join(lines)
+
+
+def is_profiling():
+    return _task is not None and not _task.done()
+
+
+def stop_profiling():
+    """Досрочно завершает текущий сеанс. Возвращает False, если профилирование не запущено."""
+    if not is_profiling():
+        return False
+    _stop_event.set()
+    return True
+
+
+async def profile(seconds, top=15):
+    """Профилирует seconds секунд (или до stop_profiling()), пишет файл в DATA_DIR. Возвращает (путь, сводка)."""
+    global _stop_event
+    _stop_event = asyncio.Event()
+    profiler = SamplingProfiler()
+    profiler.start()
+    try:
+        await asyncio.wait_for(_stop_event.wait(), timeout=seconds)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        profiler.stop()
+    path = os.path.join(DATA_DIR, f"profile-{datetime.now(TIMEZONE):%Y%m%d-%H%M%S}.speedscope.json")
+    await run_blocking(profiler.write_speedscope, path)
+    logger.info("Profile written to %s (%d stacks)", path, len(profiler.samples))
+    return path, profiler.summary(top)
+
+
+def start_profiling(seconds, report, top=15):
+    """
+    Запускает сеанс в фоне; по завершении вызывает await report(path, summary).
+    Одновременно идет не больше одного сеанса.
+    """
+    global _task
+    if is_profiling():
+        raise RuntimeError("Profiling is already running")
+
+    async def run():
+        try:
+            path, summary = await profile(seconds, top)
+            await report(path, summary)
+        except Exception as e:
+            logger.error(f"Profiling session failed: {e}", exc_info=True)
+
+    _task = asyncio.create_task(run())
+    return _task
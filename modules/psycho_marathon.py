@@ -5,14 +5,13 @@ import os
 import json
 import asyncio
 from datetime import datetime, timedelta
-import gspread
-from google.oauth2.service_account import Credentials
 from aiogram import Bot, types
 from aiogram.fsm.context import FSMContext
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from config import MARATHONS, TUTORIALS, TIMEZONE, GOOGLE_SHEET_NAME
 from .user_management import UserState
 from database.db import Database
+from database.async_db import run_blocking
 from modules.logging_service import LoggingService
 from modules.quiz_handler import start_mak_quiz
 
@@ -25,6 +24,9 @@ CACHE_TTL = timedelta(minutes=5)
 
 def get_gsheet_client():
     """Настраивает и возвращает клиент для работы с Google Sheets."""
+    # gspread и google-auth тяжелые и нужны только здесь — импорт при первом обращении, в пуле потоков
+    import gspread
+    from google.oauth2.service_account import Credentials
     try:
         creds_json_str = os.getenv("GOOGLE_CREDENTIALS_JSON")
         if not creds_json_str:
@@ -44,6 +46,7 @@ def get_gsheet_client():
 
 def get_marathon_schedule_from_sheet():
     """Загружает расписание всех марафонов из Google Таблицы с кэшированием."""
+    import gspread
     global schedule_cache, cache_timestamp
     now = datetime.now()
 
@@ -72,7 +75,7 @@ def get_marathon_schedule_from_sheet():
 
         schedule_cache = schedule
         cache_timestamp = now
-        logger.info(f"Successfully loaded and cached schedule for {len(schedule)} programs from Google Sheet.")
+        logger.info("Successfully loaded and cached schedule for %d programs from Google Sheet.", len(schedule))
         return schedule
     except gspread.exceptions.WorksheetNotFound:
         logger.error(f"Worksheet 'MarathonContent' not found.")
@@ -81,14 +84,20 @@ def get_marathon_schedule_from_sheet():
         logger.error(f"Failed to read from Google Sheet: {e}", exc_info=True)
         return {}
 
+async def load_marathon_schedule():
+    """Асинхронная обертка: свежий кэш отдается сразу, сетевой запрос к Google Sheets идет в пуле потоков."""
+    if schedule_cache and cache_timestamp and (datetime.now() - cache_timestamp < CACHE_TTL):
+        return schedule_cache
+    return await run_blocking(get_marathon_schedule_from_sheet)
+
 # --- POST SENDING LOGIC ---
 async def send_post_and_schedule_next(bot: Bot, scheduler: AsyncIOScheduler, user_id: int, program_id: str, post_id_to_send: int, state: FSMContext, logger_service: LoggingService):
     """
     Отправляет текущий пост и планирует/предлагает следующий.
     """
-    logger.info(f"send_post_and_schedule_next вызван для user_id={user_id}, program_id={program_id}, post_id_to_send={post_id_to_send}")
-    schedule = get_marathon_schedule_from_sheet().get(program_id, [])
-    logger.info(f"Загружено {len(schedule)} постов для программы {program_id}")
+    logger.debug("send_post_and_schedule_next вызван для user_id=%s, program_id=%s, post_id_to_send=%s", user_id, program_id, post_id_to_send)
+    schedule = (await load_marathon_schedule()).get(program_id, [])
+    logger.debug("Загружено %d постов для программы %s", len(schedule), program_id)
     current_post_data = next((p for p in schedule if p.get('post_id') and int(p.get('post_id')) == post_id_to_send), None)
     
     if not current_post_data:
@@ -110,7 +119,7 @@ async def send_post_and_schedule_next(bot: Bot, scheduler: AsyncIOScheduler, use
                     options=options,
                     is_anonymous=is_anonymous
                 )
-                logger.info(f"Sent poll {program_id}/{current_post_data['day']}/{post_id_to_send} to user {user_id}")
+                logger.info("Sent poll %s/%s/%s to user %s", program_id, current_post_data['day'], post_id_to_send, user_id)
             else:
                 logger.warning(f"Not enough options to create a poll for post ID {post_id_to_send}. Skipping.")
 
@@ -141,7 +150,7 @@ async def send_post_and_schedule_next(bot: Bot, scheduler: AsyncIOScheduler, use
             elif text:
                 await bot.send_message(user_id, text=text, parse_mode="HTML", reply_markup=reply_markup)
             
-            logger.info(f"Sent post {program_id}/{current_post_data['day']}/{post_id_to_send} to user {user_id}")
+            logger.info("Sent post %s/%s/%s to user %s", program_id, current_post_data['day'], post_id_to_send, user_id)
 
         await state.update_data(last_post_id=current_post_data['post_id'])
         # --- КОНЕЦ ИЗМЕНЕНИЯ ---
@@ -164,11 +173,11 @@ async def send_post_and_schedule_next(bot: Bot, scheduler: AsyncIOScheduler, use
                 
                 run_date = datetime.now(TIMEZONE) + timedelta(seconds=delay_seconds)
                 scheduler.add_job(send_post_and_schedule_next, 'date', run_date=run_date, args=[bot, scheduler, user_id, program_id, next_post_data['post_id'], state, logger_service], id=f"prog:{user_id}:{program_id}:{next_post_data['post_id']}")
-                logger.info(f"Scheduled next post for user {user_id} at {run_date.strftime('%Y-%m-%d %H:%M:%S')}")
+                logger.info("Scheduled next post for user %s at %s", user_id, run_date)
             except (ValueError, TypeError) as e:
                 logger.error(f"Invalid delay format '{trigger_value}' for post {next_post_data.get('post_id')}: {e}")
     else:
-        logger.info(f"User {user_id} has completed program '{program_id}'.")
+        logger.info("User %s has completed program '%s'.", user_id, program_id)
         # --- ИЗМЕНЕНИЕ: Запускаем опросник вместо простого завершения ---
         if program_id == "mak_tutorial":
             await bot.send_message(user_id, "Вы завершили основной блок обучения! 🎉")
@@ -178,12 +187,11 @@ async def send_post_and_schedule_next(bot: Bot, scheduler: AsyncIOScheduler, use
             await state.clear()
 
 async def handle_training_command(message: types.Message, state: FSMContext, db: Database, logger_service: LoggingService):
-    logger.info(f"handle_training_command вызван для user_id={message.from_user.id}")
+    logger.debug("handle_training_command вызван для user_id=%s", message.from_user.id)
     await state.clear()
     keyboard = types.InlineKeyboardMarkup(inline_keyboard=[[types.InlineKeyboardButton(text="Выбрать обучение", callback_data="list_tutorials")]])
-    logger.info("Создана клавиатура для обучения с callback_data=list_tutorials")
     await message.answer("Здесь собраны обучающие курсы. ✨", reply_markup=keyboard)
-    logger.info("Отправлено сообщение с обучающими курсами")
+    logger.debug("Отправлено сообщение с обучающими курсами")
 
 async def handle_marathon_command(message: types.Message, state: FSMContext):
     await state.clear()
@@ -191,47 +199,42 @@ async def handle_marathon_command(message: types.Message, state: FSMContext):
     await message.answer("Здесь вы можете начать один из наших марафонов. 🏃‍♀️", reply_markup=keyboard)
 
 async def list_programs_callback(callback: types.CallbackQuery, state: FSMContext):
-    logger.info(f"list_programs_callback вызван с callback_data={callback.data}")
+    logger.debug("list_programs_callback вызван с callback_data=%s", callback.data)
     program_type = callback.data.split("_")[1]
-    logger.info(f"Извлечен program_type={program_type}")
     
     programs = TUTORIALS if program_type == "tutorials" else MARATHONS
-    logger.info(f"Выбраны программы: {list(programs.keys())}")
     
     title = "Выберите обучающий курс:" if program_type == "tutorials" else "Выберите марафон:"
     buttons = [[types.InlineKeyboardButton(text=settings["name"], callback_data=f"program_{prog_id}")] for prog_id, settings in programs.items()]
-    logger.info(f"Создано {len(buttons)} кнопок: {[btn[0].text for btn in buttons]}")
+    logger.debug("Создано %d кнопок для %s", len(buttons), program_type)
     
     await callback.message.edit_text(title, reply_markup=types.InlineKeyboardMarkup(inline_keyboard=buttons))
     await callback.answer()
-    logger.info("list_programs_callback завершен успешно")
+    logger.debug("list_programs_callback завершен успешно")
 
 async def program_selection_callback(callback: types.CallbackQuery, state: FSMContext, bot: Bot, scheduler: AsyncIOScheduler, logger_service: LoggingService):
-    logger.info(f"program_selection_callback вызван с callback_data={callback.data}")
+    logger.debug("program_selection_callback вызван с callback_data=%s", callback.data)
     # Убираем "program_" и получаем program_id
     program_id = callback.data.replace("program_", "")
     user_id = callback.from_user.id
-    logger.info(f"Извлечен program_id={program_id}, user_id={user_id}")
     
     all_programs = {**TUTORIALS, **MARATHONS}
-    logger.info(f"Доступные программы: {list(all_programs.keys())}")
 
     if program_id in all_programs:
         program_name = all_programs[program_id]["name"]
-        logger.info(f"Найдена программа: {program_name}")
+        logger.info("User %s started program %s", user_id, program_id)
         
         await state.set_state(UserState.in_marathon)
         await state.update_data(current_program=program_id)
         await callback.message.edit_text(f"Вы начали программу \"{program_name}\"! Отправляю первое сообщение... 🚀")
         
-        schedule = get_marathon_schedule_from_sheet().get(program_id, [])
-        logger.info(f"Загружено {len(schedule)} постов для программы {program_id}")
+        schedule = (await load_marathon_schedule()).get(program_id, [])
+        logger.debug("Загружено %d постов для программы %s", len(schedule), program_id)
         
         first_post = next((p for p in schedule if p.get('day') and int(p.get('day')) == 1 and p.get('trigger_type') == 'immediate'), None)
-        logger.info(f"Первый пост: {first_post}")
 
         if first_post:
-            logger.info(f"Запускаю send_post_and_schedule_next для первого поста")
+            logger.debug("Запускаю send_post_and_schedule_next для первого поста")
             asyncio.create_task(send_post_and_schedule_next(bot, scheduler, user_id, program_id, first_post['post_id'], state, logger_service))
         else:
             logger.warning(f"Не найдено стартовое сообщение для программы {program_id}")
@@ -240,16 +243,15 @@ async def program_selection_callback(callback: types.CallbackQuery, state: FSMCo
         logger.error(f"Программа {program_id} не найдена в списке доступных программ")
         await callback.message.edit_text("К сожалению, такая программа не найдена.")
     await callback.answer()
-    logger.info("program_selection_callback завершен")
+    logger.debug("program_selection_callback завершен")
 
 async def next_step_callback(callback: types.CallbackQuery, state: FSMContext, bot: Bot, scheduler: AsyncIOScheduler, logger_service: LoggingService):
     user_id = callback.from_user.id
-    logger.info(f"next_step_callback вызван для user_id={user_id} с callback_data: {callback.data}")
+    logger.debug("next_step_callback вызван для user_id=%s с callback_data: %s", user_id, callback.data)
     
     try:
         # Убираем "next_step_" и разбираем остальное
         data_without_prefix = callback.data.replace("next_step_", "")
-        logger.info(f"callback_data без префикса: {data_without_prefix}")
         
         # Ищем последнее подчёркивание, которое отделяет program_id от post_id
         last_underscore_index = data_without_prefix.rfind("_")
@@ -261,15 +263,13 @@ async def next_step_callback(callback: types.CallbackQuery, state: FSMContext, b
         program_id = data_without_prefix[:last_underscore_index]
         next_post_id_str = data_without_prefix[last_underscore_index + 1:]
         
-        logger.info(f"Извлеченные данные: program_id={program_id}, next_post_id_str={next_post_id_str}")
         
         next_post_id = int(next_post_id_str)
-        logger.info(f"Преобразованный next_post_id: {next_post_id}")
         
         await callback.message.edit_reply_markup(reply_markup=None)
         await callback.answer("Отправляю следующий шаг...")
         
-        logger.info(f"Запускаю send_post_and_schedule_next для user_id={user_id}, program_id={program_id}, next_post_id={next_post_id}")
+        logger.debug("Запускаю send_post_and_schedule_next для user_id=%s, program_id=%s, next_post_id=%s", user_id, program_id, next_post_id)
         asyncio.create_task(send_post_and_schedule_next(bot, scheduler, user_id, program_id, next_post_id, state, logger_service))
         
     except (ValueError, IndexError) as e:
@@ -0,0 +1,58 @@
+# код/modules/startup.py
+"""
+Замеры холодного старта. Независимые шаги инициализации main() идут параллельно, поэтому
+в сводке у каждого шага своя длительность, а итог — время от начала импорта main.py до
+готовности принимать апдейты. Шаги, которые не нужны для обработки первых апдейтов
+(команды меню, прогрев импортов и расписания), выполняются в фоне и логируются по завершении.
+"""
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Собирает длительности шагов старта: run() для корутин, record() для уже измеренных интервалов."""
+
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.steps = []  # (имя, секунды) в порядке завершения
+        self.ready_at = None
+        self._background = set()
+
+    def record(self, name, seconds):
+        self.steps.append((name, seconds))
+        if self.ready_at is not None:
+            logger.info("Startup step %s finished in %.3f s (after ready)", name, seconds)
+
+    async def run(self, name, awaitable):
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def background(self, name, awaitable):
+        """Запускает шаг в фоне: ошибка логируется и не мешает работе бота."""
+        async def step():
+            try:
+                await self.run(name, awaitable)
+            except Exception as e:
+                logger.error(f"Background startup step {name} failed: {e}", exc_info=True)
+
+        task = asyncio.create_task(step())
+        # Держим ссылку до завершения, иначе задачу может собрать сборщик мусора
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    def ready(self):
+        """Отмечает готовность обрабатывать апдейты и логирует сводку. Возвращает время от старта."""
+        self.ready_at = time.perf_counter()
+        total = self.ready_at - self.started
+        logger.info("Ready to serve updates in %.3f s (%s)", total, self.summary())
+        return total
+
+    def summary(self):
+        return ", ".join(f"{name} {seconds:.3f} s" for name, seconds in self.steps)
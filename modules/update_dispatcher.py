@@ -0,0 +1,118 @@
+# код/modules/update_dispatcher.py
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import TelegramObject
+
+from config import UPDATE_MAX_CONCURRENCY, UPDATE_USER_QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+
+class _UserSlot:
+    """Очередь одного пользователя: FIFO-замок и число апдейтов в работе (выполняется + ждут)."""
+    __slots__ = ("lock", "pending")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pending = 0
+
+
+class UserOrderingMiddleware(BaseMiddleware):
+    """
+    Обрабатывает апдейты одного пользователя строго по очереди, а разных пользователей — параллельно.
+    asyncio.Lock будит ожидающих в порядке прихода, поэтому порядок апдейтов сохраняется.
+    Не больше max_queue_depth апдейтов на пользователя (лишние отбрасываются) и не больше
+    max_concurrency обработчиков одновременно на весь процесс.
+    Регистрируется первым outer-middleware апдейтов, чтобы отложенная запись RequestUser
+    завершалась до начала следующего апдейта того же пользователя.
+    stats() вызывается и из потоков (задание APScheduler, запись файла метрик), поэтому
+    окно задержек пишется и копируется под threading.Lock.
+    """
+
+    def __init__(self, max_concurrency=UPDATE_MAX_CONCURRENCY, max_queue_depth=UPDATE_USER_QUEUE_DEPTH, lag_window=1000):
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+        self._slots: Dict[int, _UserSlot] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._running = 0
+        self._queued = 0
+        self._lags = deque(maxlen=lag_window)
+        self._lags_lock = threading.Lock()
+        self.processed = 0
+        self.dropped = 0
+        self.max_lag = 0.0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            self._queued += 1
+            return await self._run(handler, event, data, time.monotonic())
+
+        slot = self._slots.get(user.id)
+        if slot is None:
+            slot = self._slots[user.id] = _UserSlot()
+        if slot.pending >= self.max_queue_depth:
+            self.dropped += 1
+            logger.warning(f"Dropping update for user {user.id}: {slot.pending} updates already queued.")
+            return UNHANDLED
+
+        slot.pending += 1
+        self._queued += 1
+        enqueued_at = time.monotonic()
+        try:
+            async with slot.lock:
+                return await self._run(handler, event, data, enqueued_at)
+        finally:
+            slot.pending -= 1
+            if slot.pending == 0:
+                self._slots.pop(user.id, None)
+
+    async def _run(self, handler, event, data, enqueued_at):
+        async with self._semaphore:
+            self._queued -= 1
+            lag = time.monotonic() - enqueued_at
+            with self._lags_lock:
+                self._lags.append(lag)
+                if lag > self.max_lag:
+                    self.max_lag = lag
+            self._running += 1
+            try:
+                return await handler(event, data)
+            finally:
+                self._running -= 1
+                self.processed += 1
+
+    def stats(self):
+        """Метрики очередей: задержка от прихода апдейта до старта обработчика (секунды) и загрузка."""
+        with self._lags_lock:
+            lags = list(self._lags)
+            max_lag = self.max_lag
+        lags.sort()
+
+        def percentile(q):
+            if not lags:
+                return 0.0
+            return lags[min(len(lags) - 1, int(q * len(lags)))]
+
+        return {
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "running": self._running,
+            "queued_users": len(self._slots),
+            "queued_updates": self._queued,
+            "lag_p50": percentile(0.50),
+            "lag_p95": percentile(0.95),
+            "lag_max": max_lag,
+        }
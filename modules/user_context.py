@@ -0,0 +1,117 @@
+# код/modules/user_context.py
+import logging
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+# Контекст текущего апдейта; внутри обработчиков и вызываемых ими функций указывает на RequestUser
+_current_request_user: ContextVar["RequestUser | None"] = ContextVar("request_user", default=None)
+
+
+class RequestUser:
+    """
+    Данные пользователя в рамках одного апдейта.
+    Строка из БД читается лениво и не больше одного раза, изменения копятся
+    и записываются одним update_user в конце апдейта (flush). db — AsyncDatabase.
+    """
+
+    def __init__(self, db, user_id, username="", full_name=""):
+        self.db = db
+        self.user_id = user_id
+        self.username = username
+        self.full_name = full_name
+        self._data = None
+        self._pending = {}
+        self._closed = False
+
+    async def load(self):
+        """Данные пользователя с учетом еще не записанных изменений."""
+        if self._data is None:
+            self._data = await self.db.get_user(self.user_id) or {}
+            self._data.update(self._pending)
+        return self._data
+
+    async def update(self, data):
+        """Откладывает запись полей до конца апдейта; после flush пишет сразу."""
+        if self._closed:
+            await self.db.update_user(self.user_id, data)
+            if self._data is not None:
+                self._data.update(data)
+            return
+        self._pending.update(data)
+        if self._data is not None:
+            self._data.update(data)
+
+    async def flush(self):
+        """Записывает накопленные изменения одним запросом."""
+        if self._pending:
+            pending, self._pending = self._pending, {}
+            try:
+                await self.db.update_user(self.user_id, pending)
+            except Exception as e:
+                logger.error(f"Failed to flush user data for user {self.user_id}: {e}", exc_info=True)
+
+    async def close(self):
+        """Завершает апдейт: сбрасывает изменения, дальнейшие записи (например, из фоновых задач) идут напрямую."""
+        await self.flush()
+        self._closed = True
+
+
+def current_user(db=None, user_id=None):
+    """Возвращает RequestUser текущего апдейта, если он относится к этому пользователю и этой БД."""
+    ctx = _current_request_user.get()
+    if ctx is None:
+        return None
+    if user_id is not None and ctx.user_id != user_id:
+        return None
+    if db is not None and ctx.db is not db:
+        return None
+    return ctx
+
+
+async def load_user(db, user_id):
+    """Аналог db.get_user: внутри апдейта отдает закэшированную строку текущего пользователя."""
+    ctx = current_user(db, user_id)
+    if ctx is not None:
+        return await ctx.load()
+    return await db.get_user(user_id)
+
+
+async def save_user(db, user_id, data):
+    """Аналог db.update_user: внутри апдейта откладывает запись до его завершения."""
+    ctx = current_user(db, user_id)
+    if ctx is not None:
+        await ctx.update(data)
+        return
+    await db.update_user(user_id, data)
+
+
+class RequestUserMiddleware(BaseMiddleware):
+    """
+    Создает RequestUser для автора апдейта и передает его обработчикам как request_user.
+    Регистрируется как outer-middleware апдейтов, после встроенного UserContextMiddleware aiogram.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        db = data.get("db")
+        if user is None or db is None:
+            return await handler(event, data)
+
+        request_user = RequestUser(db, user.id, username=user.username or "", full_name=user.full_name or "")
+        data["request_user"] = request_user
+        token = _current_request_user.set(request_user)
+        try:
+            return await handler(event, data)
+        finally:
+            _current_request_user.reset(token)
+            await request_user.close()
@@ -1,6 +1,7 @@
 # код/user_management.py
 from aiogram.fsm.state import State, StatesGroup
 import logging
+from modules.user_context import save_user
 
 logger = logging.getLogger(__name__)
 
@@ -44,31 +45,24 @@ class QuizState(StatesGroup):
 
 
 class UserManager:
-    # --- Код UserManager остается БЕЗ ИЗМЕНЕНИЙ ---
+    # Запись идет UPSERT-ом: отсутствующая строка создается, поэтому предварительное чтение не нужно.
+    # Кэш пользователей (Database.user_cache) сбрасывается внутри update_user.
     def __init__(self, db):
         self.db = db
 
     async def set_name(self, user_id, name):
-        user_data = self.db.get_user(user_id)
-        if not user_data: logger.warning(f"UserManager: User {user_id} not found when trying to set name...")
-        self.db.update_user(user_id, {"name": name})
+        await save_user(self.db, user_id, {"name": name})
 
     async def set_reminder(self, user_id, morning_time, evening_time): # Уже принимает оба времени
         """Устанавливает утреннее и вечернее время напоминания."""
-        user_data = self.db.get_user(user_id)
-        if not user_data: logger.warning(f"UserManager: User {user_id} not found when trying to set reminder.")
-        self.db.update_user(user_id, {
+        await save_user(self.db, user_id, {
             "reminder_time": morning_time, # Может быть None
             "reminder_time_evening": evening_time # Может быть None
         })
 
     async def clear_reminders(self, user_id):
         """Сбрасывает оба времени напоминания."""
-        user_data = self.db.get_user(user_id)
-        if not user_data: logger.warning(f"UserManager: User {user_id} not found when trying to clear reminders.")
-        self.db.update_user(user_id, {"reminder_time": None, "reminder_time_evening": None})
+        await save_user(self.db, user_id, {"reminder_time": None, "reminder_time_evening": None})
 
     async def set_bonus_available(self, user_id, value):
-        user_data = self.db.get_user(user_id)
-        if not user_data: logger.warning(f"UserManager: User {user_id} not found when trying to set bonus.")
-        self.db.update_user(user_id, {"bonus_available": value})
\ No newline at end of file
+        await save_user(self.db, user_id, {"bonus_available": value})
@@ -0,0 +1,86 @@
+# код/modules/webhook_server.py
+import asyncio
+import logging
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from config import (
+    TELEGRAM_API_SERVER, WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET,
+    WEBHOOK_LISTEN_HOST, WEBHOOK_LISTEN_PORT, WEBHOOK_MAX_CONNECTIONS, WEBHOOK_SET_ON_START
+)
+
+logger = logging.getLogger(__name__)
+
+
+def build_session():
+    """
+    Сессия Bot API. Если задан TELEGRAM_API_SERVER (локальный Bot API сервер или фейковый
+    Telegram для нагрузочных тестов), запросы идут туда; иначе — None, т.е. api.telegram.org.
+    """
+    if not TELEGRAM_API_SERVER:
+        return None
+    logger.info(f"Using Telegram API server: {TELEGRAM_API_SERVER}")
+    return AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_SERVER))
+
+
+async def _healthz(request):
+    """Проверка живости для балансировщика."""
+    return web.Response(text="ok")
+
+
+def build_webhook_app(dp: Dispatcher, bot: Bot, secret_token=WEBHOOK_SECRET, path=WEBHOOK_PATH):
+    """
+    Собирает aiohttp-приложение, принимающее апдейты на path.
+    Запросы без правильного X-Telegram-Bot-Api-Secret-Token отклоняются с 401.
+    Апдейты обрабатываются в фоне: Telegram сразу получает 200 и не держит соединение
+    на время работы обработчика, так что max_connections расходуется только на доставку.
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=secret_token,
+    ).register(app, path=path)
+    app.router.add_get("/healthz", _healthz)
+    # Привязывает startup/shutdown диспетчера к жизненному циклу приложения
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, allowed_updates=None, host=WEBHOOK_LISTEN_HOST, port=WEBHOOK_LISTEN_PORT):
+    """
+    Запускает веб-сервер вебхука и ждет отмены задачи.
+    Несколько процессов могут слушать за одним балансировщиком; setWebhook вызывает
+    только процесс с WEBHOOK_SET_ON_START=1.
+    """
+    if not WEBHOOK_SECRET:
+        logger.warning("WEBHOOK_SECRET is not set: webhook requests will not be authenticated.")
+
+    app = build_webhook_app(dp, bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port)
+    await site.start()
+    logger.info(f"Webhook server listening on {host}:{port}{WEBHOOK_PATH}")
+
+    try:
+        if WEBHOOK_SET_ON_START:
+            if not WEBHOOK_BASE_URL:
+                raise RuntimeError("WEBHOOK_BASE_URL must be set to register the webhook.")
+            url = WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH
+            await bot.set_webhook(
+                url=url,
+                secret_token=WEBHOOK_SECRET,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=allowed_updates,
+            )
+            logger.info(f"Webhook registered: {url} (max_connections={WEBHOOK_MAX_CONNECTIONS})")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        logger.info("Webhook server stopped.")
@@ -16,6 +16,8 @@ from aiogram.fsm.storage.memory import MemoryStorage
 
 # Импорты из проекта
 from database.db import Database
+from db import Database as SQLiteDatabase
+from database.memory_db import MemoryDatabase
 from modules.logging_service import LoggingService
 from modules.notification_service import NotificationService
 from modules.user_management import UserManager
@@ -48,6 +50,26 @@ def test_database(temp_db_path):
     db.close()
 
 
+@pytest.fixture
+def sqlite_database(temp_db_path):
+    """Создает локальную SQLite-базу (db.py) во временном файле."""
+    db = SQLiteDatabase(path=temp_db_path)
+    yield db
+    db.close()
+    # WAL-режим оставляет рядом служебные файлы
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(temp_db_path + suffix):
+            os.unlink(temp_db_path + suffix)
+
+
+@pytest.fixture
+def memory_database():
+    """Создает in-memory хранилище (database/memory_db.py) — без файлов на диске."""
+    db = MemoryDatabase()
+    yield db
+    db.close()
+
+
 @pytest.fixture
 def mock_bot():
     """Создает mock-объект для Bot."""
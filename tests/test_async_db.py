@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты асинхронного фасада над Database (database/async_db.py).
+"""
+
+import threading
+import pytest
+
+from database.async_db import AsyncDatabase, run_blocking
+
+
+@pytest.fixture
+def async_database(sqlite_database):
+    return AsyncDatabase(sqlite_database, read_workers=2, write_workers=1)
+
+
+class TestAsyncDatabase:
+    """Тесты AsyncDatabase."""
+
+    @pytest.mark.asyncio
+    async def test_reads_and_writes_use_separate_pools(self, async_database):
+        """Тест выполнения чтений и записей в своих пулах потоков."""
+        threads = {}
+        sync_db = async_database.sync
+        original_get, original_update = sync_db.get_user, sync_db.update_user
+
+        def get_user(user_id):
+            threads["read"] = threading.current_thread().name
+            return original_get(user_id)
+
+        def update_user(user_id, data):
+            threads["write"] = threading.current_thread().name
+            return original_update(user_id, data)
+
+        sync_db.get_user, sync_db.update_user = get_user, update_user
+        await async_database.update_user(1, {"name": "Анна"})
+        assert (await async_database.get_user(1))["name"] == "Анна"
+        assert threads["read"].startswith("db-read")
+        assert threads["write"].startswith("db-write")
+
+    @pytest.mark.asyncio
+    async def test_iter_actions_streams_and_stops_early(self, async_database):
+        """Тест потоковой выдачи действий и досрочной остановки итерации."""
+        for i in range(10):
+            await async_database.save_action(1, "user", "Анна", "card_drawn", {"i": i}, None)
+        all_actions = [a["details"]["i"] async for a in async_database.iter_actions(batch_size=3)]
+        assert sorted(all_actions) == list(range(10))
+
+        seen = []
+        async for action in async_database.iter_actions(batch_size=2):
+            seen.append(action)
+            if len(seen) == 3:
+                break
+        assert len(seen) == 3
+
+    @pytest.mark.asyncio
+    async def test_run_blocking(self):
+        """Тест выполнения блокирующей функции вне потока цикла событий."""
+        name = await run_blocking(lambda: threading.current_thread().name)
+        assert name.startswith("blocking-io")
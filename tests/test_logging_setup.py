@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты конвейера логирования (modules/logging_setup.py).
+"""
+
+import io
+import json
+import logging
+import sys
+
+from modules.logging_setup import JsonFormatter, SamplingFilter, setup_logging, stop_logging
+
+
+def _record(msg, args=(), level=logging.INFO, name="test"):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+class TestSamplingFilter:
+    """Тесты прореживания повторяющихся записей."""
+
+    def test_limits_repeats_per_template(self):
+        """Тест лимита на шаблон, а не на итоговый текст; WARNING не прореживается."""
+        sampling = SamplingFilter(limit=2, window=60)
+        passed = [sampling.filter(_record("Sent to user %s", (i,))) for i in range(5)]
+        assert passed == [True, True, False, False, False]
+        assert sampling.filter(_record("Other template %s", (1,)))
+        assert sampling.filter(_record("Sent to user %s", (9,), level=logging.WARNING))
+
+    def test_reports_dropped_count_in_next_window(self):
+        """Тест атрибута sampled_out у первой записи следующего окна."""
+        sampling = SamplingFilter(limit=1, window=60)
+        for i in range(4):
+            sampling.filter(_record("tick %s", (i,)))
+        sampling._window_start -= 61
+        record = _record("tick %s", (5,))
+        assert sampling.filter(record)
+        assert record.sampled_out == 3
+
+
+class TestPipeline:
+    """Тесты очереди и JSON-вывода."""
+
+    def test_json_lines_through_queue(self):
+        """Тест записи через фоновый поток в виде JSON."""
+        stream = io.StringIO()
+        setup_logging(level="INFO", fmt="json", sample_limit=0, stream=stream)
+        try:
+            logging.getLogger("cardbot.test").info("User %s: %s", 42, "card_drawn")
+        finally:
+            stop_logging()
+        entry = json.loads(stream.getvalue().strip().splitlines()[-1])
+        assert entry["msg"] == "User 42: card_drawn"
+        assert entry["level"] == "INFO"
+        assert entry["logger"] == "cardbot.test"
+
+    def test_formatter_includes_exception(self):
+        """Тест трейсбека в поле exc."""
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = logging.LogRecord("test", logging.ERROR, __file__, 1, "failed", (), sys.exc_info())
+        entry = json.loads(JsonFormatter().format(record))
+        assert "ValueError: boom" in entry["exc"]
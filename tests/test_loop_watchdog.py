@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты сторожа задержки цикла событий (modules/loop_watchdog.py).
+"""
+
+import asyncio
+import time
+
+import pytest
+from unittest.mock import MagicMock
+
+from modules.loop_watchdog import LoopWatchdog
+
+
+def _blocking_db_call(seconds):
+    time.sleep(seconds)
+
+
+async def watchdog_test_handler():
+    _blocking_db_call(0.3)
+
+
+class TestLoopWatchdog:
+    """Тесты обнаружения блокировок и отчета."""
+
+    @pytest.mark.asyncio
+    async def test_stall_is_attributed_to_handler_and_call(self):
+        """Тест снятия стека во время блокировки: обработчик и функция проекта, которая держит цикл."""
+        dp = MagicMock()
+        dp.observers = {"message": MagicMock(handlers=[MagicMock(callback=watchdog_test_handler)])}
+        watchdog = LoopWatchdog(threshold=0.1, interval=0.02)
+        watchdog.watch_handlers(dp)
+        watchdog.start()
+        try:
+            await asyncio.sleep(0.05)
+            await watchdog_test_handler()
+            await asyncio.sleep(0.05)
+        finally:
+            await watchdog.stop()
+
+        assert len(watchdog.stalls) == 1
+        stall = watchdog.stalls[0]
+        assert stall["handler"] == "watchdog_test_handler"
+        assert "_blocking_db_call" in stall["culprit"]
+        assert stall["duration"] >= 0.2
+        assert "_blocking_db_call" in watchdog.report()
+
+    @pytest.mark.asyncio
+    async def test_no_stalls_when_loop_is_free(self):
+        """Тест того, что короткие задержки не считаются блокировками."""
+        watchdog = LoopWatchdog(threshold=0.2, interval=0.01)
+        watchdog.start()
+        try:
+            await asyncio.sleep(0.1)
+        finally:
+            await watchdog.stop()
+
+        assert not watchdog.stalls
+        assert watchdog.report().startswith("loop lag p50")
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты in-memory хранилища (database/memory_db.py): соответствие интерфейсу Storage
+и совпадение результатов с SQLite-бэкендом (db.py) на одном и том же сценарии.
+"""
+
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from config import TIMEZONE
+from database.db import Database as PostgresDatabase
+from database.interface import Storage
+from database.memory_db import MemoryDatabase
+from db import Database as SQLiteDatabase
+
+INTERFACE_METHODS = sorted(name for name, value in vars(Storage).items() if callable(value) and not name.startswith("_"))
+
+
+def run_scenario(db):
+    """Одинаковая последовательность вызовов для любого бэкенда; возвращает всё, что вернули чтения."""
+    now = TIMEZONE.localize(datetime(2024, 5, 10, 12, 0))
+    results = {"new_user": db.get_user(1)}
+
+    db.update_user(1, {"name": "Анна", "reminder_time": "09:00", "last_request": now, "bogus": 1})
+    db.update_user(2, {"reminder_time_evening": "21:30", "bonus_available": True})
+    db.update_user(3, {"username": "no_reminders"})
+    results["user"] = db.get_user(1)
+    results["all_users"] = sorted(db.get_all_users())
+    results["reminders"] = db.get_reminder_times()
+    results["card_today"] = db.is_card_available(1, now.date())
+    results["card_tomorrow"] = db.is_card_available(1, now.date() + timedelta(days=1))
+
+    for card in (5, 7, 5):
+        db.add_user_card(1, card)
+    results["cards"] = sorted(db.get_user_cards(1))
+    results["card_count"] = db.count_user_cards(1)
+    db.reset_user_cards(1)
+    results["cards_after_reset"] = db.get_user_cards(1)
+
+    for minutes, action, details in [(30, "card_drawn", {"card_number": 4}), (10, "start", None),
+                                     (20, "resource", {"resource": "😊", "response": "абв"})]:
+        db.save_action(1, "anna", "Анна", action, details, now + timedelta(minutes=minutes))
+    db.save_action(2, "bob", "Боб", "start", {}, (now - timedelta(days=40)).isoformat())
+    strip_id = lambda actions: [{k: v for k, v in a.items() if k != "id"} for a in actions]
+    results["actions_user"] = strip_id(db.get_actions(user_id=1))
+    results["actions_all"] = strip_id(db.get_actions())
+    results["actions_window"] = strip_id(db.iter_actions(since=now + timedelta(minutes=15), until=now + timedelta(minutes=30)))
+    results["actions_types"] = strip_id(db.iter_actions(types=["start"], limit=1))
+    results["action_totals"] = db.get_action_totals(1, ["card_drawn", "resource"])
+
+    results["referral_added"] = db.add_referral(1, 2)
+    results["referral_repeat"] = db.add_referral(3, 2)
+    db.add_referral(1, 3)
+    results["referrals"] = db.get_referrals(1)
+
+    results["no_profile"] = db.get_user_profile(1)
+    db.update_user_profile(1, {"mood": "calm", "themes": ["работа"], "last_updated": now, "unknown": 1})
+    db.update_user_profile(1, {"response_count": 3, "last_reflection_date": now.date(), "last_updated": now})
+    results["profile"] = db.get_user_profile(1)
+
+    db.save_evening_reflection(1, "2024-05-08", "хорошее", "спасибо", "трудное", now)
+    db.save_evening_reflection(1, date(2024, 5, 9), "еще", None, None, now.isoformat(), ai_summary="итог")
+    results["last_reflection"] = db.get_last_reflection_date(1)
+    results["reflection_count"] = db.count_reflections(1)
+    results["reflection_texts"] = db.get_all_reflection_texts(1, limit=1)
+
+    db.add_recharge_method(1, "прогулка", now)
+    db.add_recharge_method(1, "сон", now + timedelta(hours=1))
+    results["recharge"] = db.get_last_recharge_method(1)
+    results["no_recharge"] = db.get_last_recharge_method(2)
+    return results
+
+
+class TestStorageInterface:
+    """Тесты соответствия бэкендов интерфейсу Storage."""
+
+    @pytest.mark.parametrize("backend", [SQLiteDatabase, PostgresDatabase, MemoryDatabase], ids=lambda cls: cls.__module__)
+    def test_backends_implement_interface(self, backend):
+        """Тест наличия у каждого бэкенда всех методов интерфейса."""
+        missing = [name for name in INTERFACE_METHODS if not callable(getattr(backend, name, None))]
+        assert missing == []
+
+    def test_instances_are_storage(self, sqlite_database, memory_database):
+        """Тест проверки isinstance(..., Storage) для экземпляров."""
+        assert isinstance(sqlite_database, Storage)
+        assert isinstance(memory_database, Storage)
+
+
+class TestMemoryDatabaseParity:
+    """Тесты совпадения MemoryDatabase с SQLite-бэкендом."""
+
+    def test_same_results_as_sqlite(self, sqlite_database, memory_database):
+        """Тест того, что один сценарий дает одинаковые результаты на обоих бэкендах."""
+        expected = run_scenario(sqlite_database)
+        actual = run_scenario(memory_database)
+        for key in expected:
+            assert actual[key] == expected[key], key
+
+    def test_returned_rows_are_copies(self, memory_database):
+        """Тест того, что изменение возвращенных словарей не меняет хранилище."""
+        memory_database.update_user(1, {"name": "Анна"})
+        memory_database.get_user(1)["name"] = "Чужое"
+        memory_database.user_cache.invalidate(1)
+        assert memory_database.get_user(1)["name"] == "Анна"
+
+        memory_database.save_action(1, "a", "Анна", "start", {"step": 1}, datetime.now(TIMEZONE))
+        memory_database.get_actions(1)[0]["details"]["step"] = 2
+        assert memory_database.get_actions(1)[0]["details"] == {"step": 1}
+
+    def test_retention_rolls_up_old_actions(self, memory_database):
+        """Тест свертки старых действий в дневные агрегаты."""
+        now = TIMEZONE.localize(datetime(2024, 5, 10, 12, 0))
+        memory_database.save_action(1, "a", "A", "start", None, now - timedelta(days=200))
+        memory_database.save_action(1, "a", "A", "start", None, now)
+        assert memory_database.apply_action_retention(keep_months=3, now=now) == 1
+        assert len(memory_database.get_actions()) == 1
+        assert sum(memory_database._action_rollups.values()) == 1
+        assert memory_database.get_action_totals(1, ["start"]) == {"count": 2, "responses": 0, "first_day": (now - timedelta(days=200)).date()}
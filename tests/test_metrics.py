@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты метрик (modules/metrics.py, modules/metrics_middleware.py).
+"""
+
+import pytest
+from unittest.mock import MagicMock
+
+from modules.metrics import HANDLER_ERRORS, HANDLER_SECONDS, Registry
+from modules.metrics_middleware import HandlerMetricsMiddleware
+
+
+class TestRegistry:
+    """Тесты формата Prometheus."""
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Тест накопительных корзин, суммы и количества."""
+        registry = Registry()
+        hist = registry.histogram("test_seconds", "help", ["method"], buckets=(0.1, 1.0))
+        hist.observe(0.05, method="get_user")
+        hist.observe(0.5, method="get_user")
+        hist.observe(5, method="get_user")
+
+        text = registry.render()
+
+        assert 'test_seconds_bucket{method="get_user",le="0.1"} 1' in text
+        assert 'test_seconds_bucket{method="get_user",le="1"} 2' in text
+        assert 'test_seconds_bucket{method="get_user",le="+Inf"} 3' in text
+        assert 'test_seconds_count{method="get_user"} 3' in text
+
+    def test_counter_and_snapshot(self):
+        """Тест счетчика с экранированием меток и снимка stats() как gauge."""
+        registry = Registry()
+        registry.counter("test_total", "help", ["error"]).inc(error='Bad "quote"')
+        registry.register_snapshot("test_cache", lambda: {"hits": 3, "hit_ratio": 0.75, "name": "skip"})
+
+        text = registry.render()
+
+        assert 'test_total{error="Bad \\"quote\\""} 1' in text
+        assert "test_cache_hits 3" in text
+        assert "test_cache_hit_ratio 0.75" in text
+        assert "test_cache_name" not in text
+
+
+class TestHandlerMetricsMiddleware:
+    """Тесты метрик обработчиков."""
+
+    @pytest.mark.asyncio
+    async def test_records_latency_and_errors_by_handler(self):
+        """Тест меток по имени зарегистрированной функции."""
+        async def metrics_test_handler():
+            pass
+
+        async def failing(event, data):
+            raise RuntimeError("boom")
+
+        handler_object = MagicMock(callback=metrics_test_handler)
+        middleware = HandlerMetricsMiddleware()
+
+        with pytest.raises(RuntimeError):
+            await middleware(failing, MagicMock(), {"handler": handler_object})
+
+        assert HANDLER_SECONDS.count(handler="metrics_test_handler") == 1
+        assert HANDLER_ERRORS.value(handler="metrics_test_handler") == 1
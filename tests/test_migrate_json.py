@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты потокового переноса JSON -> SQLite (migrate_json_to_sqlite.py).
+"""
+
+import json
+
+import pytest
+
+import migrate_json_to_sqlite as migration
+from db import Database as SQLiteDatabase
+
+
+class TestIterJson:
+    """Тесты потокового разбора JSON."""
+
+    def test_object_and_array_across_chunks(self, tmp_path):
+        """Тест того, что значения на границе кусков (включая числа) разбираются целиком."""
+        obj = {str(i): {"name": "Анна " * i, "n": 12345678 + i} for i in range(50)}
+        arr = [{"user_id": i, "details": {"card": i}} for i in range(50)]
+        (tmp_path / "obj.json").write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+        (tmp_path / "arr.json").write_text(json.dumps(arr), encoding="utf-8")
+
+        assert {k: v for k, v, _ in migration.iter_json(str(tmp_path / "obj.json"), chunk_size=7)} == obj
+        assert [v for _, v, _ in migration.iter_json(str(tmp_path / "arr.json"), chunk_size=5)] == arr
+
+    def test_truncated_file_raises(self, tmp_path):
+        """Тест ошибки на оборванном файле."""
+        (tmp_path / "bad.json").write_text('[{"a": 1}, {"a"', encoding="utf-8")
+        with pytest.raises(ValueError):
+            list(migration.iter_json(str(tmp_path / "bad.json"), chunk_size=4))
+
+
+class TestMigrateData:
+    """Тесты загрузки данных и продолжения после сбоя."""
+
+    def _write_data(self, data_dir):
+        data_dir.mkdir()
+        files = {
+            "last_request.json": {"1": "2024-05-01T10:00:00Z"},
+            "user_names.json": {"1": "Анна", "2": "Борис"},
+            "referrals.json": {"1": [2]},
+            "bonus_available.json": {"1": True},
+            "reminder_times.json": {"2": "09:00"},
+            "user_actions.json": [
+                {"user_id": 1, "action": "card_drawn", "details": {"card_number": i},
+                 "timestamp": f"2024-05-01T10:{i:02d}:00+03:00"}
+                for i in range(10)
+            ],
+            "user_cards.json": {"1": [3, 5]},
+        }
+        for name, payload in files.items():
+            (data_dir / name).write_text(json.dumps(payload), encoding="utf-8")
+
+    def test_full_import(self, tmp_path):
+        """Тест переноса всех файлов: имена не затирают last_request, горячие поля заполнены."""
+        self._write_data(tmp_path / "data")
+        db_path = str(tmp_path / "bot.db")
+        assert migration.migrate_data(db_path, str(tmp_path / "data"), batch_size=3)
+
+        db = SQLiteDatabase(path=db_path)
+        try:
+            user = db.get_user(1)
+            assert user["name"] == "Анна"
+            assert user["last_request"] is not None
+            assert user["bonus_available"]
+            assert db.get_user(2)["reminder_time"] == "09:00"
+            assert db.get_referrals(1) == [2]
+            assert sorted(db.get_user_cards(1)) == [3, 5]
+            actions = db.get_actions(1, raw_details=True)
+            assert len(actions) == 10
+            assert sorted(a["card_number"] for a in actions) == list(range(10))
+            # Отложенные индексы построены заново
+            indexes = {row[0] for row in db.read_conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+            assert "idx_actions_user_timestamp" in indexes
+        finally:
+            db.close()
+
+    def test_resume_after_crash(self, tmp_path, monkeypatch):
+        """Тест того, что после сбоя загрузка продолжается без дублей."""
+        self._write_data(tmp_path / "data")
+        db_path = str(tmp_path / "bot.db")
+        original = migration._action_rows
+        calls = {"n": 0}
+
+        def crashing(key, action):
+            calls["n"] += 1
+            if calls["n"] == 8:
+                raise KeyboardInterrupt
+            return original(key, action)
+
+        monkeypatch.setattr(migration, "SECTIONS", [
+            (source, sql, crashing if source == "user_actions" else rows)
+            for source, sql, rows in migration.SECTIONS
+        ])
+        with pytest.raises(KeyboardInterrupt):
+            migration.migrate_data(db_path, str(tmp_path / "data"), batch_size=3)
+
+        monkeypatch.undo()
+        migration.migrate_data(db_path, str(tmp_path / "data"), batch_size=3)
+
+        db = SQLiteDatabase(path=db_path)
+        try:
+            assert db.read_conn.execute("SELECT COUNT(*) FROM actions").fetchone()[0] == 10
+            assert db.read_conn.execute("SELECT COUNT(*) FROM user_cards").fetchone()[0] == 2
+        finally:
+            db.close()
+
+    def test_parse_error_reports_failure_and_resumes(self, tmp_path):
+        """Тест того, что ошибка разбора не выдается за успех, а после исправления файла импорт продолжается."""
+        data_dir = tmp_path / "data"
+        self._write_data(data_dir)
+        actions_file = data_dir / "user_actions.json"
+        actions = actions_file.read_text(encoding="utf-8")
+        broken = json.loads(actions)
+        del broken[5]["action"]
+        actions_file.write_text(json.dumps(broken), encoding="utf-8")
+        db_path = str(tmp_path / "bot.db")
+
+        assert not migration.migrate_data(db_path, str(data_dir), batch_size=3)
+
+        actions_file.write_text(actions, encoding="utf-8")
+        assert migration.migrate_data(db_path, str(data_dir), batch_size=3)
+
+        db = SQLiteDatabase(path=db_path)
+        try:
+            assert db.read_conn.execute("SELECT COUNT(*) FROM actions").fetchone()[0] == 10
+            assert db.read_conn.execute("SELECT COUNT(*) FROM user_cards").fetchone()[0] == 2
+        finally:
+            db.close()
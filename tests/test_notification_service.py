@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты сервиса напоминаний (modules/notification_service.py).
+"""
+
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+
+from config import TIMEZONE
+from database.async_db import AsyncDatabase
+from modules.notification_service import NotificationService
+
+
+class TestSendDueReminders:
+    """Тесты одного тика напоминаний."""
+
+    @pytest.mark.asyncio
+    async def test_counts_due_sent_and_failed(self, sqlite_database):
+        """Тест отправки только пользователям с текущей минутой и подсчета ошибок."""
+        sqlite_database.update_user(1, {"name": "Анна", "reminder_time": "08:00"})
+        sqlite_database.update_user(2, {"name": "", "reminder_time_evening": "08:00"})
+        sqlite_database.update_user(3, {"name": "Вера", "reminder_time": "09:00"})
+        bot = MagicMock()
+        bot.send_message = AsyncMock(side_effect=[None, Exception("Too Many Requests")])
+        service = NotificationService(bot, AsyncDatabase(sqlite_database))
+
+        stats = await service.send_due_reminders(datetime.now(TIMEZONE).replace(hour=8, minute=0))
+
+        assert stats == {"due": 2, "sent": 1, "failed": 1}
+        assert {call.args[0] for call in bot.send_message.call_args_list} == {1, 2}
+
+
+class TestDeliverBroadcast:
+    """Тесты доставки рассылки."""
+
+    @pytest.mark.asyncio
+    async def test_personalized_text(self, sqlite_database):
+        """Тест обращения по имени и доставки по списку получателей."""
+        sqlite_database.update_user(1, {"name": "Анна"})
+        bot = MagicMock()
+        bot.send_message = AsyncMock()
+        service = NotificationService(bot, AsyncDatabase(sqlite_database))
+
+        stats = await service.deliver_broadcast({"text": "привет", "recipients": [1]}, datetime.now(TIMEZONE))
+
+        assert stats == {"sent": 1, "failed": 0}
+        bot.send_message.assert_awaited_once_with(1, "Анна, привет")
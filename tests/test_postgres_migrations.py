@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты миграций PostgreSQL (database/migrations/postgres.py) и обслуживания core.actions
+(database/db.py): на объекте, записывающем DDL, и на настоящем сервере — TEST_PG_DSN или временный локальный (benchmarks/local_postgres.py);
+без psycopg2 и PostgreSQL тесты с сервером пропускаются.
+"""
+
+import os
+import subprocess
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from benchmarks.local_postgres import LocalPostgres, find_pg_bin
+from database.migrations import latest_version, postgres
+
+# Схема core.actions до миграций: обычная таблица, как ее создавал create_schemas_and_tables
+BASELINE_SCHEMA = """
+    CREATE SCHEMA IF NOT EXISTS core;
+    CREATE TABLE core.users (
+        user_id BIGINT PRIMARY KEY, username TEXT, full_name TEXT,
+        first_seen_at TIMESTAMPTZ DEFAULT NOW(), last_seen_at TIMESTAMPTZ DEFAULT NOW(),
+        ozon_id TEXT, wildberries_id TEXT, bonus_available BOOLEAN DEFAULT FALSE
+    );
+    CREATE TABLE core.actions (
+        id SERIAL PRIMARY KEY,
+        user_id BIGINT NOT NULL REFERENCES core.users(user_id) ON DELETE CASCADE,
+        action_type VARCHAR(50) NOT NULL, details JSONB, created_at TIMESTAMPTZ DEFAULT NOW()
+    );
+"""
+
+
+@pytest.fixture(scope="module")
+def pg_dsn():
+    """DSN тестового PostgreSQL: TEST_PG_DSN или временный локальный сервер."""
+    pytest.importorskip("psycopg2")
+    dsn = os.getenv("TEST_PG_DSN")
+    if dsn:
+        yield dsn
+        return
+    if not find_pg_bin():
+        pytest.skip("PostgreSQL is not installed and TEST_PG_DSN is not set")
+    server = LocalPostgres()
+    try:
+        dsn = server.start()
+    except (RuntimeError, OSError, subprocess.CalledProcessError) as e:
+        server.stop()
+        pytest.skip(f"could not start local PostgreSQL: {e}")
+    yield dsn
+    server.stop()
+
+
+def _pg_execute(dsn, sql):
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute(sql)
+    finally:
+        conn.close()
+
+
+class RecordingDatabase:
+    """Записывает команды execute_ddl; fail_on — подстрока команды, на которой бросить ошибку."""
+
+    def __init__(self, partitioned=True, fail_on=None):
+        self.partitioned = partitioned
+        self.fail_on = fail_on
+        self.statements = []
+        self.partitions_ensured = False
+
+    def execute_ddl(self, query, params=None, autocommit=False):
+        if self.fail_on and self.fail_on in query:
+            raise RuntimeError(f"failed: {self.fail_on}")
+        self.statements.append(query)
+
+    def _actions_partitioned(self):
+        return self.partitioned
+
+    def ensure_action_partitions(self):
+        self.partitions_ensured = True
+
+
+class TestPostgresMigrationStatements:
+    """Тесты выполнения команд миграций."""
+
+    def test_statements_run_one_by_one(self):
+        """Тест того, что каждая команда схемы уходит отдельным execute_ddl."""
+        db = RecordingDatabase()
+        postgres._app_tables(db)
+        assert db.statements[:len(postgres.APP_TABLES)] == postgres.APP_TABLES
+
+    def test_failure_keeps_earlier_statements_and_raises(self):
+        """Тест того, что ошибка команды пробрасывается, а команды до нее уже выполнены."""
+        db = RecordingDatabase(fail_on="core.user_profiles")
+        with pytest.raises(RuntimeError):
+            postgres._app_tables(db)
+        assert any("programs.used_cards" in sql for sql in db.statements)
+        assert not any("core.evening_reflections" in sql for sql in db.statements)
+
+
+class TestPostgresBaseSchema:
+    """Тесты базовой схемы на секционированной и обычной core.actions."""
+
+    def test_partitioned_actions_get_partitions(self):
+        """Тест того, что для секционированной таблицы создаются DEFAULT и месячные партиции."""
+        db = RecordingDatabase(partitioned=True)
+        postgres._base_schema(db)
+        assert postgres.ACTIONS_DEFAULT_PARTITION in db.statements
+        assert db.partitions_ensured
+
+    def test_plain_actions_skip_partition_ddl(self):
+        """Тест того, что на обычной core.actions нет команд PARTITION OF, а остальные таблицы создаются."""
+        db = RecordingDatabase(partitioned=False)
+        postgres._base_schema(db)
+        assert not any("PARTITION OF" in sql for sql in db.statements)
+        assert not db.partitions_ensured
+        assert any("core.action_daily_rollups" in sql for sql in db.statements)
+
+    def test_existing_plain_actions_table_is_migrated(self, pg_dsn):
+        """Тест старта на существующей установке с обычной core.actions: миграции проходят, ретеншн идет через DELETE."""
+        from database.db import Database as PostgresDatabase
+
+        _pg_execute(pg_dsn, "DROP SCHEMA IF EXISTS core, programs, marketplace CASCADE; DROP TABLE IF EXISTS public.schema_version;")
+        _pg_execute(pg_dsn, BASELINE_SCHEMA)
+        db = PostgresDatabase(dsn=pg_dsn)
+        try:
+            assert db.schema_version() == latest_version(postgres.MIGRATIONS)
+            assert not db._actions_partitioned()
+            db.get_user(1)
+            db.execute_query("INSERT INTO core.actions (user_id, action_type, created_at) VALUES (1, 'start', NOW() - INTERVAL '2 years');")
+            assert db.apply_action_retention(keep_months=6) == 1
+            rollups = db.execute_query("SELECT COUNT(*) FROM core.action_daily_rollups;", fetch="one")
+            assert rollups[0] == 1
+        finally:
+            db.close()
+
+
+class TestPostgresActionRetention:
+    """Тесты партиций и ретеншна действий на секционированной core.actions."""
+
+    def test_month_boundary_in_utc(self):
+        """Тест того, что месяц партиций и ретеншна берется по UTC, а не по локальному времени хоста."""
+        from database.db import _utc_month_start
+
+        # 1 июня 01:00 по Москве — еще 31 мая по UTC
+        now = datetime(2024, 6, 1, 1, 0, tzinfo=timezone(timedelta(hours=3)))
+        assert _utc_month_start(now).isoformat() == "2024-05-01"
+
+    def test_default_partition_rows_rolled_up_and_deleted(self, pg_dsn):
+        """Тест того, что старые строки из core.actions_default сворачиваются в агрегаты и удаляются."""
+        from database.db import Database as PostgresDatabase
+
+        _pg_execute(pg_dsn, "DROP SCHEMA IF EXISTS core, programs, marketplace CASCADE; DROP TABLE IF EXISTS public.schema_version;")
+        db = PostgresDatabase(dsn=pg_dsn)
+        try:
+            assert db._actions_partitioned()
+            db.get_user(1)
+            # Для месяца двухлетней давности нет своей партиции — строка ложится в DEFAULT
+            db.execute_query("INSERT INTO core.actions (user_id, action_type, created_at) VALUES (1, 'start', NOW() - INTERVAL '2 years');")
+            db.execute_query("INSERT INTO core.actions (user_id, action_type) VALUES (1, 'start');")
+            assert db.execute_query("SELECT COUNT(*) FROM core.actions_default;", fetch="one")[0] == 1
+
+            db.apply_action_retention(keep_months=6)
+
+            assert db.execute_query("SELECT COUNT(*) FROM core.actions_default;", fetch="one")[0] == 0
+            assert db.execute_query("SELECT COUNT(*) FROM core.actions;", fetch="one")[0] == 1
+            rollups = db.execute_query("SELECT user_id, action_type, count FROM core.action_daily_rollups;", fetch="all")
+            assert [tuple(row) for row in rollups] == [(1, "start", 1)]
+        finally:
+            db.close()
+
+
+class TestPostgresIterActions:
+    """Тесты iter_actions на настоящем сервере."""
+
+    def test_early_stop_closes_transaction(self, pg_dsn):
+        """Тест того, что прерванный обход не оставляет соединение idle in transaction, а границы — как в SQLite."""
+        import psycopg2.extensions
+        from database.db import Database as PostgresDatabase
+
+        _pg_execute(pg_dsn, "DROP SCHEMA IF EXISTS core, programs, marketplace CASCADE; DROP TABLE IF EXISTS public.schema_version;")
+        db = PostgresDatabase(dsn=pg_dsn)
+        try:
+            db.get_user(1)
+            for i in range(5):
+                db.log_action(1, "start", {"i": i})
+            for _ in db.iter_actions(batch_size=2):
+                break
+            assert db.conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+            today = datetime.now(timezone.utc).date()
+            assert len(list(db.iter_actions(since="2000-01-01T00:00:00Z", until=today + timedelta(days=2)))) == 5
+            assert list(db.iter_actions(since=today + timedelta(days=2))) == []
+            assert db.conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        finally:
+            db.close()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты сэмплирующего профилировщика (modules/profiler.py).
+"""
+
+import json
+import time
+
+from modules.profiler import SamplingProfiler
+
+
+def _busy_profiled_function(seconds):
+    deadline = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < deadline:
+        total += sum(range(100))
+    return total
+
+
+class TestSamplingProfiler:
+    """Тесты сэмплирования и отчетов."""
+
+    def test_summary_shows_hot_function(self):
+        """Тест того, что горячая функция потока-владельца попадает в топ."""
+        profiler = SamplingProfiler(interval=0.002)
+        profiler.start()
+        _busy_profiled_function(0.3)
+        profiler.stop()
+
+        assert not profiler.active
+        assert "_busy_profiled_function" in profiler.summary(top=10)
+
+    def test_speedscope_file(self, tmp_path):
+        """Тест структуры файла speedscope."""
+        profiler = SamplingProfiler(interval=0.002)
+        profiler.start()
+        _busy_profiled_function(0.1)
+        profiler.stop()
+
+        path = profiler.write_speedscope(str(tmp_path / "profile.speedscope.json"))
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+
+        assert data["$schema"] == "https://www.speedscope.app/file-format-schema.json"
+        first = data["profiles"][0]
+        assert first["type"] == "sampled"
+        assert len(first["samples"]) == len(first["weights"])
+        names = {data["shared"]["frames"][i]["name"] for stack in first["samples"] for i in stack}
+        assert "_busy_profiled_function" in names
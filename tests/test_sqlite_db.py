@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты для локального SQLite-бэкенда (db.py).
+"""
+
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from config import TIMEZONE
+from database.migrations import latest_version, migrate
+from database.migrations.sqlite import MIGRATIONS
+from db import Database as SQLiteDatabase
+
+
+class TestSQLiteTuning:
+    """Тесты настроек соединений SQLite."""
+
+    def test_wal_mode_enabled(self, sqlite_database):
+        """Тест включения WAL и synchronous=NORMAL."""
+        journal_mode = sqlite_database.conn.execute("PRAGMA journal_mode").fetchone()[0]
+        assert journal_mode.lower() == "wal"
+        # 1 == NORMAL
+        assert sqlite_database.conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+
+    def test_read_connection_is_read_only(self, sqlite_database):
+        """Тест того, что соединение для чтения не может писать."""
+        assert sqlite_database.read_conn is not sqlite_database.conn
+        try:
+            sqlite_database.read_conn.execute("INSERT INTO users (user_id) VALUES (1)")
+        except sqlite3.OperationalError:
+            pass
+        else:
+            raise AssertionError("read_conn должен быть только для чтения")
+
+    def test_in_memory_database_rejected(self):
+        """Тест отказа от in-memory БД: ее единственное соединение занято потоком-писателем."""
+        for path in (":memory:", "file::memory:?cache=shared"):
+            with pytest.raises(ValueError):
+                SQLiteDatabase(path=path)
+
+    def test_reader_sees_committed_writes(self, sqlite_database):
+        """Тест того, что читатель видит закоммиченные изменения писателя."""
+        sqlite_database.update_user(1, {"name": "Анна"})
+        assert sqlite_database.get_user(1)["name"] == "Анна"
+
+
+class TestSQLiteUpserts:
+    """Тесты UPSERT-ов пользователей и профилей."""
+
+    def test_update_user_keeps_other_fields(self, sqlite_database):
+        """Тест того, что обновление одного поля не затирает остальные."""
+        sqlite_database.update_user(1, {"name": "Анна", "reminder_time": "09:00"})
+        sqlite_database.update_user(1, {"bonus_available": True})
+        user = sqlite_database.get_user(1)
+        assert user["name"] == "Анна"
+        assert user["reminder_time"] == "09:00"
+        assert user["bonus_available"] is True
+
+    def test_update_user_profile_keeps_other_fields(self, sqlite_database):
+        """Тест того, что профиль обновляется частично."""
+        sqlite_database.update_user_profile(1, {"mood": "positive", "themes": ["работа/карьера"]})
+        sqlite_database.update_user_profile(1, {"final_resource": "😊 Хорошо"})
+        profile = sqlite_database.get_user_profile(1)
+        assert profile["mood"] == "positive"
+        assert profile["themes"] == ["работа/карьера"]
+        assert profile["final_resource"] == "😊 Хорошо"
+
+    def test_update_user_is_single_statement(self, sqlite_database):
+        """Тест того, что update_user не читает строку перед записью."""
+        statements = []
+        sqlite_database.conn.set_trace_callback(statements.append)
+        sqlite_database.read_conn.set_trace_callback(statements.append)
+        sqlite_database.update_user(1, {"last_request": "2024-01-01T12:00:00+03:00"})
+        sqlite_database.conn.set_trace_callback(None)
+        sqlite_database.read_conn.set_trace_callback(None)
+        assert not any(sql.lstrip().upper().startswith("SELECT") for sql in statements)
+        assert sum(sql.lstrip().upper().startswith("INSERT") for sql in statements) == 1
+
+    def test_update_user_creates_missing_user_with_defaults(self, sqlite_database):
+        """Тест того, что UPSERT создает пользователя со значениями по умолчанию."""
+        sqlite_database.update_user(42, {"reminder_time": "10:00"})
+        user = sqlite_database.get_user(42)
+        assert user["name"] == ""
+        assert user["reminder_time"] == "10:00"
+        assert user["bonus_available"] is False
+
+
+    def test_concurrent_first_get_user(self, sqlite_database, caplog):
+        """Тест гонки первых get_user одних и тех же пользователей из разных потоков: без ошибок и дублей."""
+        barrier = threading.Barrier(8)
+
+        def load():
+            barrier.wait()
+            for user_id in range(1000, 1200):
+                sqlite_database.get_user(user_id)
+
+        with caplog.at_level(logging.ERROR):
+            threads = [threading.Thread(target=load) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        assert [record.getMessage() for record in caplog.records if record.levelno >= logging.ERROR] == []
+        assert sqlite_database.read_conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 200
+
+
+class TestSQLiteReminders:
+    """Тесты выборки напоминаний."""
+
+    def test_reminder_times_include_menu_flags(self, sqlite_database):
+        """Тест того, что для рассылки не нужен отдельный get_user на пользователя."""
+        last_request = TIMEZONE.localize(datetime(2024, 1, 1, 9, 0))
+        sqlite_database.update_user(1, {"name": "Анна", "reminder_time": "09:00", "bonus_available": True, "last_request": last_request})
+        sqlite_database.update_user(2, {"name": "Борис"})
+        reminders = sqlite_database.get_reminder_times()
+        assert list(reminders) == [1]
+        assert reminders[1]["name"] == "Анна"
+        assert reminders[1]["bonus_available"] is True
+        assert reminders[1]["last_request"] == last_request
+        assert not sqlite_database.is_card_available(1, last_request.date(), user_data=reminders[1])
+
+
+class TestSQLiteUserCache:
+    """Тесты кэша строк пользователей."""
+
+    def test_get_user_served_from_cache(self, sqlite_database):
+        """Тест повторного чтения пользователя без запроса к БД."""
+        sqlite_database.update_user(1, {"name": "Анна"})
+        sqlite_database.get_user(1)
+        statements = []
+        sqlite_database.read_conn.set_trace_callback(statements.append)
+        assert sqlite_database.get_user(1)["name"] == "Анна"
+        sqlite_database.read_conn.set_trace_callback(None)
+        assert statements == []
+        assert sqlite_database.user_cache.stats()["hits"] == 1
+
+    def test_update_user_invalidates_cache(self, sqlite_database):
+        """Тест сброса кэша при записи."""
+        sqlite_database.update_user(1, {"name": "Анна"})
+        sqlite_database.get_user(1)
+        sqlite_database.update_user(1, {"name": "Мария"})
+        assert sqlite_database.get_user(1)["name"] == "Мария"
+
+    def test_cached_row_is_a_copy(self, sqlite_database):
+        """Тест того, что изменения возвращенного словаря не портят кэш."""
+        sqlite_database.get_user(1)["name"] = "Чужое"
+        assert sqlite_database.get_user(1)["name"] == ""
+
+    def test_stale_read_not_cached_after_invalidate(self, sqlite_database, monkeypatch):
+        """Тест гонки: запись закоммитилась и сбросила кэш, пока читатель нес старую строку в кэш."""
+        sqlite_database.update_user(1, {"name": "Анна"})
+        load_user = sqlite_database._load_user
+
+        def racing_load(user_id):
+            row = load_user(user_id)
+            # Запись из пула записи успевает между чтением и user_cache.set
+            sqlite_database.update_user(user_id, {"name": "Мария"})
+            return row
+
+        monkeypatch.setattr(sqlite_database, "_load_user", racing_load)
+        assert sqlite_database.get_user(1)["name"] == "Анна"
+        monkeypatch.undo()
+        assert sqlite_database.get_user(1)["name"] == "Мария"
+
+    def test_generation_survives_forgotten_keys(self):
+        """Тест того, что после вытеснения поколений устаревший set по-прежнему пропускается."""
+        from database.cache import UserCache
+        cache = UserCache(maxsize=1, ttl=60)
+        generation = cache.generation(1)
+        cache.invalidate(1)
+        for user_id in range(2, 2000):
+            cache.invalidate(user_id)
+        cache.set(1, {"user_id": 1}, generation)
+        assert cache.get(1) is None
+        cache.set(1, {"user_id": 1}, cache.generation(1))
+        assert cache.get(1) == {"user_id": 1}
+
+    def test_lru_eviction(self):
+        """Тест вытеснения самой давно использованной записи."""
+        from database.cache import UserCache
+        cache = UserCache(maxsize=2, ttl=60)
+        cache.set(1, {"user_id": 1})
+        cache.set(2, {"user_id": 2})
+        cache.get(1)
+        cache.set(3, {"user_id": 3})
+        assert cache.get(2) is None
+        assert cache.get(1) == {"user_id": 1}
+        stats = cache.stats()
+        assert stats["evictions"] == 1
+        assert stats["size"] == 2
+
+
+class TestSQLiteActions:
+    """Тесты хранения действий."""
+
+    def test_details_stored_compact(self, sqlite_database):
+        """Тест компактной записи details и заполнения горячих колонок."""
+        details = {"card_number": 7, "response": "Вижу дорогу"}
+        sqlite_database.save_action(1, "user", "Анна", "initial_response_provided", details, None)
+        row = sqlite_database.conn.execute("SELECT details, card_number, response_len FROM actions").fetchone()
+        assert "\n" not in row["details"]
+        assert row["card_number"] == 7
+        assert row["response_len"] == len("Вижу дорогу")
+
+    def test_get_actions_raw_details(self, sqlite_database):
+        """Тест ленивого декодирования details."""
+        sqlite_database.save_action(1, "user", "Анна", "initial_resource_selected", {"resource": "😊 Хорошо"}, None)
+        decoded = sqlite_database.get_actions(1)[0]
+        raw = sqlite_database.get_actions(1, raw_details=True)[0]
+        assert decoded["details"] == {"resource": "😊 Хорошо"}
+        assert isinstance(raw["details"], str)
+        assert raw["resource"] == "😊 Хорошо"
+
+    def test_iter_actions_filters_and_batches(self, sqlite_database):
+        """Тест фильтров iter_actions и прохода по нескольким пачкам."""
+        # Время задаем в часовом поясе бота, как его пишет save_action
+        base = TIMEZONE.localize(datetime(2024, 1, 1, 12, 0))
+        for i in range(25):
+            action = "card_drawn" if i % 2 else "start_command"
+            sqlite_database.save_action(1, "user", "Анна", action, {"i": i}, (base + timedelta(hours=i)).isoformat())
+        all_actions = list(sqlite_database.iter_actions(batch_size=4))
+        assert [a["details"]["i"] for a in all_actions] == list(range(25))
+
+        window = list(sqlite_database.iter_actions(since=base + timedelta(hours=5), until=base + timedelta(hours=10), batch_size=2))
+        assert [a["details"]["i"] for a in window] == [5, 6, 7, 8, 9]
+
+        drawn = list(sqlite_database.iter_actions(types=["card_drawn"], limit=3, batch_size=2))
+        assert [a["details"]["i"] for a in drawn] == [1, 3, 5]
+
+
+class TestSQLiteActionTimestamps:
+    """Тесты единого формата timestamp действий (UTC)."""
+
+    def test_mixed_inputs_stored_in_utc(self, sqlite_database):
+        """Тест того, что 'Z', наивное время и другое смещение сохраняются в одном формате и сортируются по времени."""
+        sqlite_database.save_action(1, "u", "U", "a", None, "2024-05-10T08:30:00Z")
+        sqlite_database.save_action(1, "u", "U", "b", None, "2024-05-10T11:00:00")  # наивное — время TIMEZONE
+        sqlite_database.save_action(1, "u", "U", "c", None, TIMEZONE.localize(datetime(2024, 5, 10, 11, 45)))
+        sqlite_database.save_action(1, "u", "U", "d", None, "2024-05-10T10:00:00+05:00")
+        stored = [row[0] for row in sqlite_database.conn.execute("SELECT timestamp FROM actions ORDER BY id")]
+        assert stored == [
+            "2024-05-10T08:30:00.000000+00:00", "2024-05-10T08:00:00.000000+00:00",
+            "2024-05-10T08:45:00.000000+00:00", "2024-05-10T05:00:00.000000+00:00",
+        ]
+        assert [a["action"] for a in sqlite_database.iter_actions()] == ["d", "b", "a", "c"]
+        since = TIMEZONE.localize(datetime(2024, 5, 10, 11, 15))
+        assert [a["action"] for a in sqlite_database.iter_actions(since=since)] == ["a", "c"]
+        assert [a["action"] for a in sqlite_database.iter_actions(until="2024-05-10T08:30:00Z")] == ["d", "b"]
+
+    def test_migration_normalizes_existing_rows(self, sqlite_database):
+        """Тест миграции старых строк, включая строку партиции, которая по UTC относится к прошлому месяцу."""
+        conn = sqlite_database.conn
+        with conn:
+            conn.execute("INSERT INTO actions (user_id, action, timestamp) VALUES (1, 'a', '2024-01-10T12:00:00+03:00')")
+            conn.execute("CREATE TABLE actions_2024_02 AS SELECT * FROM actions WHERE 0")
+            conn.execute("INSERT INTO actions_2024_02 (id, user_id, action, timestamp) VALUES (100, 1, 'b', '2024-02-01T01:00:00+03:00')")
+        assert sqlite_database.normalize_action_timestamps() == 2
+        assert conn.execute("SELECT COUNT(*) FROM actions_2024_02").fetchone()[0] == 0
+        stored = [row[0] for row in conn.execute("SELECT timestamp FROM actions ORDER BY id")]
+        assert stored == ["2024-01-10T09:00:00.000000+00:00", "2024-01-31T22:00:00.000000+00:00"]
+
+
+class TestSQLiteActionPartitions:
+    """Тесты месячных партиций действий и ретеншна."""
+
+    def _fill(self, db, months):
+        for month in months:
+            ts = TIMEZONE.localize(datetime(2024, month, 10, 12, 0)).isoformat()
+            db.save_action(1, "user", "Анна", "card_drawn", {"month": month}, ts)
+
+    def test_rotation_moves_old_months(self, sqlite_database):
+        """Тест переноса прошлых месяцев в actions_YYYY_MM."""
+        self._fill(sqlite_database, [1, 2, 3])
+        moved = sqlite_database.rotate_action_partitions(now=TIMEZONE.localize(datetime(2024, 3, 15)))
+        assert moved == 2
+        assert [t for _, t in sqlite_database._action_partitions()] == ["actions_2024_01", "actions_2024_02"]
+        assert sqlite_database.conn.execute("SELECT COUNT(*) FROM actions").fetchone()[0] == 1
+        # Чтение прозрачно охватывает партиции и горячую таблицу
+        assert [a["details"]["month"] for a in sqlite_database.iter_actions()] == [1, 2, 3]
+        assert [a["details"]["month"] for a in sqlite_database.iter_actions(limit=2)] == [1, 2]
+        since = TIMEZONE.localize(datetime(2024, 2, 1))
+        assert [a["details"]["month"] for a in sqlite_database.iter_actions(since=since)] == [2, 3]
+
+    def test_retention_rolls_up_and_drops(self, sqlite_database):
+        """Тест сворачивания старых партиций в дневные агрегаты."""
+        self._fill(sqlite_database, [1, 1, 2, 3])
+        now = TIMEZONE.localize(datetime(2024, 3, 15))
+        sqlite_database.rotate_action_partitions(now=now)
+        dropped = sqlite_database.apply_action_retention(keep_months=1, now=now)
+        assert dropped == 1
+        assert [t for _, t in sqlite_database._action_partitions()] == ["actions_2024_02"]
+        rollup = sqlite_database.conn.execute("SELECT user_id, day, action, count FROM action_daily_rollups").fetchall()
+        assert [tuple(r) for r in rollup] == [(1, "2024-01-10", "card_drawn", 2)]
+
+    def test_retention_keeps_actions_without_user(self, sqlite_database):
+        """Тест того, что действия без user_id сворачиваются под ROLLUP_UNKNOWN_USER_ID, а не теряются."""
+        from db import ROLLUP_UNKNOWN_USER_ID
+        ts = TIMEZONE.localize(datetime(2024, 1, 10, 12, 0)).isoformat()
+        sqlite_database.save_action(None, None, None, "system", None, ts)
+        now = TIMEZONE.localize(datetime(2024, 3, 15))
+        sqlite_database.rotate_action_partitions(now=now)
+        sqlite_database.apply_action_retention(keep_months=1, now=now)
+        rollup = sqlite_database.conn.execute("SELECT user_id, day, action, count FROM action_daily_rollups").fetchall()
+        assert [tuple(r) for r in rollup] == [(ROLLUP_UNKNOWN_USER_ID, "2024-01-10", "system", 1)]
+
+    def test_action_totals_survive_retention(self, sqlite_database):
+        """Тест того, что итоги для профиля (число, ответы и первый день) не уменьшаются после ретеншна."""
+        self._fill(sqlite_database, [1, 1, 2, 3])
+        ts = TIMEZONE.localize(datetime(2024, 1, 11, 12, 0)).isoformat()
+        # Ответом считается только строка в details["response"], как в build_user_profile до агрегатов
+        sqlite_database.save_action(1, "user", "Анна", "first_grok_response", {"response": "текст"}, ts)
+        sqlite_database.save_action(1, "user", "Анна", "first_grok_response", {"response": 5}, ts)
+        types = ["card_drawn", "first_grok_response"]
+        expected = {"count": 6, "responses": 1, "first_day": datetime(2024, 1, 10).date()}
+        assert sqlite_database.get_action_totals(1, types) == expected
+        now = TIMEZONE.localize(datetime(2024, 3, 15))
+        sqlite_database.rotate_action_partitions(now=now)
+        sqlite_database.apply_action_retention(keep_months=1, now=now)
+        assert sqlite_database.get_action_totals(1, types) == expected
+        assert sqlite_database.get_action_totals(1, ["start"])["count"] == 0
+
+
+class TestSQLiteMigrations:
+    """Тесты версионированных миграций схемы."""
+
+    def test_fresh_database_is_at_latest_version(self, sqlite_database):
+        """Тест того, что новая БД получает все миграции, а повторный запуск ничего не применяет."""
+        assert [m.version for m in MIGRATIONS] == sorted({m.version for m in MIGRATIONS})
+        assert sqlite_database.schema_version() == latest_version(MIGRATIONS)
+        applied = sqlite_database.conn.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0]
+        assert migrate(sqlite_database, MIGRATIONS) == latest_version(MIGRATIONS)
+        assert sqlite_database.conn.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0] == applied
+
+    def test_unversioned_database_is_upgraded(self, temp_db_path):
+        """Тест обновления БД, созданной до версионирования: недостающие столбцы и ужатие details."""
+        conn = sqlite3.connect(temp_db_path)
+        conn.execute("CREATE TABLE users (user_id INTEGER PRIMARY KEY, name TEXT, username TEXT, last_request TEXT, reminder_time TEXT, bonus_available BOOLEAN DEFAULT FALSE)")
+        conn.execute("CREATE TABLE actions (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, username TEXT, name TEXT, action TEXT NOT NULL, details TEXT, timestamp TEXT NOT NULL)")
+        conn.execute("INSERT INTO actions (user_id, action, details, timestamp) VALUES (1, 'card_drawn', ?, '2024-01-01T10:00:00')",
+                     ('{\n  "card_number": 7\n}',))
+        conn.commit()
+        conn.close()
+
+        db = SQLiteDatabase(path=temp_db_path)
+        try:
+            columns = {row["name"] for row in db.conn.execute("PRAGMA table_info(users)")}
+            assert "reminder_time_evening" in columns
+            row = db.conn.execute("SELECT details, card_number FROM actions").fetchone()
+            assert row["details"] == '{"card_number":7}'
+            assert row["card_number"] == 7
+            assert db.schema_version() == latest_version(MIGRATIONS)
+        finally:
+            db.close()
+
+
+class TestSQLiteWriter:
+    """Тесты единственного писателя с групповым коммитом."""
+
+    def test_concurrent_writes_share_commits(self, sqlite_database):
+        """Тест того, что параллельные записи попадают в общие коммиты и все сохраняются."""
+        writer = sqlite_database.writer
+        commits_before = writer.commits
+        barrier = threading.Barrier(8)
+
+        def write(user_id):
+            barrier.wait()
+            for i in range(25):
+                sqlite_database.save_action(user_id, "u", "U", "start", {"i": i}, "2024-05-01T10:00:00+03:00")
+
+        threads = [threading.Thread(target=write, args=(user_id,)) for user_id in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sqlite_database.read_conn.execute("SELECT COUNT(*) FROM actions").fetchone()[0] == 200
+        assert writer.commits - commits_before < 200
+
+    def test_failed_write_does_not_abort_group(self, sqlite_database):
+        """Тест того, что ошибка одной записи откатывает только ее, а остальные в группе коммитятся."""
+        writer = sqlite_database.writer
+
+        def failing(conn):
+            conn.execute("INSERT INTO user_cards (user_id, card_number) VALUES (1, 99)")
+            raise ValueError("boom")
+
+        def insert(conn, card_number):
+            return conn.execute("INSERT INTO user_cards (user_id, card_number) VALUES (1, ?)", (card_number,)).rowcount
+
+        futures = [writer.submit(insert, 1), writer.submit(failing), writer.submit(insert, 2)]
+        assert futures[0].result() == 1
+        with pytest.raises(ValueError):
+            futures[1].result()
+        assert futures[2].result() == 1
+        assert sorted(sqlite_database.get_user_cards(1)) == [1, 2]
+
+    def test_close_flushes_pending_writes(self, temp_db_path):
+        """Тест того, что close дожидается коммита поставленных записей, а после него запись отклоняется."""
+        db = SQLiteDatabase(path=temp_db_path)
+        future = db.writer.submit(lambda conn: conn.execute("INSERT INTO user_cards (user_id, card_number) VALUES (1, 5)"))
+        db.close()
+        assert future.done() and future.exception() is None
+        with pytest.raises(sqlite3.ProgrammingError):
+            db.writer.submit(lambda conn: None)
+
+        db = SQLiteDatabase(path=temp_db_path)
+        try:
+            assert db.get_user_cards(1) == [5]
+        finally:
+            db.close()
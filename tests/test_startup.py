@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты ускоренного старта: замеры шагов (modules/startup.py) и кэш колоды карт.
+"""
+
+import asyncio
+
+import pytest
+
+from modules import card_of_the_day
+from modules.startup import StartupTimer
+
+
+class TestStartupTimer:
+    """Тесты сводки шагов старта."""
+
+    @pytest.mark.asyncio
+    async def test_parallel_and_background_steps(self):
+        """Тест параллельных шагов и фонового шага, ошибка которого не прерывает старт."""
+        async def failing():
+            raise RuntimeError("no network")
+
+        timer = StartupTimer()
+        await asyncio.gather(timer.run("database", asyncio.sleep(0.05)), timer.run("card_deck", asyncio.sleep(0.05)))
+        task = timer.background("set_my_commands", failing())
+        total = timer.ready()
+        await task
+
+        names = [name for name, _ in timer.steps]
+        assert set(names[:2]) == {"database", "card_deck"}
+        assert "set_my_commands" in names
+        # Шаги шли параллельно: общее время меньше суммы
+        assert total < 0.1
+
+
+class TestCardDeck:
+    """Тесты кэша колоды карт."""
+
+    @pytest.mark.asyncio
+    async def test_deck_is_read_once(self, tmp_path, monkeypatch):
+        """Тест того, что каталог читается один раз, а отсутствующая папка не кэшируется."""
+        monkeypatch.setattr(card_of_the_day, "CARDS_DIR", str(tmp_path / "cards"))
+        monkeypatch.setattr(card_of_the_day, "_card_deck", None)
+
+        assert await card_of_the_day.load_card_deck() is None
+
+        (tmp_path / "cards").mkdir()
+        (tmp_path / "cards" / "card_1.jpg").write_bytes(b"")
+        assert await card_of_the_day.load_card_deck() == ["card_1.jpg"]
+
+        (tmp_path / "cards" / "card_2.jpg").write_bytes(b"")
+        assert await card_of_the_day.load_card_deck() == ["card_1.jpg"]
+        assert sorted(await card_of_the_day.load_card_deck(refresh=True)) == ["card_1.jpg", "card_2.jpg"]
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты упорядоченной обработки апдейтов (modules/update_dispatcher.py).
+"""
+
+import asyncio
+import threading
+import pytest
+from unittest.mock import MagicMock
+
+from aiogram.dispatcher.event.bases import UNHANDLED
+
+from modules.update_dispatcher import UserOrderingMiddleware
+
+
+def _data(user_id):
+    return {"event_from_user": MagicMock(id=user_id)}
+
+
+class TestUserOrderingMiddleware:
+    """Тесты UserOrderingMiddleware."""
+
+    @pytest.mark.asyncio
+    async def test_same_user_runs_in_order(self):
+        """Тест последовательной обработки апдейтов одного пользователя."""
+        middleware = UserOrderingMiddleware(max_concurrency=10, max_queue_depth=10)
+        log = []
+
+        async def handler(event, data):
+            log.append(("start", event))
+            await asyncio.sleep(0.01 if event == 1 else 0)
+            log.append(("end", event))
+
+        await asyncio.gather(*(middleware(handler, i, _data(1)) for i in (1, 2, 3)))
+        assert log == [("start", 1), ("end", 1), ("start", 2), ("end", 2), ("start", 3), ("end", 3)]
+
+    @pytest.mark.asyncio
+    async def test_different_users_run_in_parallel(self):
+        """Тест параллельной обработки разных пользователей."""
+        middleware = UserOrderingMiddleware(max_concurrency=10, max_queue_depth=10)
+        running, peak = 0, 0
+
+        async def handler(event, data):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        await asyncio.gather(*(middleware(handler, i, _data(i)) for i in range(5)))
+        assert peak == 5
+
+    @pytest.mark.asyncio
+    async def test_global_concurrency_cap(self):
+        """Тест общего лимита одновременно работающих обработчиков."""
+        middleware = UserOrderingMiddleware(max_concurrency=2, max_queue_depth=10)
+        running, peak = 0, 0
+
+        async def handler(event, data):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        await asyncio.gather(*(middleware(handler, i, _data(i)) for i in range(6)))
+        assert peak == 2
+        assert middleware.stats()["processed"] == 6
+
+    @pytest.mark.asyncio
+    async def test_queue_depth_limit(self):
+        """Тест отбрасывания апдейтов сверх глубины очереди пользователя."""
+        middleware = UserOrderingMiddleware(max_concurrency=10, max_queue_depth=2)
+
+        async def handler(event, data):
+            await asyncio.sleep(0.01)
+            return event
+
+        results = await asyncio.gather(*(middleware(handler, i, _data(1)) for i in range(4)))
+        assert results == [0, 1, UNHANDLED, UNHANDLED]
+        stats = middleware.stats()
+        assert stats["dropped"] == 2
+        assert stats["queued_users"] == 0
+        assert stats["queued_updates"] == 0
+
+    @pytest.mark.asyncio
+    async def test_stats_from_thread_while_processing(self):
+        """Тест чтения stats() из другого потока, пока цикл событий пополняет окно задержек."""
+        middleware = UserOrderingMiddleware(max_concurrency=50, lag_window=100)
+        errors = []
+        stop = threading.Event()
+
+        def reader():
+            while not stop.is_set():
+                try:
+                    middleware.stats()
+                except RuntimeError as e:
+                    errors.append(e)
+
+        async def handler(event, data):
+            await asyncio.sleep(0)
+            return event
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        try:
+            for _ in range(20):
+                await asyncio.gather(*(middleware(handler, i, _data(i)) for i in range(200)))
+        finally:
+            stop.set()
+            thread.join()
+        assert errors == []
+        assert middleware.stats()["processed"] == 4000
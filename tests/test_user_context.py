@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты контекста пользователя в рамках апдейта (modules/user_context.py).
+"""
+
+import pytest
+from unittest.mock import MagicMock
+
+from database.async_db import AsyncDatabase
+from modules.user_context import RequestUserMiddleware, load_user, save_user
+
+
+def _counting(sqlite_db):
+    """Оборачивает get_user/update_user счетчиками вызовов и возвращает асинхронный фасад."""
+    sqlite_db.get_user = MagicMock(wraps=sqlite_db.get_user)
+    sqlite_db.update_user = MagicMock(wraps=sqlite_db.update_user)
+    return AsyncDatabase(sqlite_db)
+
+
+class TestRequestUserMiddleware:
+    """Тесты RequestUserMiddleware."""
+
+    @pytest.mark.asyncio
+    async def test_single_read_and_deferred_write(self, sqlite_database):
+        """Тест одной загрузки пользователя и записи изменений в конце апдейта."""
+        db = _counting(sqlite_database)
+        user = MagicMock(id=1, username="anna", full_name="Анна")
+
+        async def handler(event, data):
+            assert (await load_user(db, 1))["name"] == ""
+            await save_user(db, 1, {"name": "Анна"})
+            # Изменение видно сразу, но в БД еще не записано
+            assert (await load_user(db, 1))["name"] == "Анна"
+            assert db.sync.update_user.call_count == 0
+            return data["request_user"].username
+
+        result = await RequestUserMiddleware()(handler, MagicMock(), {"event_from_user": user, "db": db})
+
+        assert result == "anna"
+        assert db.sync.get_user.call_count == 1
+        assert db.sync.update_user.call_count == 1
+        assert sqlite_database.read_conn.execute("SELECT name FROM users WHERE user_id = 1").fetchone()[0] == "Анна"
+
+    @pytest.mark.asyncio
+    async def test_other_users_bypass_context(self, sqlite_database):
+        """Тест того, что данные других пользователей читаются и пишутся напрямую."""
+        db = _counting(sqlite_database)
+        user = MagicMock(id=1, username="anna", full_name="Анна")
+
+        async def handler(event, data):
+            await save_user(db, 2, {"name": "Борис"})
+            assert db.sync.update_user.call_count == 1
+            assert (await load_user(db, 2))["name"] == "Борис"
+
+        await RequestUserMiddleware()(handler, MagicMock(), {"event_from_user": user, "db": db})
+        # Для пользователя 1 ничего не читалось и не писалось
+        assert db.sync.get_user.call_count == 1
+        assert db.sync.update_user.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_outside_update_goes_to_db(self, sqlite_database):
+        """Тест прямой работы с БД вне апдейта (напоминания, рассылки)."""
+        db = AsyncDatabase(sqlite_database)
+        await save_user(db, 3, {"name": "Вера"})
+        assert (await load_user(db, 3))["name"] == "Вера"
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты веб-сервера вебхука (modules/webhook_server.py).
+"""
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram import Bot, Dispatcher
+
+from modules.webhook_server import build_webhook_app
+
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 1, "type": "private"},
+        "from": {"id": 1, "is_bot": False, "first_name": "Анна"},
+        "text": "/start",
+    },
+}
+
+
+@pytest.fixture
+async def webhook_client():
+    bot = Bot(token="42:TEST")
+    app = build_webhook_app(Dispatcher(), bot, secret_token="s3cret", path="/hook")
+    async with TestClient(TestServer(app)) as client:
+        yield client
+    await bot.session.close()
+
+
+class TestWebhookServer:
+    """Тесты приема апдейтов по вебхуку."""
+
+    @pytest.mark.asyncio
+    async def test_rejects_wrong_secret(self, webhook_client):
+        """Тест отказа без правильного секретного токена."""
+        response = await webhook_client.post("/hook", json=UPDATE, headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+        assert response.status == 401
+
+    @pytest.mark.asyncio
+    async def test_accepts_valid_update(self, webhook_client):
+        """Тест приема апдейта с правильным секретом."""
+        response = await webhook_client.post("/hook", json=UPDATE, headers={"X-Telegram-Bot-Api-Secret-Token": "s3cret"})
+        assert response.status == 200
+
+    @pytest.mark.asyncio
+    async def test_healthz(self, webhook_client):
+        """Тест проверки живости."""
+        response = await webhook_client.get("/healthz")
+        assert response.status == 200